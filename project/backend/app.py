@@ -1,48 +1,191 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash
+import sys
+import hashlib
+import functools
+from flask import Flask, Blueprint, Response, current_app, render_template, request, redirect, url_for, flash, jsonify, make_response, stream_with_context
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
 from queries import *
 from interactions import *
-
-app = Flask(
-    __name__, 
-    template_folder=os.path.join(os.getcwd(), 'project', 'frontend', 'src', 'templates'),
-    static_folder=os.path.join(os.getcwd(), 'project', 'frontend', 'src', 'static')
+from database import db_session, check_leaks, leak_counter
+from cache import SizedLRUCache, all_stats
+from csv_export import EXPORTS, stream_csv, export_filename
+from employee_import import import_employees, text_stream
+from vacation_ledger import vacation_balance
+from async_db import concurrently
+from table_versions import validators, versions
+from evaluation_analytics import RATING_SCALE, BELOW_SCALE, evaluation_summary, training_summary
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.join(BASE_DIR, '..', 'frontend', 'src')
+# Compiled templates are kept on disk, so new workers don't compile them again
+JINJA_CACHE_DIR = os.getenv('JINJA_CACHE_DIR', os.path.join(BASE_DIR, '..', '.jinja_cache'))
+
+# Rendered table bodies of the big listings (see cached_rows), with their next page cursor,
+# by template, filters and versions of the tables read, up to FRAGMENT_CACHE_BYTES of HTML per process
+fragment_cache = SizedLRUCache(
+    'fragments',
+    max_bytes=int(os.getenv('FRAGMENT_CACHE_BYTES', 64 * 1024 * 1024)),
+    sizeof=lambda fragment: sys.getsizeof(fragment[0]),
 )
-app.secret_key = 'magickey'
+
+# All the routes of the system; registered on the app by create_app()
+hr = Blueprint('hr', __name__)
+
+
+def create_app():
+    """Create and configure the Flask app. It doesn't connect to the database (see schema.py for the setup)."""
+    app = Flask(
+        __name__,
+        template_folder=os.path.join(FRONTEND_DIR, 'templates'),
+        static_folder=os.path.join(FRONTEND_DIR, 'static')
+    )
+    app.secret_key = 'magickey'
+    # Report sessions/connections still checked out after each request (always on in debug mode)
+    app.config['DB_LEAK_CHECK'] = os.getenv('DB_LEAK_CHECK', '0') == '1'
+
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+    app.teardown_appcontext(remove_session)
+    app.register_blueprint(hr)
+
+    @app.cli.command('precompile-templates')
+    def precompile_templates_command():
+        """Compile every template into the bytecode cache."""
+        print(f"Compiled {precompile_templates(app)} templates into {JINJA_CACHE_DIR}")
+
+    return app
+
+
+def precompile_templates(app):
+    """Load every template once, which writes its bytecode to the cache. Returns the number of templates."""
+    templates = app.jinja_env.list_templates(extensions=['html'])
+    for name in templates:
+        app.jinja_env.get_template(name)
+    return len(templates)
+
+
+def remove_session(exception=None):
+    """Close the request's session so its connection goes back to the pool."""
+    db_session.remove()
+    if current_app.debug or current_app.config['DB_LEAK_CHECK']:
+        sessions, connections = check_leaks()
+        if sessions or connections:
+            current_app.logger.warning(f'Request ended with {sessions} open session(s) and {connections} checked out connection(s)')
+
+
+@hr.route('/debug/db_leaks')
+def db_leaks():
+    """Show the leak counters (debug mode only)."""
+    if not current_app.debug:
+        return "Not found", 404
+    return leak_counter
+
+
+@hr.route('/cache_stats')
+def cache_stats():
+    """Hit and miss counters of the in-process caches."""
+    return all_stats()
+
+
+def page_args(prefix=''):
+    """Read the sort and pagination parameters of a listing page (prefix tells apart two listings on one page)."""
+    return {
+        'sort': request.args.get(f'{prefix}sort'),
+        'descending': request.args.get(f'{prefix}order') == 'desc',
+        'cursor': request.args.get(f'{prefix}cursor'),
+        'page_size': request.args.get('page_size', type=int),
+    }
+
+
+def versioned(*tables):
+    """
+    Serve a page with an ETag and Last-Modified from the versions of the tables it reads (see table_versions.py),
+    and answer 304 Not Modified, without running the view, when the browser already has the current page.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag, last_modified = validators(db_session(), tables, request.full_path)
+            if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response(view(*args, **kwargs))
+            else:
+                response = Response(status=304)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True  # Revalidate every time: the tables can change any moment
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_rows(template, tables, filters, load):
+    """
+    Rows of a listing rendered with template, and its next cursor: load() returns (rows, next_cursor).
+    A repeated view with the same filters takes both from fragment_cache, without querying or rendering;
+    the key holds the versions of the tables the rows are read from, so a write to any of them makes a new key.
+    """
+    session = db_session()
+    key = (template, tuple(sorted(filters.items())), versions(session, tables))
+    fragment = fragment_cache.get(key)
+    if fragment is fragment_cache.MISSING:
+        rows, next_cursor = load()
+        fragment = Markup(render_template(template, rows=rows)), next_cursor
+        # An empty page is cheap to render again, and may come from a query that failed
+        if rows:
+            fragment_cache.put(key, fragment)
+    return fragment
 
 
 # Route for menu page (homepage)
-@app.route('/')
+@hr.route('/')
 def homepage():
     job_position_id = request.args.get('job_position', type=int)
     department_id = request.args.get('department', type=int)
     status = request.args.get('status', 1) # Default status is 1 (active)
 
-    # Get filtered employees
-    employees = get_filtered_employees(session, job_position_id, department_id, status)
-    
+    session = db_session()
+
+    # Get filtered employees (rendered rows)
+    filters = {'job_position_id': job_position_id, 'department_id': department_id, 'status': status, **page_args()}
+    employees, next_cursor = cached_rows('employee_rows.html', [Employee, EmployeePosition, JobPosition, Department], filters,
+                                         lambda: get_filtered_employees(session, **filters))
+
     # Fetch job positions and departments for dropdown lists
     job_positions = get_job_positions(session)
     departments = get_departments(session)
 
-    return render_template('index.html', employees=employees, job_positions=job_positions, departments=departments)
+    return render_template('index.html', employees=employees, job_positions=job_positions, departments=departments,
+                           next_cursor=next_cursor, sorts=EMPLOYEE_SORTS, expiry_summary=contract_expiry_summary(session))
 
 
 # Route for employee profile with integrated search
-@app.route('/employee')
+@hr.route('/employee')
 def user():
     search_query = request.args.get('search_query')
+    session = db_session()
     
     # Perform the search if there is a search parameter
     if search_query:
-        employee = search_employee_by_name_or_rut(search_query, session)
+        page = request.args.get('page', 1, type=int)
+        results, has_more, truncated = search_employees(session, search_query, page)
         
-        # Redirect to profile if an employee is found
-        if employee:
-            return redirect(url_for('user', id=employee.id))  # Change here to ensure redirection with ?id
+        # Redirect to profile if only one employee is found
+        if len(results) == 1 and page == 1 and not truncated:
+            return redirect(url_for('.user', id=results[0]['id']))  # Change here to ensure redirection with ?id
 
         # Show error message if the employee is not found
-        return render_template('index.html', error_message="Employee not found")
+        if not results:
+            if truncated:  # Only the first matches of the search were looked at
+                return render_template('index.html', error_message="Too many employees match, type more of the name or RUT")
+            return render_template('index.html', error_message="Employee not found")
+
+        # Several matches: show them, best first
+        return render_template('search_results.html', results=results, search_query=search_query, page=page,
+                               has_more=has_more, truncated=truncated)
     
     # Get the employee ID if there is no search parameter
     employee_id = request.args.get('id')
@@ -51,29 +194,25 @@ def user():
         # Show message if no employee_id is provided
         return render_template('employee.html', error_message="No employee ID provided")
 
-    # Get employee information
-    gi = general_info(session, employee_id)
-    ad_info = aditional_info(session, employee_id)
+    # Get employee information, current contract included (one query, cached per employee),
+    # with the job positions and departments (at the same time in async mode, see async_db.py)
+    profile, job_positions, departments = concurrently(
+        lambda session: employee_profile(session, employee_id),
+        get_job_positions,
+        get_departments,
+    )
 
     # Check if general information is missing
-    if not gi:
+    if not profile:
         return render_template('employee.html', error_message="Employee not found")
 
-    # Get the current contract
-    contract = get_contract_info(session, employee_id)
-    
-    # Order the data to be passed to the template
-    contract_data = {
-        'contract_type': contract.contract_type,
-        'start_date': contract.start_date,
-        'end_date': contract.end_date,
-        'classification': contract.classification,
-        'position': contract.name, # it's actually not the name of the contract, but the name of the JobPosition
-        'registration_date': contract.registration_date
-    } if contract else None
-
     # Employee data
-    first_name, last_name, email, phone, rut, position, status = gi
+    ad_info = profile
+    contract_data = profile['contract']
+    first_name, last_name, email, phone, rut, position, status = (
+        profile['first_name'], profile['last_name'], profile['email'], profile['phone'],
+        profile['rut'], profile['position'], profile['status']
+    )
 
     # Change employee status to "Active" or "Inactive"
     if status == 0:
@@ -85,17 +224,11 @@ def user():
 
     # Show missing information
     missing_info = []
-    if not ad_info:
-        missing_info.append("No additional info available")
     if not ad_info.get('net_amount'):
         missing_info.append("No net amount registered")
     if ad_info.get('health_plan') == "No health plan registered":
         missing_info.append("No health plan registered")
 
-    # Get job positions and departments
-    job_positions = get_job_positions(session)
-    departments = get_departments(session)
-
     # Pass the data to the template, including the current contract and job_positions and departments
     return render_template(
         'employee.html',
@@ -123,7 +256,7 @@ def user():
     )
 
 
-@app.route('/add_employee', methods=['GET', 'POST'])
+@hr.route('/add_employee', methods=['GET', 'POST'])
 def add_employee():
     if request.method == 'POST':
         # Collect form data
@@ -142,23 +275,37 @@ def add_employee():
         }
 
         # Call the function to add the employee
+        session = db_session()
         result = add_employee_to_db(session, employee_data)
         flash(result)
-        return redirect(url_for('homepage'))
+        return redirect(url_for('.homepage'))
     
+    session = db_session()
     afps = all_afps(session)
 
     healthplans = all_health_plans(session)
     
     return render_template('add_employee.html', afps=afps, healthplans=healthplans)
 
-    # Get job positions to display in the form
-    job_positions = get_job_positions(session)
-    return render_template('add_employee.html', job_positions=job_positions)
-
-@app.route("/edit_employee", methods=['GET', 'POST'])
+@hr.route('/import_employees', methods=['GET', 'POST'])
+def import_employees_page():
+    """Bulk import from a CSV upload. Answers with the per-row error report (as JSON if the client asks for it)."""
+    report = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash("Select a CSV file to import")
+            return redirect(url_for('.import_employees_page'))
+        # The upload is read as a stream, a chunk of rows at a time
+        report = import_employees(db_session(), text_stream(upload.stream), dry_run='dry_run' in request.form)
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(report)
+    return render_template('import_employees.html', report=report)
+
+@hr.route("/edit_employee", methods=['GET', 'POST'])
 def edit_employee():
     employee_id = request.args.get('id')
+    session = db_session()
     
     if request.method == 'POST':
         data = {
@@ -172,7 +319,7 @@ def edit_employee():
         # make query to update the values
         print("this should be the employee id", data['employee_id'])
         update_employee(session, data)
-        return redirect(url_for('homepage'))
+        return redirect(url_for('.homepage'))
     
     gi = general_info(session, employee_id)
     labels = ['First Name', 'Last Name', 'Email', 'Phone', 'RUT', 'Position', 'Status']
@@ -188,17 +335,17 @@ def edit_employee():
         print(key, value)
     return render_template('edit_employee.html', gi_data=gi_data, ad_info_data=ad_info, employee_id=employee_id)
 
-@app.route('/disable_employee/<int:employee_id>')
+@hr.route('/disable_employee/<int:employee_id>')
 def disable_employee(employee_id):
     # Logic to load the information of the contract to be deleted
-    employee = Employee.query.get(employee_id)
+    employee = db_session.get(Employee, employee_id)
     return render_template('disable_employee.html', employee=employee)
 
 
-@app.route('/confirm_disable_employee/<int:employee_id>', methods=['POST'])
+@hr.route('/confirm_disable_employee/<int:employee_id>', methods=['POST'])
 def confirm_disable_employee(employee_id):
     # Get the contract using the custom query function
-    contract_deactivated = deactivate_employee(session, employee_id)
+    contract_deactivated = deactivate_employee(db_session(), employee_id)
 
     # Show success or error message
     if contract_deactivated:
@@ -206,24 +353,24 @@ def confirm_disable_employee(employee_id):
     else:
         flash('Error: Contract could not be deactivated', 'danger')
 
-    return redirect(url_for('user', id=employee_id))
+    return redirect(url_for('.user', id=employee_id))
 
 # MENU PAGES ------------------------------------------------------------------------------------------------|
 
-@app.route('/afps')
+@hr.route('/afps')
+@versioned(AFP)
 def show_afps():
-    with Session() as session:
-        afps = all_afps(session)
+    afps = all_afps(db_session())
     return render_template('afps.html', afps=afps)
 
 
-@app.route('/companies')
+@hr.route('/companies')
+@versioned(Company)
 def show_companies():
-    with Session() as session:
-        companies = all_companies(session)
-    return render_template('companies.html', companies=companies)
+    companies, next_cursor = all_companies(db_session(), **page_args())
+    return render_template('companies.html', companies=companies, next_cursor=next_cursor, sorts=COMPANY_SORTS)
 
-@app.route('/add_company', methods=['GET', 'POST']) 
+@hr.route('/add_company', methods=['GET', 'POST']) 
 def add_company():
     if request.method == 'POST':
         # Gather form data
@@ -236,11 +383,12 @@ def add_company():
         }
 
         # Call the function to add the company
-        result = add_company_to_db(session, company_data)
+        result = add_company_to_db(db_session(), company_data)
         flash(result)
-        return redirect(url_for('show_companies'))  # Redirect to homepage or appropriate view
+        return redirect(url_for('.show_companies'))  # Redirect to homepage or appropriate view
 
     # Fetch job positions and departments for the form (if needed)
+    session = db_session()
     job_positions = get_job_positions(session)
     departments = get_departments(session)
 
@@ -249,9 +397,10 @@ def add_company():
 
 
 
-@app.route('/health_plans')
+@hr.route('/health_plans')
+@versioned(HealthPlan, Fonasa, Isapre)
 def health_plans():
-    session = Session()
+    session = db_session()
 
     # Get all health plans with their discounts
     health_plans = all_health_plans(session)
@@ -261,47 +410,73 @@ def health_plans():
 
 # TOPBAR PAGES ------------------------------------------------------------------------------------------------|
 
-@app.route('/remuneration')
+@hr.route('/remuneration')
 def remunerations_page():
-    session = Session()
-    remuneration = all_remunerations(session)
-    session.close()
-    return render_template('remunerations.html', remunerations=remuneration)
+    filters = page_args()
+    remuneration, next_cursor = cached_rows('remuneration_rows.html', [Remuneration, Employee, AFP, HealthPlan], filters,
+                                            lambda: all_remunerations(db_session(), **filters))
+    return render_template('remunerations.html', remunerations=remuneration, next_cursor=next_cursor, sorts=REMUNERATION_SORTS)
 
-@app.route('/add_remuneration', methods=['GET', 'POST'])
+@hr.route('/add_remuneration', methods=['GET', 'POST'])
 def add_remuneration_page():
+    session = db_session()
     if request.method == 'POST':
-        with Session() as session:
-            remuneration_data = {
-                'employee_id': get_employee_id_by_rut(session,request.form['employee_rut']),
-                'afp_id': request.form['afp_id'],
-                'healthplan_id': request.form['healthplan_id'],
-                'gross_amount': request.form['gross_amount'],
-                'tax': request.form['tax'],
-                'welfare_contribution': request.form['welfare_contribution'],
-            }
-            result = add_remuneration(session, remuneration_data)
-            flash(result)
+        remuneration_data = {
+            'employee_id': get_employee_id_by_rut(session,request.form['employee_rut']),
+            'afp_id': request.form['afp_id'],
+            'healthplan_id': request.form['healthplan_id'],
+            'gross_amount': request.form['gross_amount'],
+            'tax': request.form['tax'],
+            'welfare_contribution': request.form['welfare_contribution'],
+        }
+        result = add_remuneration(session, remuneration_data)
+        flash(result)
 
-    
-    session = Session()
-    afps = session.query(AFP).all()
-    healthplans = session.query(HealthPlan).all()
+    afps = all_afps(session)
+    healthplans = all_health_plans(session)
     
     return render_template('add_remuneration.html', afps=afps, healthplans=healthplans)
 
-@app.route('/contracts')
+@hr.route('/contracts')
+@versioned(Contract, Employee, EmployeePosition, JobPosition)
 def show_contracts():
-    with Session() as session:
-        contracts = all_contracts(session)
-    return render_template('contracts.html', contracts=contracts)
+    filters = page_args()
+    contracts, next_cursor = cached_rows('contract_rows.html', [Contract, Employee, EmployeePosition, JobPosition], filters,
+                                         lambda: all_contracts(db_session(), **filters))
+    return render_template('contracts.html', contracts=contracts, next_cursor=next_cursor, sorts=CONTRACT_SORTS)
 
 # Route for the option of adding a new "Contract"
-@app.route('/add_contract', methods=['GET', 'POST'])
+@hr.route('/employee/<int:employee_id>/contracts')
+def employee_contract_history(employee_id):
+    """Every contract of an employee as JSON, latest first, the current one with "current": true."""
+    contracts = contract_history(db_session(), employee_id)
+    for contract in contracts:
+        for key in ('start_date', 'end_date', 'registration_date'):
+            contract[key] = contract[key].isoformat() if contract[key] else None
+    return jsonify(contracts)
+
+@hr.route('/expiring_contracts')
+def show_expiring_contracts():
+    """Current contracts ending within ?days= (30, 60 or 90), by department."""
+    horizon = request.args.get('days', EXPIRY_HORIZONS[0], type=int)
+    if horizon not in EXPIRY_HORIZONS:
+        horizon = EXPIRY_HORIZONS[0]
+    departments = expiring_contracts(db_session(), horizon)
+    return render_template('expiring_contracts.html', departments=departments, horizon=horizon, horizons=EXPIRY_HORIZONS)
+
+@hr.route('/dashboard')
+def dashboard():
+    """Headcount, salaries and payroll cost by department and position, from the rollups (?period=YYYY-MM)."""
+    try:
+        period = date.fromisoformat(request.args['period'] + '-01') if request.args.get('period') else None
+    except ValueError:
+        period = None
+    return render_template('dashboard.html', dashboard=department_dashboard(db_session(), period))
+
+@hr.route('/add_contract', methods=['GET', 'POST'])
 def add_contract_page():
+    session = db_session()
     if request.method == 'POST':
-        session = Session()
-
         contract_data = {
             'employee_id': get_employee_id_by_rut(session, request.form.get('employee_rut')),  
             'contract_type': request.form.get('contract_type'),
@@ -318,24 +493,21 @@ def add_contract_page():
         
         if missing_fields:
             flash(f"Error: Missing fields: {', '.join(missing_fields)}", 'danger')
-            return redirect(url_for('add_contract_page'))
+            return redirect(url_for('.add_contract_page'))
 
         # Try to add the contract
         try:
             message = add_contract(session, contract_data)
             flash(message, 'success')
-            return redirect(url_for('show_contracts'))  # Redirect to contracts page
+            return redirect(url_for('.show_contracts'))  # Redirect to contracts page
         except Exception as e:
             session.rollback()
             flash(f"Error adding contract: {e}", 'danger')
-        finally:
-            session.close()
     
     # Prepare data for the form
-    with Session() as session:
-        employees = session.query(Employee).all()
-        job_positions = get_job_positions(session)
-        departments = get_departments(session)
+    employees = session.query(Employee).all()
+    job_positions = get_job_positions(session)
+    departments = get_departments(session)
     return render_template(
         'add_contract.html', 
         employees=employees,
@@ -344,55 +516,102 @@ def add_contract_page():
     )
 
 
-@app.route('/vacations')
+@hr.route('/vacations')
+@versioned(Vacation, Employee)
 def show_vacations():
-    with Session() as session:
-        vacations = all_vacations(session)
-    return render_template('vacations.html', vacations=vacations)
+    vacations, next_cursor = all_vacations(db_session(), **page_args())
+    return render_template('vacations.html', vacations=vacations, next_cursor=next_cursor, sorts=VACATION_SORTS)
 
 
 # Route for adding vacation (no database interaction)
-@app.route('/add_vacation', methods=['GET', 'POST'])
+@hr.route('/add_vacation', methods=['GET', 'POST'])
 def add_vacation():
-    with Session() as session:
-        if request.method == 'POST':
-            
-            # Get form data
-            vacation_data = {
-                'employee_id': get_employee_id_by_rut(session, request.form.get('employee_rut')),
-                'start_date': request.form['start_date'],
-                'end_date': request.form['end_date'],
-                'days_taken': int(request.form['days_taken']),  # Convert to int
-                'accumulated_days': int(request.form['accumulated_days']),  # Convert to int
-                'long_service_employee': request.form.get('long_service_employee', False)
-            }
-
-
-            # Convert checkbox value to boolean
-            vacation_data['long_service_employee'] = vacation_data['long_service_employee'] == "on"
-
-            # Call the query function
-            message = add_vacation_to_db(session, vacation_data)
-
-            # Provide feedback to the user
-            flash(message)
-            return redirect(url_for('show_vacations'))
+    if request.method == 'POST':
+        session = db_session()
+        
+        # Get form data
+        vacation_data = {
+            'employee_id': get_employee_id_by_rut(session, request.form.get('employee_rut')),
+            'start_date': request.form['start_date'],
+            'end_date': request.form['end_date'],
+            'days_taken': int(request.form['days_taken']),  # Convert to int
+            'long_service_employee': request.form.get('long_service_employee', False)
+        }
+
+
+        # Convert checkbox value to boolean
+        vacation_data['long_service_employee'] = vacation_data['long_service_employee'] == "on"
+
+        # Call the query function (the available days come from the employee's vacation balance)
+        success, message = add_vacation_to_db(session, vacation_data)
+
+        # Provide feedback to the user
+        flash(message)
+        return redirect(url_for('.show_vacations'))
 
     return render_template('add_vacation.html')
 
 
 
-@app.route('/train_eval')
+@hr.route('/whos_out')
+def whos_out():
+    """Employees on vacation between two dates, as JSON: /whos_out?from=2025-01-01&to=2025-01-31[&department=ID]"""
+    try:
+        start_date = date.fromisoformat(request.args.get('from', ''))
+        end_date = date.fromisoformat(request.args.get('to') or request.args.get('from', ''))
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD dates'}), 400
+    if start_date > end_date or (end_date - start_date).days >= MAX_WHOS_OUT_DAYS:
+        return jsonify({'error': f'from must be before to, and the range at most {MAX_WHOS_OUT_DAYS} days'}), 400
+    vacations = employees_on_vacation(db_session(), start_date, end_date, request.args.get('department', type=int))
+    for vacation in vacations:
+        vacation['start_date'] = vacation['start_date'].isoformat()
+        vacation['end_date'] = vacation['end_date'].isoformat()
+    return jsonify(vacations)
+
+
+@hr.route('/vacation_balance/<string:employee_rut>')
+def get_vacation_balance(employee_rut):
+    """Current vacation balance of an employee, as JSON: {"balance": days, "accrued_through": date, "pending": days}"""
+    session = db_session()
+    balance = vacation_balance(session, get_employee_id_by_rut(session, employee_rut))
+    if balance is None:
+        return jsonify({'error': 'Employee not found'}), 404
+    balance['accrued_through'] = balance['accrued_through'].isoformat() if balance['accrued_through'] else None
+    return jsonify(balance)
+
+
+@hr.route('/train_eval')
 def eval_train():
-    with Session() as session:
-        evaluations = get_all_evaluations(session)
-        trainings = get_all_trainings(session)
-    return render_template('train_eval.html', evaluations=evaluations, trainings=trainings)
+    eval_args, train_args = page_args('eval_'), page_args('train_')
+    # Two independent listings: at the same time in async mode (see async_db.py)
+    (evaluations, next_eval_cursor), (trainings, next_train_cursor) = concurrently(
+        lambda session: get_all_evaluations(session, **eval_args),
+        lambda session: get_all_trainings(session, **train_args),
+    )
+    return render_template('train_eval.html', evaluations=evaluations, trainings=trainings,
+                           next_eval_cursor=next_eval_cursor, next_train_cursor=next_train_cursor,
+                           eval_sorts=EVALUATION_SORTS, train_sorts=TRAINING_SORTS)
+
+@hr.route('/train_eval/analytics')
+def train_eval_analytics():
+    """Grade and score statistics, as JSON: /train_eval/analytics[?from=2025-01-01&to=2025-12-31&department=ID]"""
+    try:
+        start_date = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end_date = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'from and to must be YYYY-MM-DD dates'}), 400
+    session = db_session()
+    department_id = request.args.get('department', type=int)
+    return jsonify({
+        'evaluations': evaluation_summary(session, start_date, end_date, department_id),
+        'trainings': training_summary(session, start_date, end_date, department_id),
+    })
 
-@app.route('/add_evaluation', methods=['GET', 'POST'])
+@hr.route('/add_evaluation', methods=['GET', 'POST'])
 def handle_add_evaluation():
     if request.method == 'POST':
-        session = Session()
+        session = db_session()
         evaluation_data = {
             'employee_id': get_employee_id_by_rut(session, request.form.get('employee_rut')),
             'evaluation_date': request.form['evaluation_date'],
@@ -401,18 +620,19 @@ def handle_add_evaluation():
             'rating': request.form['rating'],
             'comments': request.form['comments']
         }
-        session = Session()
         result = add_evaluation(session, evaluation_data)
         flash(result)
 
-        return redirect(url_for('eval_train'))
+        return redirect(url_for('.eval_train'))
     
-    return render_template('add_eval.html')
+    # The form shows the rating of the grade typed, on the same scale add_evaluation stores
+    rating_scale = {'scale': [[float(grade), rating] for grade, rating in RATING_SCALE], 'below': BELOW_SCALE}
+    return render_template('add_eval.html', rating_scale=rating_scale)
 
-@app.route('/add_training', methods=['GET', 'POST'])
+@hr.route('/add_training', methods=['GET', 'POST'])
 def handle_add_training():
     if request.method == 'POST':
-        session = Session()
+        session = db_session()
         training_data = {
             'employee_id': get_employee_id_by_rut(session, request.form.get('employee_rut')),
             'training_date': request.form['training_date'],
@@ -421,21 +641,55 @@ def handle_add_training():
             'institution': request.form['institution'],
             'comments': request.form['comments']
         }
-        session = Session()
         result = add_training(session, training_data)
         flash(result)
 
-        return redirect(url_for('eval_train'))
+        return redirect(url_for('.eval_train'))
     
     return render_template('add_train.html')
 
-@app.route('/get_employee_name/<string:employee_rut>', methods=['GET'])  # Changed to <string:employee_rut>
+@hr.route('/export/<string:name>.csv')
+def export_csv(name):
+    """Whole listing (remunerations, contracts, vacations, evaluations or trainings) as CSV, streamed as it is read."""
+    if name not in EXPORTS:
+        return "Unknown export", 404
+    args = page_args()
+    # stream_with_context keeps the request (and its session) open until the last row is sent
+    rows = stream_with_context(stream_csv(db_session(), name, args['sort'], args['descending']))
+    return Response(rows, mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename={export_filename(name)}',
+    })
+
+
+# Most RUTs resolved by one /get_employee_names request
+MAX_BATCH_RUTS = 200
+
+
+def conditional_response(response):
+    """Tag a lookup response with an ETag of its body, and answer 304 if the browser already has it."""
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    return response.make_conditional(request)
+
+
+@hr.route('/get_employee_name/<string:employee_rut>', methods=['GET'])  # Changed to <string:employee_rut>
 def get_employee_name(employee_rut):
-    employee_name = get_employee_name_by_rut(employee_rut)  # Call the new function
+    employee_name = get_employee_name_by_rut(db_session(), employee_rut)
     if employee_name:
-        return employee_name  # Return the name as plain text
+        return conditional_response(make_response(employee_name))  # Return the name as plain text
     else:
         return "Does not exist", 404
 
+
+@hr.route('/get_employee_names', methods=['GET'])
+def get_employee_names():
+    """Resolve many RUTs in one request: /get_employee_names?rut=1-9&rut=2-7 -> {"1-9": "Name", "2-7": null}"""
+    ruts = [rut for rut in request.args.getlist('rut') if rut]
+    if len(ruts) > MAX_BATCH_RUTS:
+        return jsonify({'error': f'At most {MAX_BATCH_RUTS} RUTs per request'}), 400
+    return conditional_response(jsonify(get_employee_names_by_ruts(db_session(), ruts)))
+
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
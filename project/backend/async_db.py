@@ -0,0 +1,104 @@
+import os
+import asyncio
+import threading
+from sqlalchemy.engine import make_url
+from database import database_url, engine_options, db_session
+
+# Optional async mode (ASYNC_DB=1): the independent queries of a page run at the same time.
+# The async engine (SQLAlchemy's asyncio extension, over aiomysql for MySQL or aiosqlite for SQLite)
+# lives on one event loop in a background thread, shared by every request thread of the process, so
+# its connection pool is shared too (async connections can't move between event loops).
+# A route hands concurrently() the query functions of queries.py it needs; each one runs in its own
+# AsyncSession through run_sync, so the same functions serve both modes. The request's thread waits
+# for the slowest query instead of the sum of them all.
+# Without ASYNC_DB=1 (or without the async driver installed) nothing here is started, and
+# concurrently() runs the functions one after the other on the request's session.
+#
+#   ASYNC_DB=1 DATABASE_URL=sqlite:///hr.db python app.py
+
+ASYNC_DB = os.getenv('ASYNC_DB', '0') == '1'
+ASYNC_DB_TIMEOUT = float(os.getenv('ASYNC_DB_TIMEOUT', 30))  # Seconds a request waits for its queries
+
+# Sync driver -> async driver of the same database
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(url=database_url):
+    """URL of the async driver for a database URL: mysql+pymysql://... -> mysql+aiomysql://..."""
+    url = make_url(url)
+    if url.drivername not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for {url.drivername}")
+    return url.set(drivername=ASYNC_DRIVERS[url.drivername])
+
+
+class AsyncDatabase:
+    """The async engine and the event loop thread it runs on, started on first use."""
+
+    def __init__(self, url=database_url):
+        self.url = url
+        self.loop = None
+        self.engine = None
+        self.sessions = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            # Imported here, so the sync mode doesn't need the async drivers
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+            self.engine = create_async_engine(async_url(self.url), **engine_options(self.url))
+            self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='async-db', daemon=True).start()
+            self.loop = loop
+
+    async def call(self, function):
+        async with self.sessions() as session:
+            return await session.run_sync(function)
+
+    async def gather(self, functions):
+        return await asyncio.gather(*[self.call(function) for function in functions])
+
+    def run(self, *functions, timeout=ASYNC_DB_TIMEOUT):
+        """Run functions f(session) at the same time, each in its own session. Returns their results, in order."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.gather(functions), self.loop).result(timeout)
+
+    def dispose(self):
+        """Close the pool's connections and stop the loop (e.g. in a process forked from one that used it)."""
+        with self.lock:
+            if self.loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.engine.dispose(), self.loop).result(ASYNC_DB_TIMEOUT)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = self.engine = self.sessions = None
+
+    def after_fork(self):
+        """
+        Forget the parent's engine in a forked process, without closing its connections (they belong to the
+        parent) and without waiting for its loop (its thread isn't copied by fork). It starts again on first use.
+        """
+        self.lock = threading.Lock()
+        self.loop = self.engine = self.sessions = None
+
+
+async_database = AsyncDatabase()
+
+
+def concurrently(*functions):
+    """
+    Run independent query functions f(session) and return their results, in order: at the same time
+    on the async engine with ASYNC_DB=1, one after the other on the request's session otherwise.
+    The functions run outside the request (no `request`), so they must only use their arguments,
+    and must return plain values (dicts, lists, rows), never ORM objects of their session.
+    """
+    if ASYNC_DB:
+        return async_database.run(*functions)
+    session = db_session()
+    return [function(session) for function in functions]
@@ -0,0 +1,165 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+# In-process caches. Every cache registers itself in `caches`, so their hit/miss counters
+# can be shown together (see /cache_stats in app.py).
+# Each worker process has its own copy: invalidation is immediate in the process that made
+# the change, and the TTL bounds how stale the other processes can be.
+
+caches = {}
+
+# Returned by peek() for keys that aren't cached (None is a valid cached value)
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Cache whose entries expire `ttl` seconds after being loaded.
+    With max_entries, the least recently used entry is evicted when the cache is full.
+    """
+
+    def __init__(self, name, ttl, max_entries=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires_at, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0  # Bumped by invalidate(), so a load that raced with it isn't stored
+        self.lock = threading.Lock()
+        caches[name] = self
+
+    MISSING = MISSING
+
+    def peek(self, key):
+        """Return the cached value of key, or MISSING. A miss isn't counted: get_or_load() will count it."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry[1]
+        return MISSING
+
+    def get_or_load(self, key, loader):
+        """Return the cached value of key, calling loader() to get it when missing or expired."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return entry[1]
+            self.misses += 1
+            generation = self.generation
+        # Loaded outside the lock so a slow query doesn't block the other threads
+        value = loader()
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = (now + self.ttl, value)
+                self.entries.move_to_end(key)
+                if self.max_entries and len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def invalidate(self, *keys):
+        """Drop the given keys, or every entry if no key is given."""
+        with self.lock:
+            self.generation += 1
+            if not keys:
+                self.entries.clear()
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+            }
+
+
+class SizedLRUCache:
+    """
+    Cache bounded by the total size of its values in bytes (sizeof(value)): the least recently used
+    entries are evicted to make room for new ones. Entries never expire, so the key of a value must
+    change whenever the value would (e.g. include the versions of the tables it was made from).
+    """
+
+    def __init__(self, name, max_bytes, sizeof=sys.getsizeof):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()  # key -> (size, value), least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        caches[name] = self
+
+    MISSING = MISSING
+
+    def get(self, key):
+        """Return the cached value of key, or MISSING."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entries beyond max_bytes. Values larger than that aren't stored."""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous:
+                self.bytes -= previous[0]
+            self.entries[key] = (size, value)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        """Drop the given keys, or every entry if no key is given."""
+        with self.lock:
+            if not keys:
+                self.entries.clear()
+                self.bytes = 0
+            for key in keys:
+                entry = self.entries.pop(key, None)
+                if entry:
+                    self.bytes -= entry[0]
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+            }
+
+
+def all_stats():
+    """Counters of every cache, by name."""
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -0,0 +1,73 @@
+import argparse
+from datetime import date, datetime
+from sqlalchemy import insert, select
+from tables import *
+from queries import EXPIRY_HORIZONS, expiring_contracts
+from table_versions import bump
+
+# Scan for expiring contracts, meant to run once a day (cron, a systemd timer...), e.g.:
+#   15 6 * * *  cd /path/to/project/backend && python contract_expiry.py scan
+# Each current contract ending within the longest of EXPIRY_HORIZONS gets a notification for the
+# shortest horizon it is in (90, then 60, then 30 days as the end date gets closer). A scan only
+# inserts the notifications it hasn't written before, so running it again the same day adds nothing.
+# The homepage shows the counts (contract_expiry_summary in queries.py).
+#
+# Usage (from project/backend/):
+#   python contract_expiry.py scan [--as-of 2025-01-31]
+#   python contract_expiry.py list [--days 30]   -> expiring contracts by department
+
+
+def horizon_of(days_left):
+    """Shortest horizon that includes a contract ending in days_left days."""
+    return next(horizon for horizon in EXPIRY_HORIZONS if days_left <= horizon)
+
+
+def scan(session, as_of=None):
+    """Write the notifications of the contracts expiring within the longest horizon. Returns the number written."""
+    as_of = as_of or date.today()
+    notifications = {}
+    for department in expiring_contracts(session, EXPIRY_HORIZONS[-1], as_of):
+        for contract in department['contracts']:
+            key = (contract['id'], horizon_of(contract['days_left']))
+            # An employee with positions in two departments is notified once, for the first one
+            notifications.setdefault(key, {
+                'contract_id': contract['id'],
+                'employee_id': contract['employee_id'],
+                'department_id': department['department_id'],
+                'end_date': contract['end_date'],
+                'horizon': key[1],
+                'created_at': datetime.now(),
+            })
+    new = []
+    if notifications:
+        contract_ids = {contract_id for contract_id, _ in notifications}
+        existing = set(session.execute(
+            select(ContractExpiryNotification.contract_id, ContractExpiryNotification.horizon)
+            .where(ContractExpiryNotification.contract_id.in_(contract_ids))
+        ).all())
+        new = [notification for key, notification in notifications.items() if key not in existing]
+    if new:
+        session.execute(insert(ContractExpiryNotification), new)
+        bump(session, ContractExpiryNotification)
+    session.commit()
+    return len(new)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Expiring contracts.')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    run = subcommands.add_parser('scan', help='Write the notifications of the contracts about to expire')
+    run.add_argument('--as-of', type=date.fromisoformat, help='Scan as of this date (YYYY-MM-DD), today by default')
+    show = subcommands.add_parser('list', help='List the contracts expiring within some days, by department')
+    show.add_argument('--days', type=int, default=EXPIRY_HORIZONS[0], help='Horizon, in days')
+    args = parser.parse_args()
+
+    from database import Session
+    with Session() as session:
+        if args.command == 'scan':
+            print(f"Wrote {scan(session, args.as_of)} contract expiry notifications")
+        else:
+            for department in expiring_contracts(session, args.days):
+                print(f"{department['department']} ({len(department['contracts'])})")
+                for contract in department['contracts']:
+                    print(f"  {contract['end_date']} ({contract['days_left']} days)  {contract['rut']}  {contract['employee']}")
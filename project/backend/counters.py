@@ -0,0 +1,32 @@
+from datetime import datetime
+from sqlalchemy.dialects import mysql, sqlite
+
+# Counters kept in tables (the rollups of rollups.py, the table versions of table_versions.py), moved
+# with one atomic "INSERT ... ON DUPLICATE KEY UPDATE x = x + delta" (MySQL) or "INSERT ... ON CONFLICT
+# DO UPDATE" (SQLite) statement, so concurrent writers add up instead of overwriting each other and a
+# missing row is created by the first one.
+
+
+def increment(session, model, rows, updated_at=None):
+    """
+    Add the values of rows (dicts with the primary key and the columns to add to) to a counter table,
+    creating missing rows. Their updated_at is set to updated_at (now, in local time, by default). Doesn't commit.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    keys = [column.name for column in table.primary_key.columns]
+    deltas = [name for name in rows[0] if name not in keys]
+    updated_at = updated_at or datetime.now()
+    rows = [dict(row, updated_at=updated_at) for row in rows]
+    if session.get_bind().dialect.name == 'mysql':
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in deltas}, updated_at=statement.inserted.updated_at
+        )
+    else:
+        statement = sqlite.insert(table)
+        statement = statement.on_conflict_do_update(index_elements=keys, set_=dict(
+            {name: table.c[name] + statement.excluded[name] for name in deltas}, updated_at=statement.excluded.updated_at
+        ))
+    session.execute(statement, rows)
@@ -0,0 +1,106 @@
+import io
+import csv
+from datetime import date
+from sqlalchemy import select
+from tables import *
+from queries import REMUNERATION_SORTS, CONTRACT_SORTS, VACATION_SORTS, EVALUATION_SORTS, TRAINING_SORTS
+from pagination import sort_order
+
+# CSV exports of the listing pages.
+# Rows are read with yield_per, which streams them from a server-side cursor (MySQL) in chunks of
+# CHUNK_SIZE, and written out as they arrive, so memory stays flat whatever the table size and
+# the header goes out before the query even runs.
+
+CHUNK_SIZE = 1000
+# Spreadsheet apps run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def employee_name():
+    return (Employee.first_name + ' ' + Employee.last_name).label('employee')
+
+
+def remunerations():
+    return select(
+        Remuneration.id, Remuneration.period, employee_name(), Employee.rut,
+        AFP.name.label('afp'), HealthPlan.name.label('health_plan'),
+        Remuneration.gross_amount, Remuneration.tax, Remuneration.deductions, Remuneration.bonus,
+        Remuneration.welfare_contribution, Remuneration.net_amount,
+    ).join(Employee, Remuneration.employee_id == Employee.id) \
+        .outerjoin(AFP, Remuneration.afp_id == AFP.id) \
+        .outerjoin(HealthPlan, Remuneration.health_plan_id == HealthPlan.id)
+
+
+def contracts():
+    return select(
+        Contract.id, employee_name(), Employee.rut, Contract.contract_type, Contract.start_date, Contract.end_date,
+        Contract.classification, JobPosition.name.label('position'), Contract.registration_date,
+    ).join(Employee, Contract.employee_id == Employee.id) \
+        .outerjoin(EmployeePosition, Employee.id == EmployeePosition.employee_id) \
+        .outerjoin(JobPosition, EmployeePosition.position_id == JobPosition.id)
+
+
+def vacations():
+    return select(
+        Vacation.id, employee_name(), Employee.rut, Vacation.start_date, Vacation.end_date,
+        Vacation.days_taken, Vacation.accumulated_days, Vacation.long_service_employee,
+    ).join(Employee, Vacation.employee_id == Employee.id)
+
+
+def evaluations():
+    return select(
+        Evaluation.id, employee_name(), Employee.rut, Evaluation.evaluation_date, Evaluation.evaluator,
+        Evaluation.evaluation_factor, Evaluation.rating, Evaluation.comments,
+    ).join(Employee, Evaluation.employee_id == Employee.id)
+
+
+def trainings():
+    return select(
+        Training.id, employee_name(), Employee.rut, Training.training_date, Training.course,
+        Training.score, Training.institution, Training.comments,
+    ).join(Employee, Training.employee_id == Employee.id)
+
+
+# Export name -> (statement, sort options of its listing page)
+EXPORTS = {
+    'remunerations': (remunerations, REMUNERATION_SORTS),
+    'contracts': (contracts, CONTRACT_SORTS),
+    'vacations': (vacations, VACATION_SORTS),
+    'evaluations': (evaluations, EVALUATION_SORTS),
+    'trainings': (trainings, TRAINING_SORTS),
+}
+
+
+def cell(value):
+    """A value as written to the CSV: NULL as an empty field and text that can't run as a formula."""
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def export_filename(name):
+    return f'{name}-{date.today().isoformat()}.csv'
+
+
+def stream_csv(session, name, sort='id', descending=False, chunk_size=CHUNK_SIZE):
+    """Yield an export as CSV text, one chunk of rows at a time (the header first)."""
+    build, sorts = EXPORTS[name]
+    statement = build()
+    statement = statement.order_by(*sort_order(sorts.get(sort, sorts['id']), descending))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow([column.name for column in statement.selected_columns])
+    yield buffer.getvalue()
+
+    result = session.execute(statement.execution_options(yield_per=chunk_size))
+    try:
+        for rows in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows([cell(value) for value in row] for row in rows)
+            yield buffer.getvalue()
+    finally:
+        result.close()
@@ -0,0 +1,108 @@
+import sys
+import argparse
+from datetime import date, datetime
+from sqlalchemy import select, insert, update, delete
+from tables import *
+from table_versions import bump
+
+# The current contract of each employee is stored in CurrentContract: the contract with the latest
+# start date (the highest ID on a tie). add_contract updates it in the contract's transaction; the
+# reconciler recomputes it for every employee, to repair what was written outside the app (imports,
+# manual fixes), and is meant to run nightly, e.g. from cron:
+#   30 2 * * *  cd /path/to/project/backend && python current_contracts.py reconcile
+#
+# Usage (from project/backend/):
+#   python current_contracts.py reconcile [--dry-run]
+
+CHUNK_SIZE = 5000  # Employees per transaction in reconcile()
+
+
+def latest(contracts):
+    """Current contract among (id, start_date) pairs: the latest start, the highest ID on a tie."""
+    return max(contracts, key=lambda contract: (contract[1] is not None, contract[1] or date.min, contract[0]))
+
+
+def update_current_contract(session, contract):
+    """
+    Point the employee of a new contract at it if it is now their current one. Doesn't commit.
+    The employee's CurrentContract row is locked (SELECT ... FOR UPDATE), not their Employee row, so two
+    contracts added at once can't both win. An employee without a pointer has no row to lock: of two first
+    contracts added at once, the second insert fails on the primary key and its transaction rolls back.
+    """
+    pointer = session.query(CurrentContract).filter_by(employee_id=contract.employee_id) \
+        .with_for_update().populate_existing().one_or_none()
+    if pointer is None:
+        session.add(CurrentContract(employee_id=contract.employee_id, contract_id=contract.id, updated_at=datetime.now()))
+        return True
+    current = session.execute(select(Contract.id, Contract.start_date).where(Contract.id == pointer.contract_id)).first()
+    if current is None or latest([tuple(current), (contract.id, contract.start_date)])[0] == contract.id:
+        pointer.contract_id = contract.id
+        pointer.updated_at = datetime.now()
+        return True
+    return False
+
+
+def reconcile(session, dry_run=False, chunk_size=CHUNK_SIZE):
+    """
+    Recompute the current contract of every employee and fix the pointers that differ, one transaction
+    per chunk of employees. Returns {'employees', 'added', 'changed', 'removed'}.
+    """
+    summary = {'employees': 0, 'added': 0, 'changed': 0, 'removed': 0}
+    last_id = 0
+    while True:
+        ids = session.scalars(select(Employee.id).where(Employee.id > last_id).order_by(Employee.id).limit(chunk_size)).all()
+        if not ids:
+            break
+        contracts = {}
+        for employee_id, contract_id, start_date in session.execute(
+            select(Contract.employee_id, Contract.id, Contract.start_date).where(Contract.employee_id.in_(ids))
+        ):
+            contracts.setdefault(employee_id, []).append((contract_id, start_date))
+        expected = {employee_id: latest(pairs)[0] for employee_id, pairs in contracts.items()}
+        stored = dict(session.execute(
+            select(CurrentContract.employee_id, CurrentContract.contract_id).where(CurrentContract.employee_id.in_(ids))
+        ).all())
+
+        now = datetime.now()
+        added = [
+            {'employee_id': employee_id, 'contract_id': contract_id, 'updated_at': now}
+            for employee_id, contract_id in expected.items() if employee_id not in stored
+        ]
+        changed = [
+            {'employee_id': employee_id, 'contract_id': contract_id, 'updated_at': now}
+            for employee_id, contract_id in expected.items() if employee_id in stored and stored[employee_id] != contract_id
+        ]
+        removed = [employee_id for employee_id in stored if employee_id not in expected]
+        if not dry_run:
+            if removed:
+                session.execute(delete(CurrentContract).where(CurrentContract.employee_id.in_(removed)))
+            if changed:
+                # Bulk UPDATE by primary key
+                session.execute(update(CurrentContract), changed)
+            if added:
+                session.execute(insert(CurrentContract), added)
+            if changed or removed:
+                # The expiry counts and the contract pages are keyed on these versions
+                bump(session, Contract, CurrentContract)
+            session.commit()
+
+        summary['employees'] += len(ids)
+        summary['added'] += len(added)
+        summary['changed'] += len(changed)
+        summary['removed'] += len(removed)
+        last_id = ids[-1]
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Current contract of each employee.')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    run = subcommands.add_parser('reconcile', help='Recompute every current contract and fix the ones that differ')
+    run.add_argument('--dry-run', action='store_true', help='Only count the differences')
+    args = parser.parse_args()
+
+    from database import Session
+    with Session() as session:
+        summary = reconcile(session, args.dry_run)
+    print(f"{summary['employees']} employees: {summary['added']} added, {summary['changed']} changed, {summary['removed']} removed")
+    sys.exit(1 if args.dry_run and (summary['added'] or summary['changed'] or summary['removed']) else 0)
@@ -0,0 +1,99 @@
+import os
+import threading
+import weakref
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+# Load the MySQL root password from environment variables
+mysql_root_password = os.getenv('MYSQL_ROOT_PASSWORD', 'default_root_pass')  # Fallback in case the env variable isn't set
+# You can set it up by doing: export MYSQL_ROOT_PASSWORD=your_secure_password
+
+config = {
+    'host': os.getenv('MYSQL_HOST', 'localhost'),
+    'database_name': os.getenv('MYSQL_DATABASE', 'hr'),
+    'user': os.getenv('MYSQL_USER', 'root'),
+    'password': mysql_root_password,
+    # Connection pool settings, shared by every module of the backend
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+    'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),  # Seconds, keep it below MySQL's wait_timeout
+    'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+    'echo': os.getenv('DB_ECHO', '0') == '1',  # Set DB_ECHO=1 to log every SQL statement
+    }
+
+# Server URL (without database) is only needed to create the database itself
+server_url = f'mysql+pymysql://{config["user"]}:{config["password"]}@{config["host"]}'
+# DATABASE_URL overrides the MySQL settings (e.g. sqlite:///hr.db for local runs)
+database_url = os.getenv('DATABASE_URL', f'{server_url}/{config["database_name"]}')
+
+
+def engine_options(url, connect_args=None):
+    """Engine arguments with the pool settings from config (also used by the async engine, see async_db.py)."""
+    options = {'echo': config['echo'], 'pool_pre_ping': config['pool_pre_ping'], 'connect_args': connect_args or {}}
+    if not url.startswith('sqlite'):
+        # SQLite uses its own pool classes, which don't accept these arguments
+        options.update(
+            pool_size=config['pool_size'],
+            max_overflow=config['max_overflow'],
+            pool_recycle=config['pool_recycle'],
+        )
+    return options
+
+
+def build_engine(url=database_url, connect_args=None):
+    """Create an engine with the pool settings from config."""
+    return create_engine(url, **engine_options(url, connect_args))
+
+
+# The one engine (and connection pool) of the process
+engine = build_engine()
+
+Session = sessionmaker(bind=engine)
+
+
+# REQUEST SESSIONS ------------------------------------------------------------------------------------------------|
+# One session per thread (and so per request); app.py removes it on teardown
+db_session = scoped_session(Session)
+
+# Connections checked out from the pool, by the thread that checked them out
+checked_out_connections = {}
+# Sessions with an open transaction, by thread
+open_sessions = {}
+# How many requests ended while still holding sessions or connections
+leak_counter = {'requests': 0, 'sessions': 0, 'connections': 0}
+_leak_lock = threading.Lock()
+
+
+@event.listens_for(engine, 'checkout')
+def _track_checkout(dbapi_connection, connection_record, connection_proxy):
+    thread_id = threading.get_ident()
+    connection_record.info['thread_id'] = thread_id
+    checked_out_connections[thread_id] = checked_out_connections.get(thread_id, 0) + 1
+
+
+@event.listens_for(engine, 'checkin')
+def _track_checkin(dbapi_connection, connection_record):
+    # The connection can be returned from another thread (e.g. by the garbage collector)
+    thread_id = connection_record.info.pop('thread_id', None)
+    if thread_id in checked_out_connections:
+        checked_out_connections[thread_id] -= 1
+        if not checked_out_connections[thread_id]:
+            del checked_out_connections[thread_id]
+
+
+@event.listens_for(Session, 'after_begin')
+def _track_session(session, transaction, connection):
+    open_sessions.setdefault(threading.get_ident(), weakref.WeakSet()).add(session)
+
+
+def check_leaks():
+    """Count the sessions and connections the current thread still holds, and record them as leaks."""
+    thread_id = threading.get_ident()
+    sessions = sum(1 for session in open_sessions.pop(thread_id, ()) if session.in_transaction())
+    connections = checked_out_connections.get(thread_id, 0)
+    if sessions or connections:
+        with _leak_lock:
+            leak_counter['requests'] += 1
+            leak_counter['sessions'] += sessions
+            leak_counter['connections'] += connections
+    return sessions, connections
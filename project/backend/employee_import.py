@@ -0,0 +1,290 @@
+import io
+import re
+import sys
+import csv
+import argparse
+from datetime import date
+from types import SimpleNamespace
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from tables import *
+from search import normalize, normalize_rut, employee_tokens
+from queries import all_afps, all_health_plans
+from vacation_ledger import open_balances
+from rollups import count_new_employees
+from table_versions import bump
+
+# Bulk employee import from a CSV file (the /import_employees page and the command below).
+# The file is read as a stream and handled CHUNK_SIZE rows at a time: a chunk is validated with
+# one query for the RUTs that already exist, and its valid rows are inserted, with their search
+# tokens, in one transaction. Rows with errors are skipped and listed in the report with their line.
+#
+# Columns (header row required, any order, extra columns ignored):
+#   rut, first_name, last_name, birth_date, start_date, email, phone, salary, nationality,
+#   afp, health_plan  -> name (accents and case don't matter) or ID; afp_id/health_plan_id also work
+# Dates are YYYY-MM-DD. The same columns as the Employee.csv written by load_db.py --write-csv.
+#
+# Usage (from project/backend/):
+#   python employee_import.py employees.csv [--dry-run] [--errors errors.csv]
+
+CHUNK_SIZE = 2000
+# Most errors kept in the report; the counts are always complete
+MAX_REPORTED_ERRORS = 1000
+
+REQUIRED_COLUMNS = ['rut', 'first_name', 'last_name', 'birth_date', 'start_date', 'email', 'salary']
+RUT_PATTERN = re.compile(r'^[0-9]{1,8}[0-9k]$')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def rut_check_digit(number):
+    """Check digit of a RUT number (modulo 11): 12345678 -> '5'."""
+    total, factor = 0, 2
+    for digit in reversed(str(number)):
+        total += int(digit) * factor
+        factor = 2 if factor == 7 else factor + 1
+    check = 11 - total % 11
+    return {11: '0', 10: 'K'}.get(check, str(check))
+
+
+def format_rut(rut):
+    """RUT as stored, or None if it isn't valid: '12345678k' -> '12.345.678-K'."""
+    rut = normalize_rut(rut)
+    if not RUT_PATTERN.match(rut):
+        return None
+    number, check_digit = int(rut[:-1]), rut[-1].upper()
+    if rut_check_digit(number) != check_digit:
+        return None
+    return f'{number:,}'.replace(',', '.') + f'-{check_digit}'
+
+
+def reference_map(rows, id_key):
+    """Accent-folded name -> ID of a reference table, with the IDs themselves as keys too."""
+    mapping = {normalize(row['name']).strip(): row[id_key] for row in rows}
+    mapping.update({str(row[id_key]): row[id_key] for row in rows})
+    return mapping
+
+
+def reference_maps(session):
+    """Name/ID maps of the AFPs and health plans, built from the cached reference lists."""
+    return {
+        'afp': reference_map(all_afps(session), 'id'),
+        'health_plan': reference_map(all_health_plans(session), 'health_plan_id'),
+    }
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def field(row, name):
+    return (row.get(name) or '').strip()
+
+
+def validate_row(row, maps):
+    """Employee insert values of a CSV row, and the list of what's wrong with it."""
+    errors = []
+    for name in REQUIRED_COLUMNS:
+        if not field(row, name):
+            errors.append(f'{name} is required')
+
+    rut = format_rut(field(row, 'rut'))
+    if field(row, 'rut') and rut is None:
+        errors.append(f"invalid RUT '{field(row, 'rut')}'")
+
+    birth_date, start_date = parse_date(field(row, 'birth_date')), parse_date(field(row, 'start_date'))
+    for name, value in [('birth_date', birth_date), ('start_date', start_date)]:
+        if field(row, name) and value is None:
+            errors.append(f"{name} '{field(row, name)}' isn't a YYYY-MM-DD date")
+    if birth_date and start_date and birth_date >= start_date:
+        errors.append('birth_date must be before start_date')
+
+    email = field(row, 'email')
+    if email and not EMAIL_PATTERN.match(email):
+        errors.append(f"invalid email '{email}'")
+
+    salary = None
+    if field(row, 'salary'):
+        try:
+            salary = Decimal(field(row, 'salary'))
+            if not salary.is_finite() or salary < 0 or salary >= Decimal('1e8'):
+                raise InvalidOperation
+            salary = salary.quantize(Decimal('0.01'))
+        except InvalidOperation:
+            errors.append(f"invalid salary '{field(row, 'salary')}'")
+            salary = None
+
+    references = {}
+    for name in ['afp', 'health_plan']:
+        value = field(row, name) or field(row, f'{name}_id')
+        if not value:
+            errors.append(f'{name} is required')
+            continue
+        references[name] = maps[name].get(normalize(value))
+        if references[name] is None:
+            errors.append(f"unknown {name.replace('_', ' ')} '{value}'")
+
+    for name, size in [('first_name', 50), ('last_name', 50), ('phone', 20), ('nationality', 50)]:
+        if len(field(row, name)) > size:
+            errors.append(f'{name} is longer than {size} characters')
+
+    return {
+        'rut': rut,
+        'first_name': field(row, 'first_name'),
+        'last_name': field(row, 'last_name'),
+        'birth_date': birth_date,
+        'start_date': start_date,
+        'email': email,
+        'phone': field(row, 'phone'),
+        'salary': salary,
+        'nationality': field(row, 'nationality').capitalize(),
+        'active_employee': True,
+        'afp_id': references.get('afp'),
+        'health_plan_id': references.get('health_plan'),
+    }, errors
+
+
+def chunks(reader, size):
+    """(line, row) lists of up to size rows; line is the row's line number in the file."""
+    chunk = []
+    for row in reader:
+        chunk.append((reader.line_num, row))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def insert_employees(session, employees):
+    """Insert employees, their search tokens, vacation balances and rollup counts. Doesn't commit. Returns the new IDs by RUT."""
+    session.execute(insert(Employee), employees)
+    ids = dict(session.execute(
+        select(Employee.rut, Employee.id).where(Employee.rut.in_([employee['rut'] for employee in employees]))
+    ).all())
+    tokens = [
+        {'token': token, 'employee_id': ids[employee['rut']], 'field': token_field}
+        for employee in employees
+        for token, token_field in employee_tokens(SimpleNamespace(**employee))
+    ]
+    if tokens:
+        session.execute(insert(EmployeeSearchToken), tokens)
+    open_balances(session, [(ids[employee['rut']], employee['start_date']) for employee in employees])
+    count_new_employees(session, len(employees), sum(employee['salary'] for employee in employees))
+    bump(session, Employee)
+    return ids
+
+
+def import_employees(session, file, dry_run=False, chunk_size=CHUNK_SIZE):
+    """
+    Import the employees of a CSV text stream, chunk_size rows per transaction.
+    With dry_run, rows are only validated. Returns the report:
+    {'rows': n, 'imported': n, 'rejected': n, 'errors': [{'line', 'rut', 'errors': [...]}, ...]}
+    """
+    report = {'rows': 0, 'imported': 0, 'rejected': 0, 'errors': []}
+
+    def reject(line, rut, errors):
+        report['rejected'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line, 'rut': rut, 'errors': errors})
+
+    reader = csv.DictReader(file)
+    try:
+        header = [name.strip().lower() for name in reader.fieldnames or []]
+    except (UnicodeDecodeError, csv.Error) as e:
+        reject(1, None, [f"the file isn't UTF-8 CSV text: {e}"])
+        return report
+    missing = [name for name in REQUIRED_COLUMNS + ['afp', 'health_plan']
+               if name not in header and f'{name}_id' not in header]
+    if missing:
+        reject(1, None, [f"missing column(s): {', '.join(missing)}"])
+        return report
+    reader.fieldnames = header
+
+    maps = reference_maps(session)
+    seen = set()  # RUTs of the file so far
+    try:
+        for chunk in chunks(reader, chunk_size):
+            report['rows'] += len(chunk)
+            validated = []
+            for line, row in chunk:
+                employee, errors = validate_row(row, maps)
+                if employee['rut'] in seen:
+                    errors.append('RUT repeated in the file')
+                if employee['rut']:
+                    seen.add(employee['rut'])
+                validated.append((line, row, employee, errors))
+
+            ruts = [employee['rut'] for _, _, employee, errors in validated if not errors]
+            existing = set(session.scalars(select(Employee.rut).where(Employee.rut.in_(ruts)))) if ruts else set()
+
+            employees = []
+            for line, row, employee, errors in validated:
+                if employee['rut'] in existing:
+                    errors.append('an employee with this RUT already exists')
+                if errors:
+                    reject(line, employee['rut'] or field(row, 'rut'), errors)
+                else:
+                    employees.append(employee)
+
+            if dry_run or not employees:
+                continue
+            try:
+                insert_employees(session, employees)
+                session.commit()
+            except SQLAlchemyError as e:
+                session.rollback()
+                for line, _, employee, errors in validated:
+                    if not errors:
+                        reject(line, employee['rut'], [f'not inserted, the batch failed: {getattr(e, "orig", e)}'])
+                continue
+            report['imported'] += len(employees)
+    except (UnicodeDecodeError, csv.Error) as e:
+        # The chunks before this one are already imported
+        reject(reader.line_num + 1, None, [f"the file can't be read past this line: {e}"])
+
+    if dry_run:
+        report['valid'] = report['rows'] - report['rejected']
+    return report
+
+
+def text_stream(binary):
+    """Text stream of an uploaded file (UTF-8, with or without a BOM)."""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def write_errors(report, file):
+    """Write the errors of a report as CSV: line, rut, error (one row per error)."""
+    writer = csv.writer(file, lineterminator='\n')
+    writer.writerow(['line', 'rut', 'error'])
+    for row in report['errors']:
+        for error in row['errors']:
+            writer.writerow([row['line'], row['rut'] or '', error])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import employees from a CSV file.')
+    parser.add_argument('file', help='CSV file with a header row')
+    parser.add_argument('--dry-run', action='store_true', help='Only validate the rows')
+    parser.add_argument('--errors', help='Write the rejected rows to this CSV file')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows per transaction')
+    args = parser.parse_args()
+
+    from database import Session
+    with Session() as session, open(args.file, encoding='utf-8-sig', newline='') as file:
+        report = import_employees(session, file, args.dry_run, args.chunk_size)
+
+    verb = 'valid' if args.dry_run else 'imported'
+    print(f"{report['rows']} rows: {report.get('valid', report['imported'])} {verb}, {report['rejected']} rejected")
+    if args.errors:
+        with open(args.errors, 'w', encoding='utf-8', newline='') as file:
+            write_errors(report, file)
+    else:
+        for row in report['errors'][:20]:
+            print(f"  line {row['line']} ({row['rut'] or 'no RUT'}): {'; '.join(row['errors'])}")
+        if report['rejected'] > 20:
+            print(f"  ... {report['rejected'] - 20} more (use --errors FILE for the full list)")
+    sys.exit(1 if report['rejected'] else 0)
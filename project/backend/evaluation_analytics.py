@@ -0,0 +1,263 @@
+import sys
+import json
+import argparse
+from datetime import date
+from decimal import Decimal
+import numpy as np
+from sqlalchemy import select, update, func, cast, Integer
+from tables import *
+from table_versions import bump
+
+# Analytics of evaluations and trainings, computed with NumPy on columnar arrays.
+# The columns needed (grade or score, date, evaluator/course, department) are read as plain tuples
+# in one query, never as ORM objects, and turned into arrays; distributions, percentiles, means by
+# department or evaluator and monthly trends are then a few array operations, whatever the number of rows.
+# Grades and scores are handled as integer hundredths (6.45 -> 645), like the money of payroll.py.
+#
+# The rating of an evaluation comes from its grade through RATING_SCALE, used by add_evaluation,
+# the evaluation form and the generated benchmark data. After changing the scale, `rerate` rewrites
+# the rating of every stored evaluation in one vectorized pass per chunk.
+#
+# Usage (from project/backend/):
+#   python evaluation_analytics.py evaluations [--from 2025-01-01] [--to 2025-12-31] [--department ID]
+#   python evaluation_analytics.py trainings [--from ...] [--to ...] [--department ID]
+#   python evaluation_analytics.py rerate [--dry-run]
+
+CHUNK_SIZE = 100_000  # Evaluations re-rated at a time
+PERCENTILES = [10, 25, 50, 75, 90]
+
+# (lowest grade, rating) from the top of the scale down; grades below the last one are BELOW_SCALE
+RATING_SCALE = [
+    (Decimal('7'), 'Excellent'),
+    (Decimal('6.5'), 'Very Good'),
+    (Decimal('6'), 'Good'),
+    (Decimal('5'), 'Satisfactory'),
+    (Decimal('4'), 'Fair'),
+]
+BELOW_SCALE = 'Deficient'
+
+
+def to_hundredths(value):
+    return int((Decimal(value or 0) * 100).to_integral_value())
+
+
+def scale_arrays():
+    """Thresholds of RATING_SCALE in hundredths, ascending, and the ratings indexed by np.searchsorted."""
+    thresholds = np.array([to_hundredths(grade) for grade, _ in reversed(RATING_SCALE)], dtype=np.int64)
+    ratings = np.array([BELOW_SCALE] + [rating for _, rating in reversed(RATING_SCALE)], dtype=object)
+    return thresholds, ratings
+
+
+def rate(grades):
+    """Ratings of an array of grades in hundredths."""
+    thresholds, ratings = scale_arrays()
+    return ratings[np.searchsorted(thresholds, grades, side='right')]
+
+
+def rating_of(grade):
+    """Rating of one grade (a number or a string, as posted by the form). Same result as rate()."""
+    grade = to_hundredths(grade)
+    for lowest, rating in RATING_SCALE:
+        if grade >= to_hundredths(lowest):
+            return rating
+    return BELOW_SCALE
+
+
+def rating_labels():
+    """Every rating, from the bottom of the scale up."""
+    return [BELOW_SCALE] + [rating for _, rating in reversed(RATING_SCALE)]
+
+
+# COLUMNS ------------------------------------------------------------------------------------------------|
+def employee_departments():
+    """(employee_id, department_id) with one department per employee (the lowest ID), as SQL."""
+    return select(EmployeePosition.employee_id, func.min(JobPosition.department_id).label('department_id')) \
+        .join(JobPosition, EmployeePosition.position_id == JobPosition.id) \
+        .group_by(EmployeePosition.employee_id).subquery()
+
+
+def columns(session, model, date_column, value_column, text_columns, start_date=None, end_date=None, department_id=None):
+    """
+    Rows of a table as NumPy arrays: 'value' (hundredths), 'date' (datetime64[D]), 'department_id'
+    (0 if none) and the text columns (object arrays, '' for NULL).
+    """
+    departments = employee_departments()
+    query = select(
+        cast(func.round(value_column * 100), Integer),
+        date_column,
+        func.coalesce(departments.c.department_id, 0),
+        *text_columns,
+    ).outerjoin(departments, departments.c.employee_id == model.employee_id) \
+        .where(value_column.is_not(None))
+    if start_date:
+        query = query.where(date_column >= start_date)
+    if end_date:
+        query = query.where(date_column <= end_date)
+    if department_id:
+        query = query.where(departments.c.department_id == department_id)
+
+    rows = session.execute(query).all()
+    values, dates, department_ids, *texts = zip(*rows) if rows else ([], [], [], *[[] for _ in text_columns])
+    result = {
+        'value': np.array(values, dtype=np.int64),
+        'date': np.array(dates, dtype='datetime64[D]'),
+        'department_id': np.array(department_ids, dtype=np.int64),
+    }
+    for column, text in zip(text_columns, texts):
+        result[column.key] = np.array([value or '' for value in text], dtype=object)
+    return result
+
+
+def evaluation_columns(session, start_date=None, end_date=None, department_id=None):
+    """Evaluations as arrays: value (grade), date, department_id, evaluator."""
+    return columns(session, Evaluation, Evaluation.evaluation_date, Evaluation.evaluation_factor,
+                   [Evaluation.evaluator], start_date, end_date, department_id)
+
+
+def training_columns(session, start_date=None, end_date=None, department_id=None):
+    """Trainings as arrays: value (score), date, department_id, course, institution."""
+    return columns(session, Training, Training.training_date, Training.score,
+                   [Training.course, Training.institution], start_date, end_date, department_id)
+
+
+# STATISTICS ------------------------------------------------------------------------------------------------|
+def from_hundredths(value):
+    return round(float(value) / 100, 2)
+
+
+def percentiles(values):
+    """{'p10': ..., 'p90': ...} of values in hundredths (empty if there are none)."""
+    if not len(values):
+        return {}
+    return {f'p{p}': from_hundredths(value) for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def group_means(keys, values):
+    """[{'key', 'count', 'mean'}] of values grouped by keys, largest groups first."""
+    if not len(values):
+        return []
+    groups, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse)
+    sums = np.bincount(inverse, weights=values)
+    order = np.lexsort((groups.astype(str), -counts))
+    return [{'key': groups[i], 'count': int(counts[i]), 'mean': from_hundredths(sums[i] / counts[i])} for i in order]
+
+
+def monthly_trend(dates, values):
+    """[{'month': 'YYYY-MM', 'count', 'mean'}] of values by month of their date, in order."""
+    known = ~np.isnat(dates)
+    if not known.any():
+        return []
+    months = dates[known].astype('datetime64[M]').astype(np.int64)
+    first = months.min()
+    counts = np.bincount(months - first)
+    sums = np.bincount(months - first, weights=values[known])
+    return [
+        {'month': str(np.datetime64(int(first + i), 'M')), 'count': int(count), 'mean': from_hundredths(sums[i] / count)}
+        for i, count in enumerate(counts) if count
+    ]
+
+
+def summary(data, department_names):
+    """Count, mean, percentiles, means by department and monthly trend of a column set."""
+    values = data['value']
+    by_department = group_means(data['department_id'], values)
+    for group in by_department:
+        group['department'] = department_names.get(int(group.pop('key')), 'No department')
+    return {
+        'count': int(len(values)),
+        'mean': from_hundredths(values.mean()) if len(values) else None,
+        'percentiles': percentiles(values),
+        'by_department': by_department,
+        'trend': monthly_trend(data['date'], values),
+    }
+
+
+def department_names(session):
+    from queries import get_departments
+    return {department['id']: department['name'] for department in get_departments(session)}
+
+
+def evaluation_summary(session, start_date=None, end_date=None, department_id=None):
+    """Grade statistics of the evaluations, with the distribution by rating and the means by evaluator."""
+    data = evaluation_columns(session, start_date, end_date, department_id)
+    result = summary(data, department_names(session))
+    ratings = rate(data['value'])
+    result['ratings'] = {label: int((ratings == label).sum()) for label in rating_labels()}
+    result['by_evaluator'] = [
+        {'evaluator': group.pop('key'), **group} for group in group_means(data['evaluator'], data['value'])
+    ]
+    return result
+
+
+def training_summary(session, start_date=None, end_date=None, department_id=None):
+    """Score statistics of the trainings, with a histogram of whole scores and the means by course and institution."""
+    data = training_columns(session, start_date, end_date, department_id)
+    result = summary(data, department_names(session))
+    whole = data['value'] // 100
+    edges = np.arange(whole.min(), whole.max() + 2) if len(whole) else np.arange(0)
+    counts = np.bincount(whole - whole.min()) if len(whole) else []
+    result['histogram'] = [{'from': int(edge), 'count': int(count)} for edge, count in zip(edges, counts)]
+    for column in ['course', 'institution']:
+        result[f'by_{column}'] = [{column: group.pop('key'), **group} for group in group_means(data[column], data['value'])]
+    return result
+
+
+# RE-RATING ------------------------------------------------------------------------------------------------|
+def rerate(session, dry_run=False, chunk_size=CHUNK_SIZE):
+    """
+    Rate every evaluation again with the current RATING_SCALE, one transaction per chunk.
+    Evaluations without a grade keep their rating.
+    Returns {'evaluations': n, 'changed': n, 'by_rating': {rating: n changed to it}}.
+    """
+    result = {'evaluations': 0, 'changed': 0, 'by_rating': {}}
+    last_id = 0
+    while True:
+        rows = session.execute(
+            select(Evaluation.id, cast(func.round(Evaluation.evaluation_factor * 100), Integer), Evaluation.rating)
+            .where(Evaluation.id > last_id, Evaluation.evaluation_factor.is_not(None))
+            .order_by(Evaluation.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        ids, grades, stored = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        grades = np.array(grades, dtype=np.int64)
+        ratings = rate(grades)
+        changed = np.flatnonzero(ratings != np.array(stored, dtype=object))
+        if len(changed) and not dry_run:
+            # Bulk UPDATE by primary key
+            session.execute(update(Evaluation), [{'id': int(ids[i]), 'rating': ratings[i]} for i in changed])
+            bump(session, Evaluation)
+            session.commit()
+        labels, counts = np.unique(ratings[changed], return_counts=True) if len(changed) else ([], [])
+        for label, count in zip(labels, counts):
+            result['by_rating'][label] = result['by_rating'].get(label, 0) + int(count)
+        result['evaluations'] += len(rows)
+        result['changed'] += len(changed)
+        last_id = int(ids[-1])
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluation and training analytics.')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    for command, target in [('evaluations', 'evaluation grades'), ('trainings', 'training scores')]:
+        report = subcommands.add_parser(command, help=f'Statistics of the {target}, as JSON')
+        report.add_argument('--from', dest='start_date', type=date.fromisoformat, help='From this date (YYYY-MM-DD)')
+        report.add_argument('--to', dest='end_date', type=date.fromisoformat, help='Up to this date (YYYY-MM-DD)')
+        report.add_argument('--department', type=int, help='Only the employees of this department')
+    run = subcommands.add_parser('rerate', help='Rate every evaluation again with the current RATING_SCALE')
+    run.add_argument('--dry-run', action='store_true', help='Only count the ratings that would change')
+    args = parser.parse_args()
+
+    from database import Session
+    with Session() as session:
+        if args.command == 'rerate':
+            result = rerate(session, args.dry_run)
+            print(f"{result['evaluations']} evaluations: {result['changed']} {'would change' if args.dry_run else 'changed'}")
+            for label, count in result['by_rating'].items():
+                print(f"  {count} to {label}")
+            sys.exit(0)
+        report = evaluation_summary if args.command == 'evaluations' else training_summary
+        print(json.dumps(report(session, args.start_date, args.end_date, args.department), indent=2, default=str))
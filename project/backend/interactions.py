@@ -1,29 +1,18 @@
-import os
 from decimal import Decimal
-from sqlalchemy import create_engine, text, func, update
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import text, func, update
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import date, datetime
 from tables import *
+from database import engine, Session
+from search import index_employee
+from current_contracts import update_current_contract
+from evaluation_analytics import rating_of
+from table_versions import bump
+from rollups import employee_keys, count_new_employees, count_deactivation, count_position_change, count_remuneration
+from vacation_ledger import VacationError, open_balance, locked_balance, book
+from payroll import to_cents, to_basis_points, from_cents, percent_of, rate_tables, recompute_remunerations
+from queries import MAX_VACATION_DAYS, find_overlapping_vacation
 
-# Load the MySQL root password from environment variables
-mysql_root_password = os.getenv('MYSQL_ROOT_PASSWORD', 'default_root_pass')  # Fallback in case the env variable isn't set
-# You can set it up by doing: export MYSQL_ROOT_PASSWORD=your_secure_password
-
-config = {
-    'host': 'localhost',
-    'database_name': 'hr',
-    'user': 'root',
-    'password': mysql_root_password
-    }
-
-engine = create_engine(f'mysql+pymysql://{config["user"]}:{config["password"]}@{config["host"]}/{config["database_name"]}', echo=True)
-# engine = create_engine(f'mysql+pymysql://{config["user"]}:{config["password"]}@{config["host"]}', echo=True)
-
-Base = declarative_base()
-
-Session = sessionmaker(bind=engine)
-session = Session()
 
 # EMPLOYEE Interactions
 
@@ -44,6 +33,11 @@ def add_employee_to_db(session, employee_data):
             health_plan_id=employee_data['healthplan'],
         )
         session.add(new_employee)
+        session.flush()  # Get the employee ID for the search index and the vacation balance
+        index_employee(session, new_employee)
+        open_balance(session, new_employee.id, new_employee.start_date)
+        count_new_employees(session, 1, Decimal(str(new_employee.salary or 0)))
+        bump(session, Employee)
         session.commit()
         return "Empleado agregado exitosamente"
     except Exception as e:
@@ -55,7 +49,10 @@ def deactivate_employee(session, employee_id):
     try:
         employee = session.query(Employee).filter_by(id=employee_id).first()
         if employee:
+            if employee.active_employee:
+                count_deactivation(session, employee)
             employee.active_employee = False
+            bump(session, Employee)
             session.commit()
             return "Employee deactivated successfully."
         return f"Employee with ID {employee_id} not found."
@@ -76,6 +73,8 @@ def update_employee(session, data):
             employee.email = data['email']
             employee.phone = data['phone']
             employee.rut = data['rut']
+            index_employee(session, employee)
+            bump(session, Employee)
             session.commit()
             print(f"Employee {data['employee_id']}'s first name updated to '{data['first_name']}'.")
         else:
@@ -101,6 +100,7 @@ def add_company_to_db(session, company_data):
             industry=company_data['industry']
         )
         session.add(new_company)
+        bump(session, Company)
         session.commit()
         return "Company added successfully"
     except Exception as e:
@@ -120,37 +120,91 @@ def add_remuneration(session, remuneration_data):
         remuneration_data['afp_id'] = employee.afp_id
         remuneration_data['health_plan_id'] = employee.health_plan_id
 
-        # Ensure numeric fields are converted to float
-        gross_amount = float(remuneration_data.get('gross_amount', 0))
-        tax = float(remuneration_data.get('tax', 0))
-        deductions = float(remuneration_data.get('deductions', 0))
-        bonus = float(remuneration_data.get('bonus', 0))
-        welfare_contribution = float(remuneration_data.get('welfare_contribution', 0))
-        net_amount = float(remuneration_data.get('net_amount', 0))
+        # Money in integer cents, so no amount goes through a float (see payroll.py)
+        gross_amount = to_cents(remuneration_data.get('gross_amount'))
+        bonus = to_cents(remuneration_data.get('bonus'))
+        welfare_contribution = to_cents(remuneration_data.get('welfare_contribution'))
+        tax = to_basis_points(remuneration_data.get('tax'))
+        if remuneration_data.get('deductions'):
+            deductions = to_cents(remuneration_data['deductions'])
+        else:
+            # AFP commission and health plan discount of the employee's current plans
+            afp_rates, health_rates = rate_tables(session)
+            deductions = int(percent_of(gross_amount, afp_rates[employee.afp_id or 0])
+                             + percent_of(gross_amount, health_rates[employee.health_plan_id or 0]))
+        if remuneration_data.get('net_amount'):
+            net_amount = to_cents(remuneration_data['net_amount'])
+        else:
+            net_amount = gross_amount - deductions - welfare_contribution - percent_of(max(gross_amount - deductions, 0), tax)
 
         # Create new Remuneration record
         remuneration = Remuneration(
             employee_id=remuneration_data['employee_id'],
+            period=date.today().replace(day=1),
             afp_id=remuneration_data['afp_id'],
             health_plan_id=remuneration_data['health_plan_id'],
-            gross_amount=gross_amount,
-            tax=tax,
-            deductions=deductions,
-            bonus=bonus,
-            welfare_contribution=welfare_contribution,
-            net_amount=net_amount
+            gross_amount=from_cents(gross_amount),
+            tax=from_cents(tax),
+            deductions=from_cents(deductions),
+            bonus=from_cents(bonus),
+            welfare_contribution=from_cents(welfare_contribution),
+            net_amount=from_cents(net_amount)
         )
 
         # Add to session and commit
         session.add(remuneration)
+        count_remuneration(session, remuneration)
+        bump(session, Remuneration)
         session.commit()
         return "Remuneration added successfully."
 
-    except SQLAlchemyError as e:
+    except (SQLAlchemyError, ArithmeticError) as e:
         session.rollback()
         return f"Error adding remuneration: {str(e)}"
 
 
+# RATES Interactions
+
+def update_afp_commission(session, afp_id, commission_percentage):
+    """
+    Change an AFP's commission and recompute the last payroll run's rows paid through it, in one transaction.
+    Returns (success, report of recompute_remunerations or error message).
+    """
+    try:
+        afp = session.get(AFP, afp_id)
+        if not afp:
+            return False, f"AFP with ID {afp_id} not found."
+        afp.commission_percentage = Decimal(str(commission_percentage))
+        session.flush()
+        report = recompute_remunerations(session, afp_id=afp_id)
+        bump(session, AFP, Remuneration)
+        session.commit()
+    except (SQLAlchemyError, ArithmeticError) as e:
+        session.rollback()
+        return False, f"Error updating the AFP commission: {e}"
+    return True, report
+
+def update_health_plan_discount(session, health_plan_id, discount):
+    """
+    Change the Fonasa or Isapre discount of a health plan and recompute the last payroll run's
+    rows paid through it, in one transaction. Returns (success, report of recompute_remunerations or error message).
+    """
+    try:
+        plan = session.query(Fonasa).filter_by(health_plan_id=health_plan_id).first() or \
+            session.query(Isapre).filter_by(health_plan_id=health_plan_id).first()
+        if not plan:
+            return False, f"Health plan with ID {health_plan_id} has no Fonasa or Isapre discount."
+        plan.discount = Decimal(str(discount))
+        session.flush()
+        report = recompute_remunerations(session, health_plan_id=health_plan_id)
+        bump(session, type(plan), Remuneration)
+        session.commit()
+    except (SQLAlchemyError, ArithmeticError) as e:
+        session.rollback()
+        return False, f"Error updating the health plan discount: {e}"
+    return True, report
+
+
 def add_contract(session, contract_data):
     """
     Adds a new contract to the database, creating the position and department if they don't exist.
@@ -167,9 +221,12 @@ def add_contract(session, contract_data):
     # Fetch the employee ID using the provided RUT
 
     try:
+        created_reference_data = False
+
         # Check or create department
         department = session.query(Department).filter_by(name=department_name).first()
         if not department:
+            created_reference_data = True
             department = Department(name=department_name, description=f"Department {department_name}")
             session.add(department)
             session.flush()  # Ensure department ID is available immediately
@@ -177,6 +234,7 @@ def add_contract(session, contract_data):
         # Check or create position
         position = session.query(JobPosition).filter_by(name=position_name, department_id=department.id).first()
         if not position:
+            created_reference_data = True
             position = JobPosition(name=position_name, description=f"Position {position_name}", department_id=department.id)
             session.add(position)
             session.flush()  # Ensure position ID is available immediately
@@ -184,8 +242,13 @@ def add_contract(session, contract_data):
         # Associate position with the employee
         employee_position = session.query(EmployeePosition).filter_by(employee_id=employee_id, position_id=position.id).first()
         if not employee_position:
+            old_keys = employee_keys(session, employee_id)
             employee_position = EmployeePosition(employee_id=employee_id, position_id=position.id)
             session.add(employee_position)
+            employee = session.get(Employee, employee_id)
+            if employee:
+                session.flush()
+                count_position_change(session, employee, old_keys)
         
         # Create contract
         new_contract = Contract(
@@ -197,6 +260,9 @@ def add_contract(session, contract_data):
             registration_date=date.today()
         )
         session.add(new_contract)
+        session.flush()  # Get the contract ID for the current contract pointer
+        update_current_contract(session, new_contract)
+        bump(session, Contract, EmployeePosition, *([Department, JobPosition] if created_reference_data else []))
         session.commit()
         return {"success": True, "message": "Contract added successfully!"}
     except Exception as e:
@@ -205,7 +271,10 @@ def add_contract(session, contract_data):
 
 
 def add_vacation_to_db(session, vacation_data):
-    """Adds a vacation for an employee to the database."""
+    """
+    Adds a vacation for an employee to the database, debited from the employee's vacation balance.
+    The balance row is locked until the commit, so concurrent bookings can't spend the same days.
+    """
     try:
         # Convert dates from string to date objects
         start_date = datetime.strptime(vacation_data['start_date'], '%Y-%m-%d').date()
@@ -214,33 +283,30 @@ def add_vacation_to_db(session, vacation_data):
         # Validate that start_date is before end_date
         if start_date > end_date:
             return False, "Start date must be before the end date!"
-
-        # Fetch the employee
-        employee = session.query(Employee).filter_by(id=vacation_data['employee_id']).first()
-        if not employee:
-            return False, "Employee not found!"
-
-        # Check if requested vacation exceeds accumulated days
-        requested_days = (end_date - start_date).days + 1
-        if requested_days > vacation_data['accumulated_days']:
-            return False, "Insufficient vacation days!"
-
-        # Update accumulated days
-        vacation_data['accumulated_days'] -= requested_days
-
-        # Create a new Vacation entry
+        if (end_date - start_date).days + 1 > MAX_VACATION_DAYS:
+            return False, f"A vacation can't be longer than {MAX_VACATION_DAYS} days!"
+
+        # Checked after taking the lock, so two overlapping bookings can't both pass
+        balance = locked_balance(session, vacation_data['employee_id'])
+        overlap = find_overlapping_vacation(session, vacation_data['employee_id'], start_date, end_date)
+        if overlap:
+            session.rollback()
+            return False, f"Overlaps the vacation from {overlap.start_date} to {overlap.end_date}!"
         new_vacation = Vacation(
             employee_id=vacation_data['employee_id'],
             start_date=start_date,
             end_date=end_date,
-            days_taken=requested_days,
-            accumulated_days=vacation_data['accumulated_days'],
+            days_taken=(end_date - start_date).days + 1,
             long_service_employee=vacation_data['long_service_employee']
         )
-        session.add(new_vacation)
+        book(session, balance, new_vacation)
+        bump(session, Vacation)
         session.commit()
 
         return True, "Vacation added successfully!"
+    except VacationError as e:
+        session.rollback()  # Releases the balance lock
+        return False, str(e)
     except Exception as e:
         session.rollback()
         return False, str(e)
@@ -249,6 +315,7 @@ def add_training(session, training_data):
     """Add a training record."""
     try:
         session.add(Training(**training_data))
+        bump(session, Training)
         session.commit()
         return "Training added successfully."
     except SQLAlchemyError as e:
@@ -260,23 +327,13 @@ def add_training(session, training_data):
 def add_evaluation(session, evaluation_data):
     """Add an evaluation for an employee."""
     try:
-        # Get the evaluation factor (numeric grade)
-        evaluation_factor = float(evaluation_data.get('evaluation_factor', 0))
-
-        # Add the rating to the evaluation data
-        rating = (
-             # Determine rating based on the evaluation factor ranges
-            "Excellent" if evaluation_factor == 7 else
-            "Very Good" if 6.5 <= evaluation_factor < 7 else
-            "Good" if 6 <= evaluation_factor < 6.4 else
-            "Satisfactory" if 5 <= evaluation_factor < 6 else
-            "Fair" if 4 >= evaluation_factor > 5 else "Deficient"
-        )
-        evaluation_data['rating'] = rating
+        # The rating comes from the grade (evaluation factor), on the scale of evaluation_analytics.py
+        evaluation_data['rating'] = rating_of(evaluation_data.get('evaluation_factor'))
         session.add(Evaluation(**evaluation_data))
+        bump(session, Evaluation)
         session.commit()
         return "Evaluation added successfully."
-    except SQLAlchemyError as e:
+    except (SQLAlchemyError, ArithmeticError) as e:
         session.rollback()
         return f"Error adding evaluation: {str(e)}"
     
@@ -292,6 +349,7 @@ def add_evaluation_to_db(session, evaluation_data):
             comments=evaluation_data['comments'],
         )
         session.add(new_evaluation)
+        bump(session, Evaluation)
         session.commit()
         return "Evaluation added successfully"
     except Exception as e:
@@ -0,0 +1,92 @@
+import os
+import json
+import base64
+from decimal import Decimal
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+
+# Keyset (cursor) pagination for the listing pages.
+# Rows are sorted by a list of columns whose last one is unique (usually the id), and the
+# next page starts right after the sort key of the last row shown, so the database seeks
+# into the index instead of counting OFFSET rows.
+
+DEFAULT_PAGE_SIZE = int(os.getenv('PAGE_SIZE', 50))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 500))
+
+
+def clamp_page_size(page_size):
+    """Use the default page size when none is given, and never go over the maximum."""
+    if not page_size or page_size < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def encode_cursor(values):
+    """Turn the sort key of a row into an opaque, URL-safe cursor."""
+    plain = [
+        value.isoformat() if isinstance(value, (date, datetime)) else
+        str(value) if isinstance(value, Decimal) else value
+        for value in values
+    ]
+    return base64.urlsafe_b64encode(json.dumps(plain).encode()).decode()
+
+
+def decode_cursor(cursor, columns):
+    """Read a cursor back into values typed like the sort columns. Returns None if it isn't valid."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        return [_typed_value(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+def _typed_value(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+def after(columns, values, descending=False):
+    """
+    Condition for the rows that come after `values` in the sort order.
+    (a, b) > (x, y) is written as a > x OR (a = x AND b > y), which MySQL can run as an index range.
+    """
+    condition = None
+    for column, value in reversed(list(zip(columns, values))):
+        beyond = column < value if descending else column > value
+        condition = beyond if condition is None else or_(beyond, and_(column == value, condition))
+    return condition
+
+
+def sort_order(columns, descending=False):
+    """ORDER BY clauses for the sort columns."""
+    return [column.desc() if descending else column.asc() for column in columns]
+
+
+def keyset_page(query, columns, cursor=None, page_size=None, descending=False):
+    """
+    Get one page of a query sorted by `columns`.
+    Returns (rows, next_cursor); next_cursor is None on the last page. Each row has the sort
+    values appended as extra columns, so callers unpack the entities/columns they selected first.
+    """
+    page_size = clamp_page_size(page_size)
+    query = query.add_columns(*[column.label(f'sort_key_{i}') for i, column in enumerate(columns)])
+
+    values = decode_cursor(cursor, columns) if cursor else None
+    if values:
+        query = query.filter(after(columns, values, descending))
+
+    # One extra row tells whether there is a next page
+    rows = query.order_by(*sort_order(columns, descending)).limit(page_size + 1).all()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, f'sort_key_{i}') for i in range(len(columns))])
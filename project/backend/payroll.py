@@ -0,0 +1,358 @@
+import sys
+import argparse
+from datetime import date, datetime
+from decimal import Decimal
+import numpy as np
+from sqlalchemy import insert, update, func, or_
+from sqlalchemy.exc import IntegrityError
+from tables import *
+from rollups import rebuild_payroll_period
+from table_versions import bump
+
+# Monthly payroll run: the remuneration of every active employee, computed in one batch.
+# Money is handled as integer cents in NumPy arrays (percentages as basis points, 1.44% -> 144),
+# so a run of 80k employees is a few array operations instead of 80k form posts, and no amount
+# goes through a float. The rows of a run are inserted in a single transaction.
+# Each run is a PayrollRun row (one per month) and its remunerations point at it: the remunerations
+# added by hand in the same month aren't part of the run, so they neither make the month "paid" nor
+# get deleted when the run is replaced.
+#
+# For each employee:
+#   gross      = salary + bonus (bonus = salary * bonus percentage of the run)
+#   deductions = AFP commission + health plan discount (Fonasa or Isapre), both on the gross
+#   welfare    = WELFARE_PERCENTAGE of the gross
+#   tax        = progressive TAX_BRACKETS on gross - deductions, stored as the effective rate
+#   net        = gross - deductions - welfare - tax
+#
+# When an AFP commission or a health plan discount changes, only the last run's rows paid through
+# that AFP or plan are recomputed (recompute_remunerations).
+#
+# Usage (from project/backend/):
+#   python payroll.py run 2025-01 [--bonus 5] [--replace]
+#   python payroll.py afp-rate AFP_ID 1.27 [--details]        -> change a commission and recompute
+#   python payroll.py health-rate HEALTH_PLAN_ID 7 [--details] -> change a Fonasa/Isapre discount and recompute
+
+CHUNK_SIZE = 50_000  # Employees read and computed at a time
+WELFARE_PERCENTAGE = Decimal('1.00')
+
+# Monthly income tax brackets: (taxable amount from, marginal rate %), in the currency of the salaries
+TAX_BRACKETS = [
+    (Decimal('0'), Decimal('0')),
+    (Decimal('1000'), Decimal('4')),
+    (Decimal('2000'), Decimal('8')),
+    (Decimal('3500'), Decimal('13.5')),
+    (Decimal('5000'), Decimal('23')),
+    (Decimal('8000'), Decimal('30.4')),
+]
+
+
+class PayrollError(Exception):
+    """A payroll run that can't be done (e.g. the period was already paid)."""
+
+
+def to_cents(amount):
+    return int((Decimal(amount or 0) * 100).to_integral_value())
+
+
+def to_basis_points(percentage):
+    return int((Decimal(percentage or 0) * 100).to_integral_value())
+
+
+def from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def percent_of(cents, basis_points):
+    """cents * basis_points / 10000, rounded half up, on arrays of integers."""
+    return (cents * basis_points + 5000) // 10000
+
+
+def period_start(period):
+    """The first day of the month of a date or of a 'YYYY-MM' string."""
+    if isinstance(period, str):
+        period = date.fromisoformat(f'{period}-01' if len(period) == 7 else period)
+    return period.replace(day=1)
+
+
+def rate_tables(session):
+    """
+    AFP commissions and health plan discounts as arrays indexed by ID, in basis points.
+    Index 0 stays at 0 for employees without an AFP or a health plan.
+    """
+    afps = session.query(AFP.id, AFP.commission_percentage).all()
+    plans = session.query(Fonasa.health_plan_id, Fonasa.discount).all() + \
+        session.query(Isapre.health_plan_id, Isapre.discount).all()
+    afp_rates = np.zeros(max([afp_id for afp_id, _ in afps], default=0) + 1, dtype=np.int64)  # AFP IDs from 1
+    for afp_id, percentage in afps:
+        afp_rates[afp_id] = to_basis_points(percentage)
+    health_rates = np.zeros((session.query(func.max(HealthPlan.id)).scalar() or 0) + 1, dtype=np.int64)
+    for plan_id, discount in plans:
+        if plan_id is not None:
+            health_rates[plan_id] = to_basis_points(discount)
+    return afp_rates, health_rates
+
+
+def tax_tables():
+    """Bracket lower bounds (cents), marginal rates (basis points) and the tax due at each lower bound."""
+    lower_bounds = np.array([to_cents(start) for start, _ in TAX_BRACKETS], dtype=np.int64)
+    rates = np.array([to_basis_points(rate) for _, rate in TAX_BRACKETS], dtype=np.int64)
+    base_tax = np.zeros(len(TAX_BRACKETS), dtype=np.int64)
+    for i in range(1, len(TAX_BRACKETS)):
+        base_tax[i] = base_tax[i - 1] + percent_of(lower_bounds[i] - lower_bounds[i - 1], rates[i - 1])
+    return lower_bounds, rates, base_tax
+
+
+def compute(salaries, afp_ids, health_plan_ids, afp_rates, health_rates, bonus_basis_points=0):
+    """
+    Remuneration amounts (in cents) of arrays of employees.
+    salaries in cents; afp_ids and health_plan_ids with 0 for none. Returns a dict of arrays.
+    """
+    bonus = percent_of(salaries, bonus_basis_points)
+    gross = salaries + bonus
+    return {'bonus': bonus, **compute_from_gross(gross, afp_ids, health_plan_ids, afp_rates, health_rates)}
+
+
+def compute_from_gross(gross, afp_ids, health_plan_ids, afp_rates, health_rates):
+    """Deductions, welfare, tax and net (in cents) of arrays of gross amounts."""
+    afp_commission = percent_of(gross, afp_rates[afp_ids])
+    health_discount = percent_of(gross, health_rates[health_plan_ids])
+    deductions = afp_commission + health_discount
+    welfare = percent_of(gross, to_basis_points(WELFARE_PERCENTAGE))
+
+    taxable = np.maximum(gross - deductions, 0)
+    lower_bounds, rates, base_tax = tax_tables()
+    bracket = np.searchsorted(lower_bounds, taxable, side='right') - 1
+    tax = base_tax[bracket] + percent_of(taxable - lower_bounds[bracket], rates[bracket])
+    # The table keeps the effective rate (a percentage with 2 decimals), in basis points here
+    tax_rate = np.where(taxable > 0, (tax * 10000 + taxable // 2) // np.maximum(taxable, 1), 0)
+
+    return {
+        'gross': gross,
+        'afp_commission': afp_commission,
+        'health_discount': health_discount,
+        'deductions': deductions,
+        'welfare': welfare,
+        'tax': tax,
+        'tax_rate': tax_rate,
+        'net': gross - deductions - welfare - tax,
+    }
+
+
+def remuneration_rows(employee_ids, afp_ids, health_plan_ids, period, amounts, payroll_run_id=None):
+    """Remuneration rows (as dicts for a bulk insert) from the arrays of compute()."""
+    columns = {name: values.tolist() for name, values in amounts.items()}
+    return [
+        {
+            'employee_id': employee_id,
+            'period': period,
+            'payroll_run_id': payroll_run_id,
+            'afp_id': afp_id or None,
+            'health_plan_id': health_plan_id or None,
+            'gross_amount': from_cents(columns['gross'][i]),
+            'tax': from_cents(columns['tax_rate'][i]),
+            'deductions': from_cents(columns['deductions'][i]),
+            'bonus': from_cents(columns['bonus'][i]),
+            'welfare_contribution': from_cents(columns['welfare'][i]),
+            'net_amount': from_cents(columns['net'][i]),
+        }
+        for i, (employee_id, afp_id, health_plan_id) in enumerate(zip(employee_ids, afp_ids, health_plan_ids))
+    ]
+
+
+def employee_arrays(rows):
+    """Columns of (id, salary, afp_id, health_plan_id) rows as arrays; missing IDs become 0."""
+    employee_ids = [row[0] for row in rows]
+    salaries = np.array([to_cents(row[1]) for row in rows], dtype=np.int64)
+    afp_ids = np.array([row[2] or 0 for row in rows], dtype=np.int64)
+    health_plan_ids = np.array([row[3] or 0 for row in rows], dtype=np.int64)
+    return employee_ids, salaries, afp_ids, health_plan_ids
+
+
+def lock_payroll_run(session, period, replace=False):
+    """
+    The PayrollRun of a period, created, or locked (SELECT ... FOR UPDATE) and emptied with replace.
+    Taken before anything is counted, so two runs of the same month can't both find it unpaid: the second
+    one waits for the lock, or fails on ux_payroll_run_period if the month had no run yet.
+    A month already run raises PayrollError without replace. Doesn't commit.
+    """
+    run = session.query(PayrollRun).filter(PayrollRun.period == period).with_for_update().one_or_none()
+    if run is None:
+        run = PayrollRun(period=period)
+        session.add(run)
+        try:
+            session.flush()
+        except IntegrityError:
+            raise PayrollError(f"Another payroll run of {period:%Y-%m} is in progress or has just finished")
+        return run
+    paid = session.query(Remuneration).filter(Remuneration.payroll_run_id == run.id)
+    if not replace:
+        raise PayrollError(f"{paid.count()} remunerations already recorded by the payroll run of {period:%Y-%m}; "
+                           f"use replace to run it again")
+    paid.delete(synchronize_session=False)
+    return run
+
+
+def run_payroll(session, period, bonus_percentage=0, replace=False, chunk_size=CHUNK_SIZE):
+    """
+    Compute and insert the remuneration of every active employee for a period, in one transaction.
+    With replace, the rows of the period's previous run are deleted first (not the remunerations added
+    by hand); without it a period already run raises PayrollError. Returns a summary with the totals of the run.
+    """
+    period = period_start(period)
+    afp_rates, health_rates = rate_tables(session)
+    bonus_basis_points = to_basis_points(bonus_percentage)
+    totals = {'employees': 0, 'gross': 0, 'deductions': 0, 'tax': 0, 'net': 0}
+    try:
+        run = lock_payroll_run(session, period, replace)
+        last_id = 0
+        while True:
+            rows = session.query(Employee.id, Employee.salary, Employee.afp_id, Employee.health_plan_id) \
+                .filter(Employee.active_employee == True, Employee.id > last_id) \
+                .order_by(Employee.id).limit(chunk_size).all()
+            if not rows:
+                break
+            employee_ids, salaries, afp_ids, health_plan_ids = employee_arrays(rows)
+            amounts = compute(salaries, afp_ids, health_plan_ids, afp_rates, health_rates, bonus_basis_points)
+            session.execute(insert(Remuneration), remuneration_rows(
+                employee_ids, afp_ids.tolist(), health_plan_ids.tolist(), period, amounts, run.id
+            ))
+            totals['employees'] += len(rows)
+            for key, name in [('gross', 'gross'), ('deductions', 'deductions'), ('tax', 'tax'), ('net', 'net')]:
+                totals[key] += int(amounts[name].sum())
+            last_id = employee_ids[-1]
+        run.bonus_percentage = Decimal(bonus_percentage)
+        run.employees = totals['employees']
+        run.ran_at = datetime.now()
+        rebuild_payroll_period(session, period)
+        bump(session, Remuneration, PayrollRun)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    return {
+        'period': period,
+        'employees': totals['employees'],
+        **{key: from_cents(totals[key]) for key in ['gross', 'deductions', 'tax', 'net']},
+    }
+
+
+def last_payroll_run(session, period=None):
+    """The payroll run of a period, or the last one without a period (None if there is none)."""
+    query = session.query(PayrollRun)
+    if period:
+        return query.filter(PayrollRun.period == period_start(period)).one_or_none()
+    return query.order_by(PayrollRun.period.desc()).first()
+
+
+def recompute_remunerations(session, afp_id=None, health_plan_id=None, period=None, chunk_size=CHUNK_SIZE):
+    """
+    Recompute the remunerations of a payroll run (the period's, or the last one) paid through an AFP
+    and/or a health plan, after its rate changed. Only those rows are read, through ix_remuneration_run_afp /
+    ix_remuneration_run_health_plan, not the rest of the run; remunerations added by hand are left as they were entered. Each row
+    keeps the AFP and health plan it was paid through; gross, bonus and welfare are kept too, while
+    deductions, tax and net follow the current rates. Doesn't commit: call it in the transaction that changes the rate.
+    Returns a report with the changed rows (employee, old and new deductions and net) and the totals.
+    """
+    run = last_payroll_run(session, period)
+    report = {'period': run.period if run else None, 'employees': 0, 'changed': [],
+              'net_before': Decimal(0), 'net_after': Decimal(0)}
+    if run is None or (afp_id is None and health_plan_id is None):
+        return report
+
+    # One index range per condition: (payroll_run_id, afp_id) and (payroll_run_id, health_plan_id)
+    conditions = []
+    if afp_id is not None:
+        conditions.append((Remuneration.payroll_run_id == run.id) & (Remuneration.afp_id == afp_id))
+    if health_plan_id is not None:
+        conditions.append((Remuneration.payroll_run_id == run.id) & (Remuneration.health_plan_id == health_plan_id))
+    afp_rates, health_rates = rate_tables(session)
+    last_id = 0
+    while True:
+        rows = session.query(
+            Remuneration.id, Remuneration.employee_id, Remuneration.gross_amount, Remuneration.deductions,
+            Remuneration.tax, Remuneration.welfare_contribution, Remuneration.net_amount,
+            Remuneration.afp_id, Remuneration.health_plan_id,
+        ).filter(or_(*conditions), Remuneration.id > last_id) \
+            .order_by(Remuneration.id).limit(chunk_size).all()
+        if not rows:
+            break
+        gross = np.array([to_cents(row.gross_amount) for row in rows], dtype=np.int64)
+        afp_ids = np.array([row.afp_id or 0 for row in rows], dtype=np.int64)
+        health_plan_ids = np.array([row.health_plan_id or 0 for row in rows], dtype=np.int64)
+        # The recorded welfare contribution is kept (it may have been entered by hand)
+        welfare = np.array([to_cents(row.welfare_contribution) for row in rows], dtype=np.int64)
+        amounts = compute_from_gross(gross, afp_ids, health_plan_ids, afp_rates, health_rates)
+
+        deductions = amounts['deductions'].tolist()
+        tax_rate = amounts['tax_rate'].tolist()
+        net = (gross - amounts['deductions'] - welfare - amounts['tax']).tolist()
+        updates = []
+        for i, row in enumerate(rows):
+            new = {
+                'id': row.id,
+                'deductions': from_cents(deductions[i]),
+                'tax': from_cents(tax_rate[i]),
+                'net_amount': from_cents(net[i]),
+            }
+            report['net_before'] += row.net_amount or 0
+            report['net_after'] += new['net_amount']
+            if (new['deductions'], new['tax'], new['net_amount']) != (row.deductions, row.tax, row.net_amount):
+                updates.append(new)
+                report['changed'].append({
+                    'employee_id': row.employee_id,
+                    'remuneration_id': row.id,
+                    'deductions': (row.deductions, new['deductions']),
+                    'net_amount': (row.net_amount, new['net_amount']),
+                })
+        if updates:
+            session.execute(update(Remuneration), updates)
+        report['employees'] += len(rows)
+        last_id = rows[-1].id
+    return report
+
+
+def print_report(report, details=False):
+    print(f"Period {report['period']:%Y-%m}: {len(report['changed'])} of {report['employees']} remunerations changed, "
+          f"net {report['net_before']} -> {report['net_after']}")
+    if details:
+        for change in report['changed']:
+            print(f"  employee {change['employee_id']}: deductions {change['deductions'][0]} -> {change['deductions'][1]}, "
+                  f"net {change['net_amount'][0]} -> {change['net_amount'][1]}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Payroll runs.')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    run = subcommands.add_parser('run', help='Compute the remunerations of every active employee for a month')
+    run.add_argument('period', help='Month to pay, as YYYY-MM')
+    run.add_argument('--bonus', type=Decimal, default=Decimal(0), help='Bonus, as a percentage of the salary')
+    run.add_argument('--replace', action='store_true', help='Replace the remunerations already recorded for the month')
+    for command, target in [('afp-rate', 'AFP'), ('health-rate', 'health plan')]:
+        rate = subcommands.add_parser(command, help=f'Change the rate of a {target} and recompute the last payroll run paid through it')
+        rate.add_argument('id', type=int, help=f'ID of the {target}')
+        rate.add_argument('percentage', type=Decimal, help='New rate, as a percentage')
+        rate.add_argument('--details', action='store_true', help='List every changed remuneration')
+    args = parser.parse_args()
+
+    from database import Session
+    with Session() as session:
+        if args.command == 'run':
+            try:
+                summary = run_payroll(session, args.period, args.bonus, args.replace)
+            except PayrollError as e:
+                print(e)
+                sys.exit(1)
+            print(f"Paid {summary['employees']} employees for {summary['period']:%Y-%m}: "
+                  f"gross {summary['gross']}, deductions {summary['deductions']}, tax {summary['tax']}, net {summary['net']}")
+        else:
+            import interactions
+            change = interactions.update_afp_commission if args.command == 'afp-rate' else interactions.update_health_plan_discount
+            success, result = change(session, args.id, args.percentage)
+            if not success:
+                print(result)
+                sys.exit(1)
+            if result['period'] is None:
+                print("Rate changed; there is no payroll run to recompute")
+            else:
+                print_report(result, args.details)
@@ -1,74 +1,103 @@
-import os
 from decimal import Decimal
-from sqlalchemy import create_engine, text, func
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import text, func, select, case
 from sqlalchemy.exc import SQLAlchemyError
-from datetime import date, datetime
+import os
+from datetime import date, datetime, timedelta
 from tables import *
-
-# Load the MySQL root password from environment variables
-mysql_root_password = os.getenv('MYSQL_ROOT_PASSWORD', 'default_root_pass')  # Fallback in case the env variable isn't set
-# You can set it up by doing: export MYSQL_ROOT_PASSWORD=your_secure_password
-
-config = {
-    'host': 'localhost',
-    'database_name': 'hr',
-    'user': 'root',
-    'password': mysql_root_password
-    }
-
-engine = create_engine(f'mysql+pymysql://{config["user"]}:{config["password"]}@{config["host"]}/{config["database_name"]}', echo=True)
-# engine = create_engine(f'mysql+pymysql://{config["user"]}:{config["password"]}@{config["host"]}', echo=True)
-
-Base = declarative_base()
-
-Session = sessionmaker(bind=engine)
-session = Session()
+from database import engine, Session
+from pagination import keyset_page, sort_order
+from search import search_employees
+from rollups import COMPANY, UNASSIGNED, WHOLE_DEPARTMENT, NO_DEPARTMENT
+from cache import TTLCache
+from table_versions import versions
+
+# Positions, departments, AFPs and health plans, shown on almost every page and rarely changed.
+# Cached as plain dicts (never ORM objects, which can't outlive their session), keyed on the versions
+# of the tables they are read from (see reference()): a write elsewhere changes the key, so an entry
+# is never older than the versions behind a page's ETag. The entries of old versions are evicted.
+reference_cache = TTLCache(
+    'reference',
+    ttl=int(os.getenv('REFERENCE_CACHE_TTL', 300)),
+    max_entries=int(os.getenv('REFERENCE_CACHE_SIZE', 1000)),
+)
+
+# Assembled employee profiles, by employee ID and the versions of PROFILE_TABLES: every write to
+# what the profile page shows bumps one of them, so the key changes at once in this process and
+# within TABLE_VERSION_TTL in the other worker processes (whatever process made the write).
+PROFILE_TABLES = [Employee, EmployeePosition, JobPosition, Contract, CurrentContract, Remuneration, HealthPlan, AFP]
+profile_cache = TTLCache(
+    'profiles',
+    ttl=int(os.getenv('PROFILE_CACHE_TTL', 600)),
+    max_entries=int(os.getenv('PROFILE_CACHE_SIZE', 10000)),
+)
+
+# Employee names by RUT and Employee table version, for the name shown while a RUT is typed in the
+# forms. Unknown RUTs are cached too (as None): every write to Employee bumps its version, so in any
+# worker process a new or renamed employee is found within TABLE_VERSION_TTL.
+name_cache = TTLCache(
+    'employee_names',
+    ttl=int(os.getenv('NAME_CACHE_TTL', 600)),
+    max_entries=int(os.getenv('NAME_CACHE_SIZE', 50000)),
+)
+
+def reference(session, name, tables, load):
+    """The reference_cache entry name, from load() when missing, for the current versions of the tables it reads."""
+    return reference_cache.get_or_load((name, versions(session, tables)), load)
 
 # MENU Queries ------------------------------------------------------------------------------------------------|
 def all_afps(session):
-    """Retrieve all afps and their data."""
+    """Retrieve all afps and their data (cached)."""
     try:
-        afps = session.query(AFP).all()
-        return [
+        return reference(session, 'afps', [AFP], lambda: [
             {
                 'id': afp.id,
                 'name': afp.name,
                 'commission_percentage': afp.commission_percentage,
             }
-            for afp in afps
-        ]
+            for afp in session.query(AFP).order_by(AFP.id).all()
+        ])
     except Exception as e:
         print(f'Error in all_companies: {e}')
     return []
 
 def all_health_plans(session):
-    """Retrieve all health plans with their respective discounts."""
+    """Retrieve all health plans with their respective discounts (cached)."""
     try:
-        # Query HealthPlan, Fonasa, and Isapre
-        health_plans = session.query(HealthPlan, Fonasa, Isapre). \
-            outerjoin(Fonasa, HealthPlan.id == Fonasa.health_plan_id). \
-            outerjoin(Isapre, HealthPlan.id == Isapre.health_plan_id). \
-            all()
-
-        return [
-            {
-                'health_plan_id': health_plan.id,
-                'name': health_plan.name,
-                'type': health_plan.type,
-                'fonasa_discount': fonasa.discount if fonasa else None,
-                'isapre_discount': isapre.discount if isapre else None,
-            }
-            for health_plan, fonasa, isapre in health_plans
-        ]
+        return reference(session, 'health_plans', [HealthPlan, Fonasa, Isapre], lambda: load_health_plans(session))
     except Exception as e:
         print(f'Error in all_health_plans: {e}')
     return []
 
-def all_companies(session):
-    """Retrieve all companies and their data."""
+def load_health_plans(session):
+    """Query HealthPlan, Fonasa, and Isapre (all_health_plans caches the result)."""
+    health_plans = session.query(HealthPlan, Fonasa, Isapre). \
+        outerjoin(Fonasa, HealthPlan.id == Fonasa.health_plan_id). \
+        outerjoin(Isapre, HealthPlan.id == Isapre.health_plan_id). \
+        order_by(HealthPlan.id). \
+        all()
+
+    return [
+        {
+            'health_plan_id': health_plan.id,
+            'name': health_plan.name,
+            'type': health_plan.type,
+            'fonasa_discount': fonasa.discount if fonasa else None,
+            'isapre_discount': isapre.discount if isapre else None,
+        }
+        for health_plan, fonasa, isapre in health_plans
+    ]
+
+# Sort options of the listing pages: name -> sort columns, the last one unique
+COMPANY_SORTS = {
+    'id': [Company.id],
+    'name': [Company.name, Company.id],
+}
+
+def all_companies(session, sort='id', descending=False, cursor=None, page_size=None):
+    """Retrieve one page of companies and their data. Returns (companies, next_cursor)."""
     try:
-        companies = session.query(Company).all()
+        sort_columns = COMPANY_SORTS.get(sort, COMPANY_SORTS['id'])
+        rows, next_cursor = keyset_page(session.query(Company), sort_columns, cursor, page_size, descending)
         return [
             {
                 'rut': company.rut,
@@ -77,32 +106,18 @@ def all_companies(session):
                 'phone': company.phone,
                 'industry': company.industry
             }
-            for company in companies
-        ]
+            for company, *_ in rows
+        ], next_cursor
     except Exception as e:
         print(f'Error in all_companies: {e}')
-    return []
+    return [], None
 
 
 # EMPLOYEE Queries ------------------------------------------------------------------------------------------------|
 def search_employee_by_name_or_rut(search_query, session):
-    """Search an employee by name or RUT with flexible matching."""
-    search_terms = search_query.split()
-    if len(search_terms) == 1:
-        term = f"%{search_terms[0]}%"
-        result = session.query(Employee).filter(
-            (Employee.first_name.like(term)) | 
-            (Employee.last_name.like(term)) | 
-            (Employee.rut == search_query)
-        ).first()
-    elif len(search_terms) == 2:
-        result = session.query(Employee).filter(
-            (Employee.first_name.like(f"%{search_terms[0]}%")) &
-            (Employee.last_name.like(f"%{search_terms[1]}%"))
-        ).first()
-    else:
-        result = None
-    return result
+    """Get the best match of an employee search by name or RUT (search_employees gives the ranked list)."""
+    results, _, _ = search_employees(session, search_query, page_size=1)
+    return session.get(Employee, results[0]['id']) if results else None
 
 def aditional_info(session, employee_id):
     """Get additional information about an employee including net amount, health plan, nationality, birth date, start date, salary, and AFP."""
@@ -142,6 +157,83 @@ def aditional_info(session, employee_id):
         print(f'Error in aditional_info: {e}')
     return None
 
+def employee_profile(session, employee_id):
+    """Everything the profile page shows about an employee (cached per employee). None if not found."""
+    try:
+        employee_id = int(employee_id)
+        profile = profile_cache.get_or_load((employee_id, versions(session, PROFILE_TABLES)),
+                                            lambda: load_employee_profile(session, employee_id))
+    except (TypeError, ValueError):
+        return None
+    except Exception as e:
+        print(f'Error in employee_profile: {e}')
+        return None
+    if not profile:
+        return None
+
+    # Depend on today's date, so they are not cached
+    today = datetime.today().date()
+    return dict(
+        profile,
+        age=(today.year - profile['birth_date'].year) if profile['birth_date'] else None,
+        days_since_start=(today - profile['start_date']).days if profile['start_date'] else None,
+    )
+
+def load_employee_profile(session, employee_id):
+    """
+    Load the general info, additional info and current contract of an employee in one query.
+    The current contract comes from CurrentContract (see current_contracts.py), and the net amount,
+    health plan and AFP from the latest remuneration.
+    """
+    latest_remuneration = select(Remuneration.id) \
+        .where(Remuneration.employee_id == Employee.id) \
+        .order_by(Remuneration.id.desc()) \
+        .limit(1).correlate(Employee).scalar_subquery()
+
+    info = session.query(
+        Employee.first_name, Employee.last_name, Employee.email, Employee.phone, Employee.rut,
+        Employee.active_employee, Employee.nationality, Employee.birth_date, Employee.start_date, Employee.salary,
+        JobPosition.name.label('position'),
+        Contract.id.label('contract_id'), Contract.contract_type, Contract.start_date.label('contract_start_date'),
+        Contract.end_date.label('contract_end_date'), Contract.classification, Contract.registration_date,
+        Remuneration.net_amount, HealthPlan.name.label('health_plan'), AFP.name.label('afp_name')
+    ).select_from(Employee) \
+        .outerjoin(EmployeePosition, Employee.id == EmployeePosition.employee_id) \
+        .outerjoin(JobPosition, EmployeePosition.position_id == JobPosition.id) \
+        .outerjoin(CurrentContract, CurrentContract.employee_id == Employee.id) \
+        .outerjoin(Contract, Contract.id == CurrentContract.contract_id) \
+        .outerjoin(Remuneration, Remuneration.id == latest_remuneration) \
+        .outerjoin(HealthPlan, Remuneration.health_plan_id == HealthPlan.id) \
+        .outerjoin(AFP, Remuneration.afp_id == AFP.id) \
+        .filter(Employee.id == employee_id).first()
+
+    if not info:
+        return None
+    return {
+        'first_name': info.first_name,
+        'last_name': info.last_name,
+        'email': info.email,
+        'phone': info.phone,
+        'rut': info.rut,
+        'position': info.position,
+        'status': info.active_employee,
+        'nationality': info.nationality,
+        'birth_date': info.birth_date,
+        'start_date': info.start_date,
+        'salary': info.salary,
+        'net_amount': int(info.net_amount) if isinstance(info.net_amount, Decimal) else info.net_amount,
+        'health_plan': info.health_plan or "No health plan registered",
+        'afp_name': info.afp_name or "No AFP registered",
+        'contract': {
+            'contract_type': info.contract_type,
+            'start_date': info.contract_start_date,
+            'end_date': info.contract_end_date,
+            'classification': info.classification,
+            'position': info.position,
+            'registration_date': info.registration_date,
+        } if info.contract_id else None,
+    }
+
 def general_info(session, employee_id):
     """Get basic information about an employee."""
     try:
@@ -154,13 +246,38 @@ def general_info(session, employee_id):
         print(f'Error in general_info: {e}')
     return None
 
-def get_filtered_employees(session, job_position_id=None, department_id=None, status=None):
-    """Get employees filtered by job position and/or department."""
+EMPLOYEE_SORTS = {
+    'id': [Employee.id],
+    'rut': [Employee.rut, Employee.id],
+    'last_name': [Employee.last_name, Employee.id],
+}
+
+def get_filtered_employees(session, job_position_id=None, department_id=None, status=None,
+                           sort='id', descending=False, cursor=None, page_size=None):
+    """Get one page of employees filtered by job position and/or department. Returns (employees, next_cursor)."""
+    sort_columns = EMPLOYEE_SORTS.get(sort, EMPLOYEE_SORTS['id'])
+
+    # First page through the employee ids alone, so an employee with several positions
+    # is never split between two pages
+    page_query = session.query(Employee.id)
+    if job_position_id or department_id:
+        positions = session.query(EmployeePosition.employee_id) \
+            .join(JobPosition, EmployeePosition.position_id == JobPosition.id)
+        if job_position_id:
+            positions = positions.filter(JobPosition.id == job_position_id)
+        if department_id:
+            positions = positions.filter(JobPosition.department_id == department_id)
+        page_query = page_query.filter(Employee.id.in_(positions))
+    if status:
+        page_query = page_query.filter(Employee.active_employee == status)
+    page, next_cursor = keyset_page(page_query, sort_columns, cursor, page_size, descending)
+
     query = (
         session.query(Employee.id, Employee.rut, Employee.first_name, Employee.last_name, JobPosition.name.label('position_name'), Department.name.label('department_name'))
         .outerjoin(EmployeePosition, Employee.id == EmployeePosition.employee_id)
         .outerjoin(JobPosition, EmployeePosition.position_id == JobPosition.id)
         .outerjoin(Department, JobPosition.department_id == Department.id)
+        .filter(Employee.id.in_([row.id for row in page]))
     )
 
     # Apply filters if provided
@@ -168,10 +285,7 @@ def get_filtered_employees(session, job_position_id=None, department_id=None, st
         query = query.filter(JobPosition.id == job_position_id)
     if department_id:
         query = query.filter(Department.id == department_id)
-    if status:
-        query = query.filter(Employee.active_employee == status)
 
-    
     return [
         {
             "id": emp.id,
@@ -181,10 +295,10 @@ def get_filtered_employees(session, job_position_id=None, department_id=None, st
             "position": emp.position_name or "No Position",
             "department": emp.department_name or "No Department",
         }
-        for emp in query.all()
-    ]
+        for emp in query.order_by(*sort_order(sort_columns, descending)).all()
+    ], next_cursor
 
-def get_employees_by_department(department_id):
+def get_employees_by_department(session, department_id):
     """
     Fetches all employees who are in positions within a given department.
     """
@@ -193,17 +307,36 @@ def get_employees_by_department(department_id):
 
     return employees
 
-def get_employee_name_by_rut(employee_rut):
-    """Fetch employee name by RUT"""
-    session = Session()
-    try:
-        employee = session.query(Employee).filter_by(rut=employee_rut).first()
-        if employee:
-            return employee.first_name + ' ' + employee.last_name
+def get_employee_name_by_rut(session, employee_rut):
+    """Fetch employee name by RUT (cached). Returns None if there is no such employee."""
+    key = (employee_rut, versions(session, [Employee]))
+    return name_cache.get_or_load(key, lambda: load_employee_names(session, [employee_rut]).get(employee_rut))
+
+def get_employee_names_by_ruts(session, employee_ruts):
+    """
+    Fetch the names of many RUTs at once: {rut: name or None}.
+    Only the RUTs that aren't cached are read, in a single query.
+    """
+    version = versions(session, [Employee])
+    names = {}
+    missing = []
+    for rut in dict.fromkeys(employee_ruts):
+        name = name_cache.peek((rut, version))
+        if name is name_cache.MISSING:
+            missing.append(rut)
         else:
-            return None
-    finally:
-        session.close()
+            names[rut] = name
+    if missing:
+        loaded = load_employee_names(session, missing)
+        for rut in missing:
+            names[rut] = name_cache.get_or_load((rut, version), lambda: loaded.get(rut))
+    return names
+
+def load_employee_names(session, employee_ruts):
+    """Query only the names of the given RUTs: {rut: 'first last'}; unknown RUTs are left out."""
+    rows = session.query(Employee.rut, Employee.first_name, Employee.last_name) \
+        .filter(Employee.rut.in_(employee_ruts)).all()
+    return {rut: first_name + ' ' + last_name for rut, first_name, last_name in rows}
 
 
 def get_employee_id_by_rut(session, rut):
@@ -215,15 +348,22 @@ def get_employee_id_by_rut(session, rut):
         print(f'Error in get_employee_id_by_rut: {e}')
         return None
 
-def all_employees(session):
-    """Retrieve all employees with their rut, first name, last name, position, and department"""
+def all_employees(session, sort='id', descending=False, cursor=None, page_size=None):
+    """
+    Retrieve one page of employees with their rut, first name, last name, position, and department.
+    Returns (employees, next_cursor).
+    """
     try:
+        sort_columns = EMPLOYEE_SORTS.get(sort, EMPLOYEE_SORTS['id'])
+        # Page through the employee ids alone, so an employee with several positions is never split between two pages
+        page, next_cursor = keyset_page(session.query(Employee.id), sort_columns, cursor, page_size, descending)
         query = session.query(
             Employee.id, Employee.rut, Employee.first_name, Employee.last_name,
             JobPosition.name.label('position_name'), Department.name.label('department_name')
         ).outerjoin(EmployeePosition, Employee.id == EmployeePosition.employee_id) \
          .outerjoin(JobPosition, EmployeePosition.position_id == JobPosition.id) \
-         .outerjoin(Department, JobPosition.department_id == Department.id)
+         .outerjoin(Department, JobPosition.department_id == Department.id) \
+         .filter(Employee.id.in_([row.id for row in page]))
         return [
             {
                 "id": row.id,
@@ -233,23 +373,38 @@ def all_employees(session):
                 "position": row.position_name or "No Position",
                 "department": row.department_name or "No Department",
             }
-            for row in query.all()
-        ]
+            for row in query.order_by(*sort_order(sort_columns, descending)).all()
+        ], next_cursor
     except Exception as e:
         print(f'Error in all_employees: {e}')
-    return []
+    return [], None
 
 
 #OTHER Queries ------------------------------------------------------------------------------------------------|
 def get_job_positions(session):
-    """Get all job positions."""
-    return session.query(JobPosition).all()
+    """Get all job positions (cached)."""
+    return reference(session, 'job_positions', [JobPosition], lambda: [
+        {
+            'id': position.id,
+            'name': position.name,
+            'description': position.description,
+            'department_id': position.department_id,
+        }
+        for position in session.query(JobPosition).order_by(JobPosition.id).all()
+    ])
 
 def get_departments(session):
-    """Get all departments."""
-    return session.query(Department).all()
+    """Get all departments (cached)."""
+    return reference(session, 'departments', [Department], lambda: [
+        {
+            'id': department.id,
+            'name': department.name,
+            'description': department.description,
+        }
+        for department in session.query(Department).order_by(Department.id).all()
+    ])
 
-def department_info(department_id):
+def department_info(session, department_id):
     """
     Fetches department name and description by department ID.
     """
@@ -260,9 +415,20 @@ def department_info(department_id):
     return None
 
 
-def get_all_evaluations(session):
-    """Get all evaluations with employee details."""
-    evaluations = session.query(Evaluation, Employee).join(Employee, Evaluation.employee_id == Employee.id).all()
+EVALUATION_SORTS = {
+    'id': [Evaluation.id],
+    'date': [Evaluation.evaluation_date, Evaluation.id],
+}
+
+def get_all_evaluations(session, sort='id', descending=False, cursor=None, page_size=None):
+    """Get one page of evaluations with employee details. Returns (evaluations, next_cursor)."""
+    sort_columns = EVALUATION_SORTS.get(sort, EVALUATION_SORTS['id'])
+    # Only the columns shown, not whole Evaluation and Employee objects
+    query = session.query(
+        Evaluation.evaluation_date, Evaluation.evaluator, Evaluation.evaluation_factor, Evaluation.rating,
+        Evaluation.comments, Employee.first_name, Employee.last_name,
+    ).join(Employee, Evaluation.employee_id == Employee.id)
+    evaluations, next_cursor = keyset_page(query, sort_columns, cursor, page_size, descending)
     return [
         {
             'evaluation_date': eval.evaluation_date,
@@ -270,14 +436,24 @@ def get_all_evaluations(session):
             'evaluation_factor': eval.evaluation_factor,
             'rating': eval.rating,
             'comments': eval.comments,
-            'employee_name': f"{employee.first_name} {employee.last_name}"
+            'employee_name': f"{eval.first_name} {eval.last_name}"
         }
-        for eval, employee in evaluations
-    ]
-
-def get_all_trainings(session):
-    """Get all trainings with employee details."""
-    trainings = session.query(Training, Employee).join(Employee, Training.employee_id == Employee.id).all()
+        for eval in evaluations
+    ], next_cursor
+
+TRAINING_SORTS = {
+    'id': [Training.id],
+    'date': [Training.training_date, Training.id],
+}
+
+def get_all_trainings(session, sort='id', descending=False, cursor=None, page_size=None):
+    """Get one page of trainings with employee details. Returns (trainings, next_cursor)."""
+    sort_columns = TRAINING_SORTS.get(sort, TRAINING_SORTS['id'])
+    query = session.query(
+        Training.training_date, Training.course, Training.score, Training.institution,
+        Training.comments, Employee.first_name, Employee.last_name,
+    ).join(Employee, Training.employee_id == Employee.id)
+    trainings, next_cursor = keyset_page(query, sort_columns, cursor, page_size, descending)
     return [
         {
             'training_date': train.training_date,
@@ -285,15 +461,22 @@ def get_all_trainings(session):
             'score': train.score,
             'institution': train.institution,
             'comments': train.comments,
-            'employee_name': f"{employee.first_name} {employee.last_name}"  # Add employee's full name
+            'employee_name': f"{train.first_name} {train.last_name}"  # Add employee's full name
         }
-        for train, employee in trainings
-    ]
+        for train in trainings
+    ], next_cursor
 
-def all_vacations(session):
-    """Retrieve all vacations and their employee data."""
+VACATION_SORTS = {
+    'id': [Vacation.id],
+    'start_date': [Vacation.start_date, Vacation.id],
+}
+
+def all_vacations(session, sort='id', descending=False, cursor=None, page_size=None):
+    """Retrieve one page of vacations and their employee data. Returns (vacations, next_cursor)."""
     try:
-        vacations = (session.query(Vacation, Employee).join(Employee, Vacation.employee_id == Employee.id).all())
+        sort_columns = VACATION_SORTS.get(sort, VACATION_SORTS['id'])
+        query = session.query(Vacation, Employee).join(Employee, Vacation.employee_id == Employee.id)
+        vacations, next_cursor = keyset_page(query, sort_columns, cursor, page_size, descending)
         return [
             {
                 'id': vacation.id,
@@ -304,25 +487,102 @@ def all_vacations(session):
                 'accumulated_days': vacation.accumulated_days,
                 'long_service_employee': vacation.long_service_employee,
             }
-            for vacation, employee in vacations
-        ]
+            for vacation, employee, *_ in vacations
+        ], next_cursor
     except Exception as e:
         print(f'Error in all_vacations: {e}')
+    return [], None
+
+# Vacations as intervals. A vacation [start_date, end_date] overlaps [A, B] when start_date <= B
+# and end_date >= A; on its own, that condition reads every vacation that started before B. No vacation
+# is longer than the longest one recorded, so start_date >= A - longest is added too, which turns it
+# into a short range of ix_vacation_start_end (or of ix_vacation_employee_start for one employee)
+# whatever the size of the history. add_vacation_to_db refuses vacations over MAX_VACATION_DAYS,
+# so only the longest old vacation has to be looked up (and it is cached with the reference data).
+MAX_VACATION_DAYS = 90
+# Longest date range of one who's out request
+MAX_WHOS_OUT_DAYS = 366
+
+def vacation_span(session):
+    """Days between start and end date, in SQL (there is no portable date difference)."""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        return func.julianday(Vacation.end_date) - func.julianday(Vacation.start_date)
+    if dialect == 'mysql':
+        return func.datediff(Vacation.end_date, Vacation.start_date)
+    return Vacation.end_date - Vacation.start_date
+
+def longest_vacation(session):
+    """Most days between the start and end date of a vacation (cached; an index-only scan to load)."""
+    longest = reference(session, 'longest_vacation', [Vacation], lambda: int(
+        session.scalar(select(func.max(vacation_span(session)))) or 0
+    ))
+    return max(longest, MAX_VACATION_DAYS)
+
+def overlapping_vacations(session, start_date, end_date):
+    """Condition for the vacations that overlap [start_date, end_date], bounded for the index."""
+    return (
+        (Vacation.start_date >= start_date - timedelta(days=longest_vacation(session)))
+        & (Vacation.start_date <= end_date)
+        & (Vacation.end_date >= start_date)
+    )
+
+def find_overlapping_vacation(session, employee_id, start_date, end_date):
+    """First vacation of an employee that overlaps [start_date, end_date], or None."""
+    return session.query(Vacation) \
+        .filter(Vacation.employee_id == employee_id, overlapping_vacations(session, start_date, end_date)) \
+        .order_by(Vacation.start_date).first()
+
+def employees_on_vacation(session, start_date, end_date, department_id=None):
+    """Who's out: the vacations overlapping [start_date, end_date], with their employee, by start date."""
+    try:
+        query = (
+            session.query(Vacation.id, Vacation.start_date, Vacation.end_date, Employee.id.label('employee_id'),
+                          Employee.rut, Employee.first_name, Employee.last_name, Department.name.label('department_name'))
+            .join(Employee, Vacation.employee_id == Employee.id)
+            .outerjoin(EmployeePosition, Employee.id == EmployeePosition.employee_id)
+            .outerjoin(JobPosition, EmployeePosition.position_id == JobPosition.id)
+            .outerjoin(Department, JobPosition.department_id == Department.id)
+            .filter(overlapping_vacations(session, start_date, end_date))
+        )
+        if department_id:
+            query = query.filter(Department.id == department_id)
+        return [
+            {
+                'vacation_id': row.id,
+                'employee_id': row.employee_id,
+                'rut': row.rut,
+                'employee': f"{row.first_name} {row.last_name}",
+                'department': row.department_name or "No Department",
+                'start_date': row.start_date,
+                'end_date': row.end_date,
+            }
+            for row in query.order_by(Vacation.start_date, Vacation.id).all()
+        ]
+    except Exception as e:
+        print(f'Error in employees_on_vacation: {e}')
     return []
 
-def all_remunerations(session):
-    """Retrieve all remunerations and their related employee, AFP, and health plan data."""
+REMUNERATION_SORTS = {
+    'id': [Remuneration.id],
+    'employee': [Remuneration.employee_id, Remuneration.id],
+}
+
+def all_remunerations(session, sort='id', descending=False, cursor=None, page_size=None):
+    """Retrieve one page of remunerations and their related employee, AFP, and health plan data. Returns (remunerations, next_cursor)."""
     try:
-        remunerations = (
+        sort_columns = REMUNERATION_SORTS.get(sort, REMUNERATION_SORTS['id'])
+        query = (
             session.query(Remuneration, Employee, AFP, HealthPlan)
             .join(Employee, Remuneration.employee_id == Employee.id)
             .join(AFP, Remuneration.afp_id == AFP.id)
             .join(HealthPlan, Remuneration.health_plan_id == HealthPlan.id)
-            .all()
         )
+        remunerations, next_cursor = keyset_page(query, sort_columns, cursor, page_size, descending)
         return [
             {
                 'id': remuneration.id,
+                'period': remuneration.period,
                 'employee': f"{employee.first_name} {employee.last_name}",
                 'afp': afp.name,
                 'health_plan': health_plan.name,
@@ -333,11 +593,11 @@ def all_remunerations(session):
                 'welfare_contribution': remuneration.welfare_contribution,
                 'net_amount': remuneration.net_amount,
             }
-            for remuneration, employee, afp, health_plan in remunerations
-        ]
+            for remuneration, employee, afp, health_plan, *_ in remunerations
+        ], next_cursor
     except Exception as e:
         print(f'Error in all_remunerations: {e}')
-    return []
+    return [], None
 
 
 # CONTRACT Queries
@@ -350,13 +610,23 @@ def get_contract_by_employee_id(session, employee_id):
         print(f'Error retrieving contract for employee {employee_id}: {e}')
         return None
 
-def all_contracts(session):
-    """Retrieve all contracts and their employee data."""
+CONTRACT_SORTS = {
+    'id': [Contract.id],
+    'start_date': [Contract.start_date, Contract.id],
+}
+
+def all_contracts(session, sort='id', descending=False, cursor=None, page_size=None):
+    """Retrieve one page of contracts and their employee data. Returns (contracts, next_cursor)."""
     try:
+        sort_columns = CONTRACT_SORTS.get(sort, CONTRACT_SORTS['id'])
+        # Page through the contracts alone: the join below repeats a contract once per position
+        page, next_cursor = keyset_page(session.query(Contract.id), sort_columns, cursor, page_size, descending)
         contracts = session.query(Contract, Employee, JobPosition) \
             .join(Employee, Contract.employee_id == Employee.id) \
             .join(EmployeePosition, Employee.id == EmployeePosition.employee_id) \
             .join(JobPosition, EmployeePosition.position_id == JobPosition.id) \
+            .filter(Contract.id.in_([row.id for row in page])) \
+            .order_by(*sort_order(sort_columns, descending)) \
             .all()
         
         return [
@@ -371,22 +641,174 @@ def all_contracts(session):
                 'registration_date': contract.registration_date,
             }
             for contract, employee, position in contracts
-        ]
+        ], next_cursor
     except Exception as e:
         print(f'Error in all_contracts: {e}')
-    return []
+    return [], None
+
+# Horizons, in days, of the expiring contracts page and of the scan of contract_expiry.py
+EXPIRY_HORIZONS = (30, 60, 90)
+
+def expiring_contracts(session, horizon=EXPIRY_HORIZONS[0], as_of=None):
+    """
+    Current contracts of active employees that end within horizon days, grouped by department:
+    [{'department_id', 'department', 'contracts': [{'id', 'employee_id', 'employee', 'rut', ...}]}], departments by name.
+    Only current contracts (see CurrentContract) count: one already followed by a new contract doesn't expire.
+    Reads a range of ix_contract_end_date, so its cost depends on the contracts expiring, not on the table size.
+    """
+    as_of = as_of or date.today()
+    try:
+        rows = (
+            session.query(Contract.id, Contract.contract_type, Contract.end_date, Employee.id.label('employee_id'),
+                          Employee.rut, Employee.first_name, Employee.last_name,
+                          Department.id.label('department_id'), Department.name.label('department_name'))
+            .join(CurrentContract, CurrentContract.contract_id == Contract.id)
+            .join(Employee, Contract.employee_id == Employee.id)
+            .outerjoin(EmployeePosition, Employee.id == EmployeePosition.employee_id)
+            .outerjoin(JobPosition, EmployeePosition.position_id == JobPosition.id)
+            .outerjoin(Department, JobPosition.department_id == Department.id)
+            .filter(Contract.end_date >= as_of, Contract.end_date <= as_of + timedelta(days=horizon))
+            .filter(Employee.active_employee == True)
+            .order_by(Contract.end_date, Contract.id)
+            .all()
+        )
+    except Exception as e:
+        print(f'Error in expiring_contracts: {e}')
+        return []
+
+    departments = {}
+    for row in rows:
+        department = departments.setdefault(row.department_id, {
+            'department_id': row.department_id,
+            'department': row.department_name or "No Department",
+            'contracts': [],
+        })
+        department['contracts'].append({
+            'id': row.id,
+            'employee_id': row.employee_id,
+            'employee': f"{row.first_name} {row.last_name}",
+            'rut': row.rut,
+            'contract_type': row.contract_type,
+            'end_date': row.end_date,
+            'days_left': (row.end_date - as_of).days,
+        })
+    return sorted(departments.values(), key=lambda department: department['department'])
+
+def contract_expiry_summary(session):
+    """
+    Contracts ending within each horizon, from the notifications of the last scans (cached):
+    {30: n, 60: n, 90: n}, where a contract counts in the shortest horizon it reached and every longer one.
+    Like expiring_contracts, only the current contracts of active employees count: a contract renewed or
+    an employee deactivated since the scan drops out of the counts.
+    """
+    def load():
+        counts = session.execute(select(*[
+            func.count(case((ContractExpiryNotification.horizon <= horizon, ContractExpiryNotification.contract_id)).distinct())
+            for horizon in EXPIRY_HORIZONS
+        ]).join(CurrentContract, CurrentContract.contract_id == ContractExpiryNotification.contract_id)
+            .join(Employee, CurrentContract.employee_id == Employee.id)
+            .where(ContractExpiryNotification.end_date >= date.today(), Employee.active_employee == True)).one()
+        return dict(zip(EXPIRY_HORIZONS, counts))
+    try:
+        # add_contract bumps Contract when it moves CurrentContract
+        return reference(session, 'contract_expiry', [ContractExpiryNotification, Contract, Employee], load)
+    except Exception as e:
+        print(f'Error in contract_expiry_summary: {e}')
+    return {horizon: 0 for horizon in EXPIRY_HORIZONS}
 
 def get_contract_info(session, employee_id):
+    """Current contract of an employee (through CurrentContract) and the employee's position."""
     try:
         contract = session.query(Contract.contract_type, Contract.start_date, 
                              Contract.end_date, Contract.classification, 
                              Contract.registration_date, JobPosition.name) \
-                            .join(Employee, Contract.employee_id == Employee.id) \
-                            .join(EmployeePosition, Employee.id == EmployeePosition.employee_id) \
-                            .join(JobPosition, EmployeePosition.position_id == JobPosition.id) \
-                            .filter(Contract.employee_id==employee_id) \
-                            .order_by(Contract.start_date.desc()).first()
+                            .join(CurrentContract, CurrentContract.contract_id == Contract.id) \
+                            .outerjoin(EmployeePosition, Contract.employee_id == EmployeePosition.employee_id) \
+                            .outerjoin(JobPosition, EmployeePosition.position_id == JobPosition.id) \
+                            .filter(CurrentContract.employee_id == employee_id).first()
         return contract
     except Exception as e:
-        print(f'Error in general_info: {e}')
-    return None
\ No newline at end of file
+        print(f'Error in get_contract_info: {e}')
+    return None
+
+def contract_history(session, employee_id):
+    """Every contract of an employee, latest start first, with the current one marked."""
+    try:
+        contracts = session.query(Contract, CurrentContract.employee_id.label('current')) \
+            .outerjoin(CurrentContract, CurrentContract.contract_id == Contract.id) \
+            .filter(Contract.employee_id == employee_id) \
+            .order_by(Contract.start_date.desc(), Contract.id.desc()) \
+            .all()
+        return [
+            {
+                'id': contract.id,
+                'contract_type': contract.contract_type,
+                'start_date': contract.start_date,
+                'end_date': contract.end_date,
+                'classification': contract.classification,
+                'registration_date': contract.registration_date,
+                'current': current is not None,
+            }
+            for contract, current in contracts
+        ]
+    except Exception as e:
+        print(f'Error in contract_history: {e}')
+    return []
+
+# DASHBOARD Queries ------------------------------------------------------------------------------------------------|
+DASHBOARD_PERIODS = 12  # Months offered in the period selector
+
+def rollup_kpis(rollup, payroll):
+    """KPIs of a PositionRollup row and the PayrollRollup row of the same key (either may be None)."""
+    headcount = rollup.headcount if rollup else 0
+    active = rollup.active if rollup else 0
+    return {
+        'headcount': headcount,
+        'active': active,
+        'inactive': headcount - active,
+        'average_salary': (Decimal(rollup.active_salary_total) / active).quantize(Decimal('0.01')) if active else None,
+        'remunerations': payroll.remunerations if payroll else 0,
+        'payroll_cost': Decimal(payroll.gross_total) if payroll else Decimal(0),
+    }
+
+def department_dashboard(session, period=None):
+    """
+    Headcount, active/inactive split, average salary and payroll cost by department and position,
+    read from the rollups kept by the write paths (see rollups.py), so nothing is added up here.
+    period is the month of the payroll cost (its first day), the latest paid one by default.
+    Returns {'period', 'periods', 'company', 'unassigned', 'departments': [{..., 'positions': [...]}], 'other_positions'}.
+    """
+    periods = session.scalars(
+        select(PayrollRollup.period).distinct().order_by(PayrollRollup.period.desc()).limit(DASHBOARD_PERIODS)
+    ).all()
+    if period is None and periods:
+        period = periods[0]
+    rollups = {(row.department_id, row.position_id): row for row in session.scalars(select(PositionRollup))}
+    payroll = {
+        (row.department_id, row.position_id): row
+        for row in session.scalars(select(PayrollRollup).where(PayrollRollup.period == period))
+    } if period else {}
+
+    def kpis(key):
+        return rollup_kpis(rollups.get(key), payroll.get(key))
+
+    positions = {}
+    for position in get_job_positions(session):
+        key = (position['department_id'] or NO_DEPARTMENT, position['id'])
+        positions.setdefault(key[0], []).append({'id': position['id'], 'name': position['name'], **kpis(key)})
+    return {
+        'period': period,
+        'periods': periods,
+        'company': kpis(COMPANY),
+        'unassigned': kpis(UNASSIGNED),
+        'departments': [
+            {
+                'id': department['id'],
+                'name': department['name'],
+                **kpis((department['id'], WHOLE_DEPARTMENT)),
+                'positions': positions.get(department['id'], []),
+            }
+            for department in get_departments(session)
+        ],
+        'other_positions': positions.get(NO_DEPARTMENT, []),
+    }
@@ -0,0 +1,199 @@
+import sys
+import argparse
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import select, insert, delete, func, case, literal, union, exists
+from tables import *
+from counters import increment
+
+# Headcount, salaries and payroll cost by department and position, for the dashboard.
+# The totals are stored (PositionRollup, PayrollRollup) and moved by the write paths of interactions.py
+# in the same transaction as the change, with atomic "INSERT ... ON DUPLICATE KEY / ON CONFLICT UPDATE
+# x = x + delta" statements, so the dashboard reads a few hundred rows and adds nothing up.
+#
+# Rollup keys (department_id, position_id):
+#   (0, 0)                 -> the whole company, every employee once
+#   (department, 0)        -> employees with any position in the department, each counted once
+#   (department, position) -> employees in that position (department 0 for positions without one)
+#   (0, -1)                -> employees without a position
+# An employee with positions in two departments counts in both, and once in the company row.
+# Payroll cost is by the employee's current positions: when they change, the past remunerations move with the employee.
+#
+# Usage (from project/backend/):
+#   python rollups.py rebuild [--dry-run]   -> recompute every rollup from the tables and fix the drift
+
+NO_DEPARTMENT = 0
+WHOLE_DEPARTMENT = 0  # position_id of the department rows
+COMPANY = (NO_DEPARTMENT, WHOLE_DEPARTMENT)
+UNASSIGNED = (NO_DEPARTMENT, -1)
+
+
+def employee_keys(session, employee_id):
+    """Rollup keys an employee counts in, from their positions."""
+    positions = session.execute(
+        select(EmployeePosition.position_id, JobPosition.department_id)
+        .join(JobPosition, EmployeePosition.position_id == JobPosition.id)
+        .where(EmployeePosition.employee_id == employee_id)
+    ).all()
+    if not positions:
+        return {COMPANY, UNASSIGNED}
+    keys = {COMPANY}
+    for position_id, department_id in positions:
+        keys.add((department_id or NO_DEPARTMENT, position_id))
+        if department_id:
+            keys.add((department_id, WHOLE_DEPARTMENT))
+    return keys
+
+
+def count_employees(session, keys, headcount, active, salary_total):
+    """Add employees (negative numbers to remove them) to the rollups of keys. Doesn't commit."""
+    increment(session, PositionRollup, [
+        {'department_id': department_id, 'position_id': position_id,
+         'headcount': headcount, 'active': active, 'active_salary_total': salary_total}
+        for department_id, position_id in keys
+    ])
+
+
+def count_new_employees(session, count, salary_total):
+    """New employees (active, no position yet). Doesn't commit."""
+    count_employees(session, {COMPANY, UNASSIGNED}, count, count, salary_total)
+
+
+def count_deactivation(session, employee):
+    """An active employee becoming inactive. Doesn't commit."""
+    count_employees(session, employee_keys(session, employee.id), 0, -1, -(employee.salary or 0))
+
+
+def count_position_change(session, employee, old_keys):
+    """Move an employee from the rollups of old_keys to those of their current positions. Doesn't commit."""
+    new_keys = employee_keys(session, employee.id)
+    active = 1 if employee.active_employee else 0
+    salary = (employee.salary or 0) if active else 0
+    count_employees(session, new_keys - old_keys, 1, active, salary)
+    count_employees(session, old_keys - new_keys, -1, -active, -salary)
+
+    # Payroll cost is by current position too, so the employee's past remunerations move with them
+    months = session.execute(
+        select(Remuneration.period, func.count(), func.sum(Remuneration.gross_amount))
+        .where(Remuneration.employee_id == employee.id, Remuneration.period.is_not(None))
+        .group_by(Remuneration.period)
+    ).all()
+    for keys, sign in [(new_keys - old_keys, 1), (old_keys - new_keys, -1)]:
+        increment(session, PayrollRollup, [
+            {'period': period, 'department_id': department_id, 'position_id': position_id,
+             'remunerations': sign * count, 'gross_total': sign * (gross_total or 0)}
+            for period, count, gross_total in months
+            for department_id, position_id in keys
+        ])
+
+
+def count_remuneration(session, remuneration):
+    """A new remuneration, added to the payroll cost of its period. Doesn't commit."""
+    increment(session, PayrollRollup, [
+        {'period': remuneration.period, 'department_id': department_id, 'position_id': position_id,
+         'remunerations': 1, 'gross_total': remuneration.gross_amount or 0}
+        for department_id, position_id in employee_keys(session, remuneration.employee_id)
+    ])
+
+
+# REBUILD ------------------------------------------------------------------------------------------------|
+def keys_subquery():
+    """(employee_id, department_id, position_id) of every rollup key of every employee, as SQL."""
+    company = select(Employee.id.label('employee_id'), literal(COMPANY[0]).label('department_id'),
+                     literal(COMPANY[1]).label('position_id'))
+    in_position = select(EmployeePosition.employee_id, func.coalesce(JobPosition.department_id, NO_DEPARTMENT),
+                         EmployeePosition.position_id) \
+        .join(JobPosition, EmployeePosition.position_id == JobPosition.id)
+    in_department = select(EmployeePosition.employee_id, JobPosition.department_id, literal(WHOLE_DEPARTMENT)) \
+        .join(JobPosition, EmployeePosition.position_id == JobPosition.id) \
+        .where(JobPosition.department_id.is_not(None))
+    without_position = select(Employee.id, literal(UNASSIGNED[0]), literal(UNASSIGNED[1])) \
+        .where(~exists().where(EmployeePosition.employee_id == Employee.id))
+    # UNION (not UNION ALL) counts an employee once per key
+    return union(company, in_position, in_department, without_position).subquery()
+
+
+def position_rows(session):
+    """PositionRollup rows computed from the tables."""
+    keys = keys_subquery()
+    active = Employee.active_employee == True
+    return [
+        {'department_id': row[0], 'position_id': row[1], 'headcount': row[2], 'active': int(row[3] or 0),
+         'active_salary_total': Decimal(row[4] or 0)}
+        for row in session.execute(
+            select(keys.c.department_id, keys.c.position_id, func.count(), func.sum(case((active, 1), else_=0)),
+                   func.sum(case((active, Employee.salary), else_=0)))
+            .join(Employee, Employee.id == keys.c.employee_id)
+            .group_by(keys.c.department_id, keys.c.position_id)
+        )
+    ]
+
+
+def payroll_rows(session, period=None):
+    """PayrollRollup rows computed from the tables (of one period, or all of them)."""
+    keys = keys_subquery()
+    query = select(Remuneration.period, keys.c.department_id, keys.c.position_id, func.count(), func.sum(Remuneration.gross_amount)) \
+        .join(keys, keys.c.employee_id == Remuneration.employee_id) \
+        .where(Remuneration.period.is_not(None)) \
+        .group_by(Remuneration.period, keys.c.department_id, keys.c.position_id)
+    if period is not None:
+        query = query.where(Remuneration.period == period)
+    return [
+        {'period': row[0], 'department_id': row[1], 'position_id': row[2], 'remunerations': row[3],
+         'gross_total': Decimal(row[4] or 0)}
+        for row in session.execute(query)
+    ]
+
+
+def replace_rows(session, model, rows, condition=None):
+    """Replace the rows of a rollup table (those matching condition). Returns how many rows differed."""
+    table = model.__table__
+    keys = [column.name for column in table.primary_key.columns]
+    values = [column.name for column in table.columns if column.name not in keys and column.name != 'updated_at']
+    stored_query = select(table)
+    if condition is not None:
+        stored_query = stored_query.where(condition)
+    stored = {tuple(row[key] for key in keys): tuple(row[name] for name in values) for row in session.execute(stored_query).mappings()}
+    fresh = {tuple(row[key] for key in keys): tuple(row[name] for name in values) for row in rows}
+    # A row that was counted down to zero is the same as a missing one
+    zero = (0,) * len(values)
+    differences = sum(1 for key in stored.keys() | fresh.keys() if stored.get(key, zero) != fresh.get(key, zero))
+
+    session.execute(delete(table).where(condition) if condition is not None else delete(table))
+    if rows:
+        now = datetime.now()
+        session.execute(insert(table), [dict(row, updated_at=now) for row in rows])
+    return differences
+
+
+def rebuild_payroll_period(session, period):
+    """Recompute the payroll rollup of one period (after a payroll run). Doesn't commit."""
+    return replace_rows(session, PayrollRollup, payroll_rows(session, period), PayrollRollup.period == period)
+
+
+def rebuild(session, dry_run=False):
+    """Recompute every rollup from the tables in one transaction. Returns the number of rows that differed, by table."""
+    differences = {
+        'PositionRollup': replace_rows(session, PositionRollup, position_rows(session)),
+        'PayrollRollup': replace_rows(session, PayrollRollup, payroll_rows(session)),
+    }
+    if dry_run:
+        session.rollback()
+    else:
+        session.commit()
+    return differences
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Department and position rollups.')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    run = subcommands.add_parser('rebuild', help='Recompute every rollup and fix the rows that drifted')
+    run.add_argument('--dry-run', action='store_true', help='Only count the rows that differ')
+    args = parser.parse_args()
+
+    from database import Session
+    with Session() as session:
+        differences = rebuild(session, args.dry_run)
+    for table, count in differences.items():
+        print(f"{table}: {count} rows {'differ' if args.dry_run else 'fixed'}")
+    sys.exit(1 if args.dry_run and any(differences.values()) else 0)
@@ -0,0 +1,405 @@
+import sys
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import create_engine, event, func, inspect, text, select, update, bindparam
+from database import config, server_url, database_url, engine, Session
+from tables import *
+
+# Usage (from project/backend/):
+#   python schema.py bootstrap   -> create the database and tables, or migrate them if they already exist
+#   python schema.py migrate     -> apply the pending migrations
+#   python schema.py status      -> show the current schema version
+#   python schema.py check-indexes -> EXPLAIN every query of queries.py and report the ones without an index
+#   python schema.py reindex-search -> rebuild the employee search index (after loading employees outside the app)
+
+
+# MIGRATIONS ------------------------------------------------------------------------------------------------|
+def find_index(name):
+    """Get an index declared in tables.py by name."""
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise KeyError(f"No index named {name} in tables.py")
+
+
+def create_index_online(connection, index):
+    """Create an index without blocking writes (MySQL online DDL); other databases just create it."""
+    if connection.dialect.name != 'mysql':
+        index.create(connection)
+        return
+    columns = ', '.join(f'`{column.name}`' for column in index.columns)
+    unique = 'UNIQUE ' if index.unique else ''
+    connection.execute(text(
+        f"CREATE {unique}INDEX `{index.name}` ON `{index.table.name}` ({columns}) ALGORITHM=INPLACE LOCK=NONE"
+    ))
+
+
+def add_indexes(*names):
+    """Migration that adds the given indexes, skipping the ones that already exist."""
+    def migration(connection):
+        inspector = inspect(connection)
+        for name in names:
+            index = find_index(name)
+            existing = {i['name'] for i in inspector.get_indexes(index.table.name)}
+            if name in existing:
+                continue
+            if index.unique:
+                check_no_duplicates(connection, index)
+            create_index_online(connection, index)
+            print(f"  Created index {name} on {index.table.name}")
+    return migration
+
+
+def add_columns(*names):
+    """Migration that adds the given columns ('Table.column', declared in tables.py), skipping the ones that exist."""
+    def migration(connection):
+        inspector = inspect(connection)
+        for name in names:
+            table_name, column_name = name.split('.')
+            column = Base.metadata.tables[table_name].columns[column_name]
+            if column_name in {c['name'] for c in inspector.get_columns(table_name)}:
+                continue
+            column_type = column.type.compile(connection.dialect)
+            online = ', ALGORITHM=INPLACE, LOCK=NONE' if connection.dialect.name == 'mysql' else ''
+            connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}{online}"))
+            print(f"  Added column {name}")
+    return migration
+
+
+def create_tables(*names):
+    """Migration that creates the given tables (declared in tables.py), skipping the ones that exist."""
+    def migration(connection):
+        for name in names:
+            Base.metadata.tables[name].create(connection, checkfirst=True)
+    return migration
+
+
+def all_of(*migrations):
+    """Migration made of several steps, applied in order."""
+    def migration(connection):
+        for step in migrations:
+            step(connection)
+    return migration
+
+
+def check_no_duplicates(connection, index):
+    """Stop before creating a unique index over duplicated values, and show them."""
+    columns = ', '.join(column.name for column in index.columns)
+    duplicates = connection.execute(text(
+        f"SELECT {columns}, COUNT(*) FROM {index.table.name} GROUP BY {columns} HAVING COUNT(*) > 1"
+    )).all()
+    if duplicates:
+        raise RuntimeError(f"Can't create {index.name}, duplicated values: {[tuple(row) for row in duplicates]}")
+
+
+def create_search_index(connection):
+    """Create the employee search index and fill it from the Employee table."""
+    from search import rebuild_search_index
+    EmployeeSearchToken.__table__.create(connection, checkfirst=True)
+    with Session(bind=connection) as session:
+        print(f"  Indexed {rebuild_search_index(session)} employees for search")
+
+
+def create_vacation_ledger(connection):
+    """Create the vacation ledger and open every employee's balance from the last recorded vacation."""
+    from vacation_ledger import accrue_balances
+    VacationLedger.__table__.create(connection, checkfirst=True)
+    VacationBalance.__table__.create(connection, checkfirst=True)
+    with Session(bind=connection) as session:
+        summary = accrue_balances(session)
+        print(f"  Opened {summary['opened']} vacation balances")
+
+
+def create_current_contracts(connection):
+    """Create the current contract pointers and fill them from the Contract table."""
+    from current_contracts import reconcile
+    CurrentContract.__table__.create(connection, checkfirst=True)
+    with Session(bind=connection) as session:
+        print(f"  Pointed {reconcile(session)['added']} employees at their current contract")
+
+
+def create_rollups(connection):
+    """Create the department and position rollups and compute them from the tables."""
+    from rollups import rebuild
+    PositionRollup.__table__.create(connection, checkfirst=True)
+    PayrollRollup.__table__.create(connection, checkfirst=True)
+    with Session(bind=connection) as session:
+        rebuild(session)
+        print(f"  Computed {session.query(PositionRollup).count()} department and position rollups")
+
+
+def create_table_versions(connection):
+    """Create the table versions, every table starting at version 1."""
+    from table_versions import utc_now
+    TableVersion.__table__.create(connection, checkfirst=True)
+    now = utc_now()
+    connection.execute(TableVersion.__table__.insert(), [
+        {'table_name': name, 'version': 1, 'updated_at': now} for name in Base.metadata.tables
+    ])
+
+
+def create_payroll_runs(connection):
+    """
+    Record a payroll run for every month that has remunerations, and point them at it. The rows of the
+    runs and the remunerations added by hand couldn't be told apart before, so all of them are attached.
+    """
+    PayrollRun.__table__.create(connection, checkfirst=True)
+    add_columns('Remuneration.payroll_run_id')(connection)
+    add_indexes('ix_remuneration_payroll_run')(connection)
+    with Session(bind=connection) as session:
+        months = session.query(Remuneration.period, func.count()).filter(Remuneration.period.is_not(None)) \
+            .group_by(Remuneration.period).all()
+        for period, employees in months:
+            run = PayrollRun(period=period, employees=employees, ran_at=datetime.now())
+            session.add(run)
+            session.flush()
+            session.query(Remuneration).filter(Remuneration.period == period) \
+                .update({'payroll_run_id': run.id}, synchronize_session=False)
+        session.commit()
+        print(f"  Recorded {len(months)} payroll runs")
+
+
+def table_versions_in_utc(connection):
+    """Convert the table version timestamps, written in this host's local time until now, to UTC."""
+    rows = connection.execute(select(TableVersion.table_name, TableVersion.updated_at)
+                              .where(TableVersion.updated_at.is_not(None))).all()
+    connection.execute(update(TableVersion).where(TableVersion.table_name == bindparam('name')), [
+        {'name': name, 'updated_at': updated_at.astimezone(timezone.utc).replace(tzinfo=None)} for name, updated_at in rows
+    ])
+    print(f"  Converted {len(rows)} table version timestamps to UTC")
+
+
+# Versioned migrations, applied in order: (version, description, function(connection))
+# A fresh database created by bootstrap already matches the models, so it is stamped with the last version.
+MIGRATIONS = [
+    (1, "Indexes for RUT lookups, status filter, current contract, foreign keys and listing sorts", add_indexes(
+        'ux_employee_rut', 'ix_employee_active', 'ix_employee_last_name', 'ix_employee_afp', 'ix_employee_health_plan',
+        'ix_contract_employee_start', 'ix_contract_start_date',
+        'ix_employee_position_position', 'ix_job_position_department',
+        'ix_vacation_employee_start', 'ix_vacation_start_date',
+        'ix_evaluation_employee', 'ix_evaluation_date',
+        'ix_training_employee', 'ix_training_date',
+        'ix_remuneration_employee', 'ix_remuneration_afp', 'ix_remuneration_health_plan',
+        'ix_fonasa_health_plan', 'ix_isapre_health_plan', 'ix_company_name',
+    )),
+    (2, "Accent-insensitive employee search index", create_search_index),
+    (3, "Payroll period of remunerations", all_of(
+        add_columns('Remuneration.period'), add_indexes('ix_remuneration_period_employee'),
+    )),
+    (4, "Vacation ledger and balances", create_vacation_ledger),
+    (5, "Interval index of vacations", add_indexes('ix_vacation_start_end')),
+    (6, "Contract expiry index and notifications", all_of(
+        add_indexes('ix_contract_end_date'), create_tables('ContractExpiryNotification'),
+    )),
+    (7, "Current contract of each employee", create_current_contracts),
+    (8, "Department and position rollups", create_rollups),
+    (9, "Table versions for the ETags of the pages", create_table_versions),
+    (10, "Payroll runs, apart from the remunerations added by hand", create_payroll_runs),
+    (11, "Table version timestamps in UTC", table_versions_in_utc),
+    (12, "Indexes of a payroll run's remunerations by AFP and health plan", add_indexes(
+        'ix_remuneration_run_afp', 'ix_remuneration_run_health_plan',
+    )),
+]
+
+
+def create_database():
+    """Create the MySQL database if it doesn't exist."""
+    if not database_url.startswith('mysql'):
+        return
+    # Short-lived server connection, only used to create the database
+    server_engine = create_engine(server_url, echo=config['echo'])
+    with server_engine.connect() as connection:
+        connection.execute(text(f"CREATE DATABASE IF NOT EXISTS {config['database_name']}"))
+    server_engine.dispose()
+
+
+def current_version(connection):
+    """Get the last applied migration version (0 if none)."""
+    version = connection.execute(text("SELECT MAX(version) FROM SchemaVersion")).scalar()
+    return version or 0
+
+
+def record_version(connection, version, description):
+    connection.execute(SchemaVersion.__table__.insert().values(
+        version=version, description=description, applied_at=datetime.now()
+    ))
+
+
+def migrate():
+    """Apply the migrations newer than the current schema version."""
+    applied = []
+    with engine.begin() as connection:
+        SchemaVersion.__table__.create(connection, checkfirst=True)
+        version = current_version(connection)
+    for number, description, migration in MIGRATIONS:
+        if number <= version:
+            continue
+        # One transaction per migration, so a failure keeps the previous ones recorded
+        with engine.begin() as connection:
+            migration(connection)
+            record_version(connection, number, description)
+        applied.append(number)
+        print(f"Applied migration {number}: {description}")
+    return applied
+
+
+def bootstrap():
+    """Create the database and tables on a new server, or migrate an existing schema."""
+    create_database()
+    existing_tables = inspect(engine).get_table_names()
+    if 'Employee' in existing_tables:
+        # Add the tables created since, then bring the old ones up to date
+        Base.metadata.create_all(engine)
+        return migrate()
+
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for number, description, _ in MIGRATIONS:
+            record_version(connection, number, description)
+    print(f"Created schema at version {MIGRATIONS[-1][0] if MIGRATIONS else 0}")
+    return []
+
+
+def status():
+    """Print the applied and pending migrations."""
+    with engine.connect() as connection:
+        version = current_version(connection) if inspect(connection).has_table('SchemaVersion') else 0
+    print(f"Schema version: {version}")
+    for number, description, _ in MIGRATIONS:
+        print(f"  {number} {'applied' if number <= version else 'pending'}: {description}")
+
+
+# INDEX CHECK ------------------------------------------------------------------------------------------------|
+# Small catalog tables; reading them whole is cheaper than any index
+REFERENCE_TABLES = {'AFP', 'HealthPlan', 'Fonasa', 'Isapre', 'Department', 'JobPosition', 'Company',
+                    'PositionRollup'}  # One row per position, read whole by the dashboard
+
+
+def derived(table):
+    """A subquery's result (anon_1, <derived2>): it is read whole once made, the reads that make it have their own plan rows."""
+    return table.startswith(('anon_', '<derived'))
+
+
+def query_checks(session):
+    """Calls to every function of queries.py, with arguments taken from the first employee."""
+    import queries
+    employee = session.query(Employee).order_by(Employee.id).first()
+    position = session.query(JobPosition).order_by(JobPosition.id).first()
+    if not employee or not position:
+        raise RuntimeError("check-indexes needs data: load the database first")
+    return {
+        'all_afps': lambda: queries.all_afps(session),
+        'all_health_plans': lambda: queries.all_health_plans(session),
+        'all_companies': lambda: queries.all_companies(session, sort='name'),
+        'search_employee_by_name_or_rut': lambda: queries.search_employee_by_name_or_rut(f'{employee.first_name} {employee.last_name}', session),
+        'aditional_info': lambda: queries.aditional_info(session, employee.id),
+        # The query behind employee_profile (which is cached, so a second call wouldn't reach the database)
+        'load_employee_profile': lambda: queries.load_employee_profile(session, employee.id),
+        'all_employees': lambda: queries.all_employees(session, sort='last_name'),
+        'general_info': lambda: queries.general_info(session, employee.id),
+        'get_filtered_employees': lambda: queries.get_filtered_employees(session, status='1', sort='last_name'),
+        'get_filtered_employees (position)': lambda: queries.get_filtered_employees(session, job_position_id=position.id),
+        'get_filtered_employees (department)': lambda: queries.get_filtered_employees(session, department_id=position.department_id),
+        'get_employees_by_department': lambda: queries.get_employees_by_department(session, position.department_id),
+        'get_employee_name_by_rut': lambda: queries.get_employee_name_by_rut(session, employee.rut),
+        'get_employee_id_by_rut': lambda: queries.get_employee_id_by_rut(session, employee.rut),
+        'get_job_positions': lambda: queries.get_job_positions(session),
+        'get_departments': lambda: queries.get_departments(session),
+        'department_info': lambda: queries.department_info(session, position.department_id),
+        'get_all_evaluations': lambda: queries.get_all_evaluations(session, sort='date'),
+        'get_all_trainings': lambda: queries.get_all_trainings(session, sort='date'),
+        'all_vacations': lambda: queries.all_vacations(session, sort='start_date'),
+        'employees_on_vacation': lambda: queries.employees_on_vacation(session, date.today() - timedelta(days=30), date.today()),
+        'find_overlapping_vacation': lambda: queries.find_overlapping_vacation(session, employee.id, date.today(), date.today()),
+        'all_remunerations': lambda: queries.all_remunerations(session, sort='employee'),
+        'get_contract_by_employee_id': lambda: queries.get_contract_by_employee_id(session, employee.id),
+        'all_contracts': lambda: queries.all_contracts(session, sort='start_date'),
+        'get_contract_info': lambda: queries.get_contract_info(session, employee.id),
+        'contract_history': lambda: queries.contract_history(session, employee.id),
+        'expiring_contracts': lambda: queries.expiring_contracts(session, 90),
+        'contract_expiry_summary': lambda: queries.contract_expiry_summary(session),
+        'department_dashboard': lambda: queries.department_dashboard(session),
+    }
+
+
+def full_scans(connection, statement, parameters):
+    """Tables the statement reads without an index (besides the reference tables)."""
+    scans = []
+    if connection.dialect.name == 'mysql':
+        plan = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters).mappings().all()
+        for row in plan:
+            if row['type'] == 'ALL' and row['table'] not in REFERENCE_TABLES and not derived(row['table']):
+                scans.append(row['table'])
+    elif connection.dialect.name == 'sqlite':
+        plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        sorts_everything = any('TEMP B-TREE' in row[-1] for row in plan)
+        for row in plan:
+            detail = row[-1]
+            if not detail.startswith('SCAN ') or 'INDEX' in detail or 'PRIMARY KEY' in detail:
+                continue
+            if detail == 'SCAN CONSTANT ROW':  # A SELECT without FROM, e.g. of scalar subqueries
+                continue
+            table = detail.split()[1]
+            # A scan in rowid order that feeds ORDER BY ... LIMIT (keyset pages) stops after one page
+            in_order = ' ORDER BY ' in statement and ' LIMIT ' in statement and not sorts_everything
+            if table in REFERENCE_TABLES or derived(table) or in_order:
+                continue
+            scans.append(table)
+    return scans
+
+
+def check_indexes():
+    """
+    Run every query of queries.py, EXPLAIN the SQL it sends and list the tables read without an index.
+    Run it on a database with realistic data: on tiny tables MySQL prefers full scans anyway.
+    """
+    session = Session()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    checks = query_checks(session)
+    problems = 0
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        for name, call in checks.items():
+            statements.clear()
+            call()
+            captured = list(statements)
+            statements.clear()
+            scans = []
+            with engine.connect() as connection:
+                for statement, parameters in captured:
+                    scans += full_scans(connection, statement, parameters)
+            if scans:
+                problems += 1
+                print(f"NO INDEX  {name}: full scan of {', '.join(sorted(set(scans)))}")
+            else:
+                print(f"ok        {name}")
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+        session.close()
+    print(f"{problems} of {len(checks)} queries read a table without an index")
+    return problems
+
+
+def reindex_search():
+    """Rebuild the employee search index."""
+    from search import rebuild_search_index
+    with Session() as session:
+        print(f"Indexed {rebuild_search_index(session)} employees for search")
+
+
+if __name__ == '__main__':
+    commands = {
+        'bootstrap': bootstrap, 'migrate': migrate, 'status': status,
+        'check-indexes': check_indexes, 'reindex-search': reindex_search,
+    }
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        print(f"Usage: python schema.py [{'|'.join(commands)}]")
+        sys.exit(1)
+    result = commands[sys.argv[1]]()
+    if sys.argv[1] == 'check-indexes' and result:
+        sys.exit(1)
@@ -0,0 +1,170 @@
+import os
+import re
+import unicodedata
+from sqlalchemy import select, func, case, and_
+from tables import *
+
+# Employee search behind the topbar.
+# Every word of an employee's first name, last name and RUT is stored accent-folded and in
+# lowercase in EmployeeSearchToken, so "gonzalez" finds "González" and a search term is an
+# index range (token >= 'gonz' AND token < 'gop') instead of a LIKE '%...%' table scan.
+# The work of a query is bounded: its candidates are at most MAX_CANDIDATES matches of its most
+# selective term, read in index order, and the other terms are checked against their tokens only.
+# When that term matches more, the results say so (truncated), instead of silently missing employees.
+
+SEARCH_PAGE_SIZE = 20
+MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', 500))
+
+# Score of a term matching a token
+SCORE_RUT = 10
+SCORE_EXACT = 3
+SCORE_PREFIX = 2
+
+# The only characters of a token, in the order both MySQL and SQLite sort them
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def normalize(text):
+    """Lowercase and remove accents: 'González' -> 'gonzalez'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def normalize_rut(rut):
+    """Keep only digits and the check digit: '12.345.678-K' -> '12345678k'."""
+    return re.sub(r'[^0-9k]', '', normalize(rut))
+
+
+def words(text):
+    return [word[:50] for word in re.split(r'[^0-9a-z]+', normalize(text)) if word]
+
+
+def prefix_upper_bound(prefix):
+    """Smallest string after every token that starts with prefix ('gonz' -> 'gop'), None if there is none."""
+    for i in range(len(prefix) - 1, -1, -1):
+        position = ALPHABET.find(prefix[i])
+        if position < len(ALPHABET) - 1:
+            return prefix[:i] + ALPHABET[position + 1]
+    return None
+
+
+def starts_with(prefix):
+    """Index range condition for the tokens that start with prefix."""
+    condition = EmployeeSearchToken.token >= prefix
+    upper_bound = prefix_upper_bound(prefix)
+    if upper_bound:
+        condition = condition & (EmployeeSearchToken.token < upper_bound)
+    return condition
+
+
+def employee_tokens(employee):
+    """(token, field) pairs of an employee."""
+    tokens = {(word, 'first_name') for word in words(employee.first_name)}
+    tokens |= {(word, 'last_name') for word in words(employee.last_name)}
+    rut = normalize_rut(employee.rut)
+    if rut:
+        tokens.add((rut, 'rut'))
+    return tokens
+
+
+def index_employee(session, employee):
+    """Replace the search tokens of an employee. Doesn't commit: call it in the transaction that changes the employee."""
+    session.query(EmployeeSearchToken).filter_by(employee_id=employee.id).delete(synchronize_session=False)
+    session.add_all([
+        EmployeeSearchToken(token=token, employee_id=employee.id, field=field)
+        for token, field in employee_tokens(employee)
+    ])
+
+
+def rebuild_search_index(session, batch_size=5000):
+    """Rebuild the whole search index from the Employee table. Returns the number of employees indexed."""
+    session.query(EmployeeSearchToken).delete(synchronize_session=False)
+    count = 0
+    last_id = 0
+    while True:
+        employees = session.query(Employee.id, Employee.first_name, Employee.last_name, Employee.rut) \
+            .filter(Employee.id > last_id).order_by(Employee.id).limit(batch_size).all()
+        if not employees:
+            break
+        session.bulk_insert_mappings(EmployeeSearchToken, [
+            {'token': token, 'employee_id': employee.id, 'field': field}
+            for employee in employees
+            for token, field in employee_tokens(employee)
+        ])
+        count += len(employees)
+        last_id = employees[-1].id
+    session.commit()
+    return count
+
+
+def match_count(term, limit):
+    """Number of tokens that start with term, counted up to limit (a read of at most limit index entries), as a scalar subquery."""
+    matches = select(EmployeeSearchToken.employee_id).where(starts_with(term)).limit(limit).subquery()
+    return select(func.count()).select_from(matches).scalar_subquery()
+
+
+def search_employees(session, search_query, page=1, page_size=SEARCH_PAGE_SIZE):
+    """
+    Search employees by name and/or RUT, best matches first.
+    Every word of the query must match the start of a word of the name (or the RUT).
+    Ties are ordered by the matched words, so 'gonz' lists 'gonzalez' before 'gonzalo'.
+    Returns (employees, has_more, truncated), where employees is one page of dicts and truncated
+    tells that the most selective term matched more than MAX_CANDIDATES words, so only the first
+    MAX_CANDIDATES of them (exact matches first) were ranked.
+    """
+    terms = words(search_query)
+    # A RUT typed with dots and dash is split into several words; search it as one
+    if normalize_rut(search_query) and re.fullmatch(r'[0-9.\-kK ]+', search_query.strip()):
+        terms = [normalize_rut(search_query)]
+    if not terms:
+        return [], False, False
+
+    # The candidates come from the term with the fewest matches, in index order: the exact matches
+    # are the smallest tokens of their range, so they are never the ones left out
+    counts = session.execute(select(*[match_count(term, MAX_CANDIDATES + 1) for term in terms])).one()
+    driver = terms[counts.index(min(counts))]
+    if not min(counts):
+        return [], False, False
+    truncated = min(counts) > MAX_CANDIDATES
+    candidates = select(EmployeeSearchToken.employee_id).where(starts_with(driver)) \
+        .order_by(EmployeeSearchToken.token, EmployeeSearchToken.employee_id).limit(MAX_CANDIDATES)
+
+    # Every term is checked against the tokens of the candidates only (read through ix_search_token_employee):
+    # its best score and, through min(token), the token of that score, NULL if it matches none of them
+    token = EmployeeSearchToken.token
+    scores, tokens = [], []
+    for term in terms:
+        match = starts_with(term)
+        scores.append(func.max(case(
+            (and_(EmployeeSearchToken.field == 'rut', token == term), SCORE_RUT),
+            (token == term, SCORE_EXACT),
+            (match, SCORE_PREFIX),
+        )))
+        tokens.append(func.min(case((match, token))))
+    score = sum(scores[1:], scores[0])
+    ranked = select(EmployeeSearchToken.employee_id, score.label('score')) \
+        .where(EmployeeSearchToken.employee_id.in_(candidates.scalar_subquery())) \
+        .group_by(EmployeeSearchToken.employee_id) \
+        .having(and_(*[term_score.is_not(None) for term_score in scores])) \
+        .order_by(score.desc(), *tokens, EmployeeSearchToken.employee_id) \
+        .offset((max(page, 1) - 1) * page_size).limit(page_size + 1)  # One more row tells if there is a next page
+    rows = session.execute(ranked).all()
+
+    # Only the employees of the page are read
+    page_scores = {row.employee_id: row.score for row in rows[:page_size]}
+    employees = {
+        employee.id: employee
+        for employee in session.query(Employee.id, Employee.rut, Employee.first_name, Employee.last_name, Employee.active_employee)
+        .filter(Employee.id.in_(page_scores))
+    } if page_scores else {}
+    return [
+        {
+            'id': employee_id,
+            'rut': employees[employee_id].rut,
+            'first_name': employees[employee_id].first_name,
+            'last_name': employees[employee_id].last_name,
+            'active': employees[employee_id].active_employee,
+            'score': score,
+        }
+        for employee_id, score in page_scores.items() if employee_id in employees
+    ], len(rows) > page_size, truncated
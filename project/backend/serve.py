@@ -0,0 +1,82 @@
+import os
+import gc
+import argparse
+from gunicorn.app.base import BaseApplication
+from database import engine, Session
+from async_db import async_database
+from app import create_app, precompile_templates
+from queries import (get_departments, get_job_positions, all_afps, all_health_plans, longest_vacation,
+                     contract_expiry_summary)
+
+# Production server: gunicorn with several worker processes of several threads each.
+# The app is created and warmed up once in the master process (templates compiled, reference data
+# cached), then gc.freeze() moves everything allocated so far out of the garbage collector's reach,
+# so the collections of the workers don't write to those pages and they stay shared copy-on-write.
+# A forked worker drops the engine's pool it inherited (engine.dispose(close=False)) and opens its
+# own connections: a pooled socket used by two processes mixes their MySQL packets.
+#
+# Each worker has its own pool of DB_POOL_SIZE (+ DB_MAX_OVERFLOW) connections: keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below MySQL's max_connections, and DB_POOL_SIZE around --threads.
+#
+# Usage (from project/backend/):
+#   python serve.py [--workers 8] [--threads 4] [--bind 0.0.0.0:8000]
+#   (or WEB_WORKERS, WEB_THREADS, WEB_BIND, WEB_TIMEOUT)
+
+WORKERS = int(os.getenv('WEB_WORKERS', os.cpu_count() or 1))
+THREADS = int(os.getenv('WEB_THREADS', 4))
+BIND = os.getenv('WEB_BIND', '0.0.0.0:8000')
+TIMEOUT = int(os.getenv('WEB_TIMEOUT', 30))  # Seconds before a stuck worker is restarted
+
+
+def warm_up(app):
+    """Compile the templates and load the cached reference data, then close the connections used for it."""
+    templates = precompile_templates(app)
+    with Session() as session:
+        for load in [get_departments, get_job_positions, all_afps, all_health_plans, longest_vacation, contract_expiry_summary]:
+            load(session)
+    # No connection opened here may outlive the fork
+    engine.dispose()
+    return templates
+
+
+def post_fork(server, worker):
+    """In each new worker: forget the pools inherited from the master (their sockets are the master's)."""
+    engine.dispose(close=False)
+    async_database.after_fork()
+
+
+class Server(BaseApplication):
+    def __init__(self, app, options):
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the HR system with several worker processes.')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Worker processes (default: one per CPU)')
+    parser.add_argument('--threads', type=int, default=THREADS, help='Threads per worker')
+    parser.add_argument('--bind', default=BIND, help='Address to listen on, host:port')
+    parser.add_argument('--timeout', type=int, default=TIMEOUT, help='Seconds before a stuck worker is restarted')
+    args = parser.parse_args()
+
+    app = create_app()
+    print(f"Compiled {warm_up(app)} templates and cached the reference data")
+    gc.collect()
+    gc.freeze()
+
+    Server(app, {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'post_fork': post_fork,
+    }).run()
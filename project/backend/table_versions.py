@@ -0,0 +1,71 @@
+import os
+import hashlib
+from datetime import datetime, timezone
+from sqlalchemy import event, select
+from tables import *
+from database import Session
+from cache import TTLCache
+from counters import increment
+
+# A version counter per table (TableVersion), bumped by the write paths of interactions.py in the
+# transaction of the write, for HTTP conditional requests: a page's ETag and Last-Modified come from
+# the versions of the tables it reads (see `versioned` in app.py), so a browser that has the current
+# page gets 304 Not Modified before anything is queried or rendered.
+#
+# The versions are cached in each process for TABLE_VERSION_TTL seconds, so a revalidation doesn't
+# touch the database either. A commit that bumped a table drops it from the cache of its own process
+# at once; the other worker processes see the new version within the TTL.
+# updated_at is stored in UTC (naive), unlike the other timestamps of the database, so Last-Modified
+# doesn't depend on the time zone of the host that wrote or reads it.
+
+version_cache = TTLCache('table_versions', ttl=int(os.getenv('TABLE_VERSION_TTL', 5)))
+
+
+def utc_now():
+    """The current UTC time, naive, as TableVersion.updated_at stores it."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def bump(session, *tables):
+    """Add one to the versions of tables (models or table names). Doesn't commit."""
+    names = sorted({getattr(table, '__tablename__', table) for table in tables})
+    increment(session, TableVersion, [{'table_name': name, 'version': 1} for name in names], utc_now())
+    session.info.setdefault('bumped_tables', set()).update(names)
+
+
+@event.listens_for(Session, 'after_commit')
+def _forget_bumped_versions(session):
+    names = session.info.pop('bumped_tables', None)
+    if names:
+        version_cache.invalidate(*names)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_bumped_versions(session):
+    session.info.pop('bumped_tables', None)
+
+
+def table_version(session, name):
+    """(version, updated_at) of a table (cached); (0, None) if it was never bumped."""
+    def load():
+        row = session.execute(
+            select(TableVersion.version, TableVersion.updated_at).where(TableVersion.table_name == name)
+        ).first()
+        return tuple(row) if row else (0, None)
+    return version_cache.get_or_load(name, load)
+
+
+def versions(session, tables):
+    """Versions of tables (models), for the keys of the caches whose entries must change with them."""
+    return tuple(table_version(session, table.__tablename__)[0] for table in tables)
+
+
+def validators(session, tables, variant=''):
+    """
+    ETag and Last-Modified of a page that reads tables: the ETag hashes their versions and the variant
+    (whatever else changes the page, e.g. its query string); Last-Modified is the latest change (None if unknown).
+    """
+    versions = [(table.__tablename__, *table_version(session, table.__tablename__)) for table in tables]
+    etag = hashlib.sha1(repr(([(name, version) for name, version, _ in versions], variant)).encode()).hexdigest()
+    changes = [updated_at.replace(tzinfo=timezone.utc) for _, _, updated_at in versions if updated_at]
+    return etag, max(changes) if changes and len(changes) == len(versions) else None
@@ -1,30 +1,18 @@
-import os
-from sqlalchemy import create_engine, text, Column, Integer, String, ForeignKey, DECIMAL, Date, Text, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, DECIMAL, Date, DateTime, Text, Boolean, Index
 from sqlalchemy.orm import relationship, declarative_base
 from werkzeug.security import generate_password_hash, check_password_hash
 
-# Load the MySQL root password from environment variables
-mysql_root_password = os.getenv('MYSQL_ROOT_PASSWORD', 'default_root_pass')  # Fallback in case the env variable isn't set
-# You can set it up by doing: export MYSQL_ROOT_PASSWORD=your_secure_password
-
-config = {
-    'host': 'localhost',
-    'database_name': 'hr',
-    'user': 'root',
-    'password': mysql_root_password
-    }
-
-engine = create_engine(f'mysql+pymysql://{config["user"]}:{config["password"]}@{config["host"]}', echo=True)
-
-with engine.connect() as connection:
-    connection.execute(text("CREATE DATABASE IF NOT EXISTS hr"))
-engine = create_engine(f'mysql+pymysql://{config["user"]}:{config["password"]}@{config["host"]}/{config["database_name"]}', echo=True)
+# NOTE: importing this module doesn't touch the database.
+# The database and tables are created by schema.py (python schema.py bootstrap)
 
 Base = declarative_base()
 
 # Company model
 class Company(Base):
     __tablename__ = 'Company'
+    __table_args__ = (
+        Index('ix_company_name', 'name'),  # Sort on /companies
+    )
     id = Column(Integer, primary_key=True)
     rut = Column(String(20))  # Equivalent to 'rut'
     name = Column(String(100))
@@ -35,6 +23,13 @@ class Company(Base):
 # Employee model
 class Employee(Base):
     __tablename__ = 'Employee'
+    __table_args__ = (
+        Index('ux_employee_rut', 'rut', unique=True),  # RUT lookups, and no two employees with the same RUT
+        Index('ix_employee_active', 'active_employee', 'id'),  # Status filter on the homepage
+        Index('ix_employee_last_name', 'last_name'),
+        Index('ix_employee_afp', 'afp_id'),
+        Index('ix_employee_health_plan', 'health_plan_id'),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     rut = Column(String(20))  # Equivalent to 'rut'
     first_name = Column(String(50))
@@ -68,6 +63,9 @@ class Department(Base):
 # Position model
 class JobPosition(Base):
     __tablename__ = 'JobPosition'
+    __table_args__ = (
+        Index('ix_job_position_department', 'department_id'),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(100))
     description = Column(Text)
@@ -78,6 +76,9 @@ class JobPosition(Base):
 # EmployeePosition association table (Many-to-Many relationship between Employee and JobPosition)
 class EmployeePosition(Base):
     __tablename__ = 'EmployeePosition'
+    __table_args__ = (
+        Index('ix_employee_position_position', 'position_id'),  # The primary key starts with employee_id
+    )
     employee_id = Column(Integer, ForeignKey('Employee.id'), primary_key=True)
     position_id = Column(Integer, ForeignKey('JobPosition.id'), primary_key=True)
 
@@ -93,6 +94,11 @@ class AFP(Base):
 # Vacation model
 class Vacation(Base):
     __tablename__ = 'Vacation'
+    __table_args__ = (
+        Index('ix_vacation_employee_start', 'employee_id', 'start_date'),
+        Index('ix_vacation_start_date', 'start_date'),
+        Index('ix_vacation_start_end', 'start_date', 'end_date'),  # Who's out over a date range (see queries.py)
+    )
     id = Column(Integer, primary_key=True)
     employee_id = Column(Integer, ForeignKey('Employee.id'))
     start_date = Column(Date)
@@ -102,9 +108,36 @@ class Vacation(Base):
     long_service_employee = Column(Boolean) 
     employees = relationship('Employee', back_populates='vacations')
 
+# Vacation ledger: every change to an employee's vacation days (see vacation_ledger.py)
+class VacationLedger(Base):
+    __tablename__ = 'VacationLedger'
+    __table_args__ = (
+        Index('ix_vacation_ledger_employee', 'employee_id', 'id'),
+    )
+    id = Column(Integer, primary_key=True)
+    employee_id = Column(Integer, ForeignKey('Employee.id'), nullable=False)
+    entry_date = Column(Date)
+    kind = Column(String(20))  # 'opening', 'accrual' or 'booking'
+    days = Column(Integer, nullable=False)  # Positive for accruals, negative for bookings
+    balance = Column(Integer, nullable=False)  # Balance after the entry
+    vacation_id = Column(Integer, ForeignKey('Vacation.id'))
+    description = Column(String(200))
+
+# Current vacation balance of each employee: the sum of its VacationLedger entries
+class VacationBalance(Base):
+    __tablename__ = 'VacationBalance'
+    employee_id = Column(Integer, ForeignKey('Employee.id'), primary_key=True)
+    balance = Column(Integer, nullable=False)
+    accrued_through = Column(Date)  # Last work anniversary whose days were credited
+    updated_at = Column(DateTime)
+
 # Evaluation model
 class Evaluation(Base):
     __tablename__ = 'Evaluation'
+    __table_args__ = (
+        Index('ix_evaluation_employee', 'employee_id'),
+        Index('ix_evaluation_date', 'evaluation_date'),
+    )
     id = Column(Integer, primary_key=True)
     employee_id = Column(Integer, ForeignKey('Employee.id'))
     evaluation_date = Column(Date)
@@ -117,6 +150,10 @@ class Evaluation(Base):
 # Training model
 class Training(Base):
     __tablename__ = 'Training'
+    __table_args__ = (
+        Index('ix_training_employee', 'employee_id'),
+        Index('ix_training_date', 'training_date'),
+    )
     id = Column(Integer, primary_key=True)
     employee_id = Column(Integer, ForeignKey('Employee.id'))
     training_date = Column(Date)
@@ -129,8 +166,19 @@ class Training(Base):
 # Remuneration model
 class Remuneration(Base):
     __tablename__ = 'Remuneration'
+    __table_args__ = (
+        Index('ix_remuneration_employee', 'employee_id'),
+        Index('ix_remuneration_afp', 'afp_id'),
+        Index('ix_remuneration_health_plan', 'health_plan_id'),
+        Index('ix_remuneration_period_employee', 'period', 'employee_id'),  # Remunerations of a month
+        Index('ix_remuneration_payroll_run', 'payroll_run_id'),  # Rows of a payroll run
+        Index('ix_remuneration_run_afp', 'payroll_run_id', 'afp_id'),  # A run's rows of an AFP, after its rate changes
+        Index('ix_remuneration_run_health_plan', 'payroll_run_id', 'health_plan_id'),  # ... or of a health plan
+    )
     id = Column(Integer, primary_key=True)
     employee_id = Column(Integer, ForeignKey('Employee.id'))
+    period = Column(Date)  # First day of the month paid; NULL for rows added before payroll runs
+    payroll_run_id = Column(Integer, ForeignKey('PayrollRun.id'))  # NULL for remunerations added by hand
     afp_id = Column(Integer, ForeignKey('AFP.id'))
     health_plan_id = Column(Integer, ForeignKey('HealthPlan.id'))
     gross_amount = Column(DECIMAL(10, 2))
@@ -143,6 +191,18 @@ class Remuneration(Base):
     afps = relationship('AFP', back_populates='remunerations')
     health_plans = relationship('HealthPlan', back_populates='remunerations')
 
+# A monthly payroll run of payroll.py: its row is locked while the run replaces its remunerations
+class PayrollRun(Base):
+    __tablename__ = 'PayrollRun'
+    __table_args__ = (
+        Index('ux_payroll_run_period', 'period', unique=True),  # One run per month
+    )
+    id = Column(Integer, primary_key=True)
+    period = Column(Date, nullable=False)
+    bonus_percentage = Column(DECIMAL(5, 2))
+    employees = Column(Integer)
+    ran_at = Column(DateTime)
+
 # HealthPlan model
 class HealthPlan(Base):
     __tablename__ = 'HealthPlan'
@@ -157,6 +217,9 @@ class HealthPlan(Base):
 # Public Health model (Fonasa)
 class Fonasa(Base):
     __tablename__ = 'Fonasa'
+    __table_args__ = (
+        Index('ix_fonasa_health_plan', 'health_plan_id'),
+    )
     id = Column(Integer, primary_key=True)
     health_plan_id = Column(Integer, ForeignKey('HealthPlan.id'))
     discount = Column(DECIMAL(10, 2))  # Equivalent to 'descuento'
@@ -165,6 +228,9 @@ class Fonasa(Base):
 # PrivateHealth model (Isapre)
 class Isapre(Base):
     __tablename__ = 'Isapre'
+    __table_args__ = (
+        Index('ix_isapre_health_plan', 'health_plan_id'),
+    )
     id = Column(Integer, primary_key=True)
     health_plan_id = Column(Integer, ForeignKey('HealthPlan.id'))
     discount = Column(DECIMAL(10, 2)) 
@@ -173,6 +239,11 @@ class Isapre(Base):
 # Contract model
 class Contract(Base):
     __tablename__ = 'Contract'
+    __table_args__ = (
+        Index('ix_contract_employee_start', 'employee_id', 'start_date'),  # Current contract of an employee
+        Index('ix_contract_start_date', 'start_date'),
+        Index('ix_contract_end_date', 'end_date', 'employee_id'),  # Expiring contracts (see expiring_contracts in queries.py)
+    )
     id = Column(Integer, primary_key=True)
     employee_id = Column(Integer, ForeignKey('Employee.id'))
     contract_type = Column(String(50))  # Fixed, temporary, replacement, permanent (contrata, suplencia, reemplazo, planta)
@@ -182,4 +253,73 @@ class Contract(Base):
     registration_date = Column(Date)
     employees = relationship('Employee', back_populates='contracts')  # Relationship to Employee
 
-Base.metadata.create_all(engine)
+# Current contract of each employee (the one with the latest start), kept by add_contract and
+# reconciled nightly by current_contracts.py, so it is a join instead of a sort of the employee's contracts
+class CurrentContract(Base):
+    __tablename__ = 'CurrentContract'
+    __table_args__ = (
+        Index('ux_current_contract_contract', 'contract_id', unique=True),  # Is a contract the current one
+    )
+    employee_id = Column(Integer, ForeignKey('Employee.id'), primary_key=True)
+    contract_id = Column(Integer, ForeignKey('Contract.id'), nullable=False)
+    updated_at = Column(DateTime)
+
+# Contracts found expiring by the scan of contract_expiry.py: one row per contract and horizon reached
+class ContractExpiryNotification(Base):
+    __tablename__ = 'ContractExpiryNotification'
+    __table_args__ = (
+        Index('ux_contract_expiry_contract_horizon', 'contract_id', 'horizon', unique=True),  # A scan doesn't repeat them
+        Index('ix_contract_expiry_end_date', 'end_date'),
+    )
+    id = Column(Integer, primary_key=True)
+    contract_id = Column(Integer, ForeignKey('Contract.id'), nullable=False)
+    employee_id = Column(Integer, ForeignKey('Employee.id'))
+    department_id = Column(Integer, ForeignKey('Department.id'))
+    end_date = Column(Date)
+    horizon = Column(Integer)  # 30, 60 or 90: the contract ends within that many days of the scan
+    created_at = Column(DateTime)
+
+# Headcount and salaries by department and position, kept up to date by the writes (see rollups.py).
+# No foreign keys: 0 stands for "the whole department" (position_id) and "no department" (department_id)
+class PositionRollup(Base):
+    __tablename__ = 'PositionRollup'
+    department_id = Column(Integer, primary_key=True)
+    position_id = Column(Integer, primary_key=True)
+    headcount = Column(Integer, nullable=False, default=0)
+    active = Column(Integer, nullable=False, default=0)
+    active_salary_total = Column(DECIMAL(14, 2), nullable=False, default=0)  # Sum of the salaries of the active employees
+    updated_at = Column(DateTime)
+
+# Payroll cost by month, department and position (see rollups.py)
+class PayrollRollup(Base):
+    __tablename__ = 'PayrollRollup'
+    period = Column(Date, primary_key=True)
+    department_id = Column(Integer, primary_key=True)
+    position_id = Column(Integer, primary_key=True)
+    remunerations = Column(Integer, nullable=False, default=0)
+    gross_total = Column(DECIMAL(16, 2), nullable=False, default=0)
+    updated_at = Column(DateTime)
+
+# Search index of employees: one row per accent-folded, lowercase word of the name or the RUT (see search.py)
+class EmployeeSearchToken(Base):
+    __tablename__ = 'EmployeeSearchToken'
+    token = Column(String(50), primary_key=True)  # The primary key starts with token, so prefix searches are index ranges
+    employee_id = Column(Integer, ForeignKey('Employee.id'), primary_key=True)
+    field = Column(String(10), primary_key=True)  # 'first_name', 'last_name' or 'rut'
+    __table_args__ = (
+        Index('ix_search_token_employee', 'employee_id'),
+    )
+
+# Version of each table, bumped by every write to it, for the ETags of the pages (see table_versions.py)
+class TableVersion(Base):
+    __tablename__ = 'TableVersion'
+    table_name = Column(String(64), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)  # UTC
+
+# Applied schema migrations (see schema.py)
+class SchemaVersion(Base):
+    __tablename__ = 'SchemaVersion'
+    version = Column(Integer, primary_key=True)
+    description = Column(String(255))
+    applied_at = Column(DateTime)
@@ -0,0 +1,279 @@
+import sys
+import argparse
+from datetime import date, datetime
+from sqlalchemy import select, func, insert, update
+from tables import *
+
+# Vacation days of each employee, as a ledger.
+# Every change is a VacationLedger entry (the opening balance, an accrual on each work anniversary,
+# a booking), and VacationBalance keeps the running total, so the balance is a primary key read
+# instead of a sum over the employee's history.
+#
+# A booking locks the employee's balance row (SELECT ... FOR UPDATE) and writes the vacation, the
+# ledger entry and the new balance in one transaction: a concurrent booking for the same employee
+# waits for it and sees the days already taken, so the same days can't be spent twice.
+# SQLite ignores FOR UPDATE, so there the row is "locked" by writing to it first, which takes the
+# database's write lock until the commit.
+#
+# Accruals are posted when a balance is locked, so the ledger is up to date without a scheduled job;
+# `accrue` posts them for everyone at once (e.g. before a report of balances).
+#
+# Usage (from project/backend/):
+#   python vacation_ledger.py accrue             -> open the missing balances and post the accruals due
+#   python vacation_ledger.py balance EMPLOYEE_ID -> balance and ledger of an employee
+#   python vacation_ledger.py check              -> compare every balance with the sum of its ledger
+
+CHUNK_SIZE = 5000  # Employees per transaction in accrue_balances()
+ANNUAL_DAYS = 15  # Vacation days per year of service
+LONG_SERVICE_DAYS = 20  # Per year once the employee has LONG_SERVICE_YEARS of service
+LONG_SERVICE_YEARS = 10
+
+
+class VacationError(Exception):
+    pass
+
+
+def anniversary(start_date, years):
+    """Work anniversary: start_date plus whole years (Feb 29 -> Feb 28)."""
+    try:
+        return start_date.replace(year=start_date.year + years)
+    except ValueError:
+        return start_date.replace(year=start_date.year + years, day=28)
+
+
+def years_of_service(start_date, as_of):
+    years = as_of.year - start_date.year
+    return years - 1 if anniversary(start_date, years) > as_of else years
+
+
+def annual_days(years):
+    """Days credited on the anniversary of the given years of service."""
+    return LONG_SERVICE_DAYS if years >= LONG_SERVICE_YEARS else ANNUAL_DAYS
+
+
+def opening(start_date, last_accumulated_days, as_of):
+    """
+    Opening balance of an employee: (days, accrued_through).
+    The accumulated days of the last recorded vacation if there is one, otherwise the days of the
+    current year of service (none in the first year); accruals start after the last anniversary.
+    """
+    years = max(years_of_service(start_date, as_of), 0)
+    accrued_through = anniversary(start_date, years)
+    if last_accumulated_days is not None:
+        return last_accumulated_days, accrued_through
+    return (annual_days(years) if years else 0), accrued_through
+
+
+def accruals_due(start_date, accrued_through, as_of):
+    """(anniversary, days) of every anniversary after accrued_through up to as_of."""
+    due = []
+    years = years_of_service(start_date, accrued_through) + 1
+    while anniversary(start_date, years) <= as_of:
+        due.append((anniversary(start_date, years), annual_days(years)))
+        years += 1
+    return due
+
+
+def post(session, balance, kind, days, entry_date, description, vacation_id=None):
+    """Add a ledger entry and apply it to the balance row. Doesn't commit."""
+    balance.balance += days
+    balance.updated_at = datetime.now()
+    session.add(VacationLedger(
+        employee_id=balance.employee_id, entry_date=entry_date, kind=kind, days=days,
+        balance=balance.balance, vacation_id=vacation_id, description=description,
+    ))
+
+
+def accrue(session, balance, start_date, as_of):
+    """Post the accruals due on a balance row. Doesn't commit. Returns the number of entries."""
+    due = accruals_due(start_date, balance.accrued_through or start_date, as_of)
+    for anniversary_date, days in due:
+        post(session, balance, 'accrual', days, anniversary_date, f'Year of service ending {anniversary_date}')
+        balance.accrued_through = anniversary_date
+    return len(due)
+
+
+def last_accumulated_days(session, employee_ids):
+    """Accumulated days of the last recorded vacation of each employee (the balance before the ledger)."""
+    rows = session.execute(
+        select(Vacation.employee_id, Vacation.accumulated_days)
+        .where(Vacation.employee_id.in_(employee_ids))
+        .order_by(Vacation.employee_id, Vacation.start_date, Vacation.id)
+    ).all()
+    return {employee_id: days for employee_id, days in rows}
+
+
+def as_date(value):
+    """A date, from a date or a 'YYYY-MM-DD' string (as posted by the forms)."""
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def open_balance(session, employee_id, start_date, last_days=None, as_of=None):
+    """Create the balance row of an employee and its opening entry. Doesn't commit."""
+    as_of = as_of or date.today()
+    start_date = as_date(start_date)
+    days, accrued_through = opening(start_date, last_days, as_of)
+    balance = VacationBalance(employee_id=employee_id, balance=0, accrued_through=accrued_through)
+    session.add(balance)
+    post(session, balance, 'opening', days, as_of, 'Opening balance')
+    return balance
+
+
+def open_balances(session, employees, as_of=None):
+    """Open the balances of new employees, [(employee_id, start_date)], with one executemany each. Doesn't commit."""
+    as_of = as_of or date.today()
+    now = datetime.now()
+    balances, entries = [], []
+    for employee_id, start_date in employees:
+        days, accrued_through = opening(start_date, None, as_of)
+        balances.append({'employee_id': employee_id, 'balance': days, 'accrued_through': accrued_through, 'updated_at': now})
+        entries.append({
+            'employee_id': employee_id, 'entry_date': as_of, 'kind': 'opening', 'days': days, 'balance': days,
+            'vacation_id': None, 'description': 'Opening balance',
+        })
+    if balances:
+        session.execute(insert(VacationBalance), balances)
+        session.execute(insert(VacationLedger), entries)
+
+
+def locked_balance(session, employee_id, as_of=None):
+    """
+    Balance row of an employee, locked until the transaction ends, with the accruals due posted.
+    Opens the balance if the employee doesn't have one. Raises VacationError if the employee doesn't exist.
+    """
+    as_of = as_of or date.today()
+    start_date = session.scalar(select(Employee.start_date).where(Employee.id == employee_id))
+    if start_date is None:
+        raise VacationError("Employee not found!")
+
+    def lock():
+        if session.get_bind().dialect.name == 'sqlite':
+            session.execute(
+                update(VacationBalance).where(VacationBalance.employee_id == employee_id)
+                .values(balance=VacationBalance.balance).execution_options(synchronize_session=False)
+            )
+        return session.query(VacationBalance).filter_by(employee_id=employee_id) \
+            .with_for_update().populate_existing().one_or_none()
+
+    balance = lock()
+    if balance is None:
+        # Only employees added outside the app get here (new employees and the migration open a balance).
+        # If a concurrent request opens it first, the flush fails on the primary key and the caller's transaction rolls back.
+        last_days = last_accumulated_days(session, [employee_id]).get(employee_id)
+        balance = open_balance(session, employee_id, start_date, last_days, as_of)
+        session.flush()
+    accrue(session, balance, start_date, as_of)
+    return balance
+
+
+def book(session, balance, vacation, as_of=None):
+    """
+    Debit a vacation from a locked balance (see locked_balance). Doesn't commit.
+    Raises VacationError if the balance doesn't cover it.
+    """
+    if vacation.days_taken > balance.balance:
+        raise VacationError(f"Insufficient vacation days! ({balance.balance} available)")
+    vacation.accumulated_days = balance.balance - vacation.days_taken
+    session.add(vacation)
+    session.flush()  # Get the vacation ID for the ledger
+    post(session, balance, 'booking', -vacation.days_taken, as_of or date.today(),
+         f'Vacation {vacation.start_date} to {vacation.end_date}', vacation.id)
+
+
+def vacation_balance(session, employee_id, as_of=None):
+    """
+    Current balance of an employee, without writing: {'balance', 'accrued_through', 'pending'}
+    (pending: days of accruals due but not posted yet, already included in balance). None if the employee doesn't exist.
+    """
+    as_of = as_of or date.today()
+    row = session.execute(
+        select(Employee.start_date, VacationBalance.balance, VacationBalance.accrued_through)
+        .outerjoin(VacationBalance, VacationBalance.employee_id == Employee.id)
+        .where(Employee.id == employee_id)
+    ).first()
+    if row is None or row.start_date is None:
+        return None
+    days, accrued_through = row.balance, row.accrued_through
+    if days is None:
+        days, accrued_through = opening(row.start_date, last_accumulated_days(session, [employee_id]).get(employee_id), as_of)
+    due = accruals_due(row.start_date, accrued_through or row.start_date, as_of)
+    pending = sum(days for _, days in due)
+    return {
+        'balance': days + pending,
+        'accrued_through': due[-1][0] if due else accrued_through,
+        'pending': pending,
+    }
+
+
+def accrue_balances(session, as_of=None, chunk_size=CHUNK_SIZE):
+    """Open the missing balances and post the accruals due, one transaction per chunk of employees. Returns counts."""
+    as_of = as_of or date.today()
+    summary = {'employees': 0, 'opened': 0, 'accruals': 0}
+    last_id = 0
+    while True:
+        employees = session.execute(
+            select(Employee.id, Employee.start_date)
+            .where(Employee.id > last_id, Employee.start_date.is_not(None))
+            .order_by(Employee.id).limit(chunk_size)
+        ).all()
+        if not employees:
+            break
+        ids = [employee.id for employee in employees]
+        balances = {
+            balance.employee_id: balance
+            for balance in session.query(VacationBalance).filter(VacationBalance.employee_id.in_(ids)).with_for_update()
+        }
+        missing = [employee_id for employee_id in ids if employee_id not in balances]
+        last_days = last_accumulated_days(session, missing) if missing else {}
+        for employee in employees:
+            balance = balances.get(employee.id)
+            if balance is None:
+                balance = open_balance(session, employee.id, employee.start_date, last_days.get(employee.id), as_of)
+                summary['opened'] += 1
+            summary['accruals'] += accrue(session, balance, employee.start_date, as_of)
+        session.commit()
+        summary['employees'] += len(employees)
+        last_id = ids[-1]
+    return summary
+
+
+def mismatches(session):
+    """Balances that differ from the sum of their ledger entries: [(employee_id, balance, ledger_total)]."""
+    totals = select(VacationLedger.employee_id, func.sum(VacationLedger.days).label('total')) \
+        .group_by(VacationLedger.employee_id).subquery()
+    return [tuple(row) for row in session.execute(
+        select(VacationBalance.employee_id, VacationBalance.balance, totals.c.total)
+        .outerjoin(totals, totals.c.employee_id == VacationBalance.employee_id)
+        .where(func.coalesce(totals.c.total, 0) != VacationBalance.balance)
+        .order_by(VacationBalance.employee_id)
+    ).all()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Vacation balances.')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    subcommands.add_parser('accrue', help='Open the missing balances and post the accruals due')
+    show = subcommands.add_parser('balance', help='Balance and ledger of an employee')
+    show.add_argument('employee_id', type=int)
+    subcommands.add_parser('check', help='Compare every balance with the sum of its ledger entries')
+    args = parser.parse_args()
+
+    from database import Session
+    with Session() as session:
+        if args.command == 'accrue':
+            summary = accrue_balances(session)
+            print(f"{summary['employees']} employees: {summary['opened']} balances opened, {summary['accruals']} accruals posted")
+        elif args.command == 'balance':
+            balance = vacation_balance(session, args.employee_id)
+            if balance is None:
+                print(f"No employee with ID {args.employee_id}")
+                sys.exit(1)
+            print(f"Balance: {balance['balance']} days (accrued through {balance['accrued_through']})")
+            for entry in session.query(VacationLedger).filter_by(employee_id=args.employee_id).order_by(VacationLedger.id):
+                print(f"  {entry.entry_date} {entry.kind:8} {entry.days:+4} -> {entry.balance:4}  {entry.description}")
+        else:
+            wrong = mismatches(session)
+            for employee_id, balance, total in wrong:
+                print(f"  Employee {employee_id}: balance {balance}, ledger total {total}")
+            print(f"{len(wrong)} balances don't match their ledger")
+            sys.exit(1 if wrong else 0)
@@ -0,0 +1,255 @@
+import argparse
+import csv
+import os
+import random
+import sys
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+# Deterministic synthetic data at production scale, as CSV files that load_db.py --csv loads.
+# Usage (from the repository root):
+#   python project/benchmarks/generate_data.py --employees 100k --output data_100k
+#   python project/setup/load_db.py --csv data_100k --replace
+# or add --load to generate and load in one step (into DATABASE_URL / the MySQL settings).
+# The same --seed and --as-of always give the same files. Reference tables (AFPs, health plans,
+# departments, positions, companies) are the demo data of load_db.py.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'setup'))
+import load_db
+from load_db import csv_value
+from tables import *
+from search import words
+from evaluation_analytics import rating_of
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+# Contracts, vacations and remunerations are dated around this day
+AS_OF = date(2025, 1, 1)
+
+FIRST_NAMES = [
+    'José', 'Juan', 'Luis', 'Carlos', 'Jorge', 'Manuel', 'Francisco', 'Cristián', 'Matías', 'Benjamín',
+    'Vicente', 'Martín', 'Sebastián', 'Tomás', 'Joaquín', 'Agustín', 'Ignacio', 'Felipe', 'Andrés', 'Diego',
+    'María', 'Ana', 'Carolina', 'Camila', 'Valentina', 'Javiera', 'Francisca', 'Constanza', 'Catalina', 'Daniela',
+    'Fernanda', 'Isidora', 'Sofía', 'Antonella', 'Florencia', 'Josefa', 'Trinidad', 'Paula', 'Claudia', 'Mónica',
+]
+LAST_NAMES = [
+    'González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva', 'Martínez', 'Sepúlveda',
+    'Morales', 'Rodríguez', 'López', 'Fuentes', 'Hernández', 'Torres', 'Araya', 'Flores', 'Espinoza', 'Valenzuela',
+    'Castillo', 'Tapia', 'Reyes', 'Gutiérrez', 'Castro', 'Pizarro', 'Álvarez', 'Vásquez', 'Sánchez', 'Fernández',
+    'Ramírez', 'Carrasco', 'Gómez', 'Cortés', 'Herrera', 'Núñez', 'Jara', 'Vergara', 'Rivera', 'Figueroa',
+]
+NATIONALITIES = ['Chilean'] * 8 + ['Peruvian', 'Argentinian', 'Venezuelan', 'Colombian', 'Haitian', 'Bolivian']
+CONTRACT_TYPES = ['Permanent', 'Fixed', 'Temporary', 'Substitute']
+CLASSIFICATIONS = ['Auxiliary', 'Administrative', 'Technical', 'Professional', 'Executive']
+EVALUATORS = [f'Supervisor {letter}' for letter in 'ABCDEFGH']
+COURSES = [
+    ('Advanced Python', 'Tech Academy'), ('Project Management', 'University A'), ('Cybersecurity', 'Tech Institute'),
+    ('Digital Marketing', 'Online Academy'), ('Scrum Master', 'Scrum Training'), ('Excel for Business', 'Online Academy'),
+    ('Leadership', 'University B'), ('Occupational Safety', 'Mutual de Seguridad'), ('English B2', 'Language Center'),
+]
+CENT = Decimal('0.01')
+
+# Tables written by the generator, in load order
+GENERATED = [Employee, EmployeePosition, Contract, Vacation, Evaluation, Training, Remuneration]
+
+
+def parse_size(value):
+    """'100k' -> 100000; plain numbers are accepted too."""
+    return SIZES.get(value.lower()) or int(value)
+
+
+def rut(number):
+    """Format a RUT number with its check digit: 12345678 -> '12.345.678-5'."""
+    total, factor = 0, 2
+    for digit in reversed(str(number)):
+        total += int(digit) * factor
+        factor = 2 if factor == 7 else factor + 1
+    check = 11 - total % 11
+    check_digit = {11: '0', 10: 'K'}.get(check, str(check))
+    return f'{number:,}'.replace(',', '.') + f'-{check_digit}'
+
+
+def random_date(rng, start, end):
+    return start + timedelta(days=rng.randint(0, max((end - start).days, 0)))
+
+
+class Generator:
+    """Builds the rows of every generated table, one employee at a time."""
+
+    def __init__(self, seed, as_of):
+        self.rng = random.Random(seed)
+        self.as_of = as_of
+        self.next_id = {model: 1 for model in GENERATED}
+        self.afp_commission = {afp['id']: Decimal(str(afp['commission_percentage'])) for afp in load_db.afp_data}
+        self.health_discount = {
+            plan['health_plan_id']: Decimal(str(plan['discount'])) for plan in load_db.fonasa_data + load_db.isapre_data
+        }
+        self.position_ids = [position['id'] for position in load_db.job_position_data]
+
+    def new_id(self, model):
+        value = self.next_id[model]
+        self.next_id[model] += 1
+        return value
+
+    def employee(self, index):
+        """All the rows of one employee: {model: [row, ...]}."""
+        rng = self.rng
+        employee_id = self.new_id(Employee)
+        birth_date = random_date(rng, date(1960, 1, 1), date(2004, 12, 31))
+        start_date = random_date(rng, max(date(birth_date.year + 18, birth_date.month, 1), date(1995, 1, 1)), self.as_of)
+        salary = Decimal(rng.randint(500_00, 6_000_00)) / 100
+        afp_id = rng.choice(list(self.afp_commission))
+        health_plan_id = rng.choice(list(self.health_discount))
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = f'{rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}'
+        rows = {model: [] for model in GENERATED}
+        rows[Employee].append({
+            'id': employee_id,
+            'rut': rut(5_000_000 + index * 7),  # Unique, spread over realistic RUT numbers
+            'first_name': first_name,
+            'last_name': last_name,
+            'birth_date': birth_date,
+            'start_date': start_date,
+            'email': f'{words(first_name)[0]}.{words(last_name)[0]}{employee_id}@example.com',
+            'phone': f'+569{rng.randint(10_000_000, 99_999_999)}',
+            'salary': salary,
+            'nationality': rng.choice(NATIONALITIES),
+            'active_employee': rng.random() < 0.9,
+            'afp_id': afp_id,
+            'health_plan_id': health_plan_id,
+        })
+        rows[EmployeePosition].append({'employee_id': employee_id, 'position_id': rng.choice(self.position_ids)})
+
+        # Consecutive contracts; the last one is open-ended or ends around AS_OF
+        contract_start = start_date
+        contracts = rng.choice([1, 1, 1, 2, 2, 3])
+        for number in range(contracts):
+            last = number == contracts - 1
+            if last:
+                end_date = None if rng.random() < 0.6 else self.as_of + timedelta(days=rng.randint(-365, 730))
+            else:
+                end_date = min(contract_start + timedelta(days=rng.randint(180, 1095)), self.as_of)
+            rows[Contract].append({
+                'id': self.new_id(Contract),
+                'employee_id': employee_id,
+                'contract_type': 'Permanent' if last and end_date is None else rng.choice(CONTRACT_TYPES[1:]),
+                'start_date': contract_start,
+                'end_date': end_date,
+                'classification': rng.choice(CLASSIFICATIONS),
+                'registration_date': contract_start,
+            })
+            if end_date is None or end_date >= self.as_of:
+                break
+            contract_start = end_date + timedelta(days=1)
+
+        long_service = (self.as_of - start_date).days > 10 * 365
+        accumulated_days = 20 if long_service else 15
+        vacation_start = max(start_date, self.as_of - timedelta(days=3 * 365))
+        for _ in range(rng.choice([0, 1, 1, 2, 3])):
+            vacation_start = random_date(rng, vacation_start, vacation_start + timedelta(days=300))
+            days_taken = rng.randint(1, 15)
+            vacation_end = vacation_start + timedelta(days=days_taken - 1)
+            rows[Vacation].append({
+                'id': self.new_id(Vacation),
+                'employee_id': employee_id,
+                'start_date': vacation_start,
+                'end_date': vacation_end,
+                'days_taken': days_taken,
+                'accumulated_days': max(accumulated_days - days_taken, 0),
+                'long_service_employee': long_service,
+            })
+            vacation_start = vacation_end + timedelta(days=1)
+
+        for _ in range(rng.choice([0, 1, 1, 2])):
+            evaluation_factor = round(rng.uniform(3.0, 7.0), 1)
+            rows[Evaluation].append({
+                'id': self.new_id(Evaluation),
+                'employee_id': employee_id,
+                'evaluation_date': random_date(rng, start_date, self.as_of),
+                'evaluator': rng.choice(EVALUATORS),
+                'evaluation_factor': evaluation_factor,
+                'rating': rating_of(evaluation_factor),
+                'comments': None,
+            })
+
+        for _ in range(rng.choice([0, 0, 1, 2])):
+            course, institution = rng.choice(COURSES)
+            rows[Training].append({
+                'id': self.new_id(Training),
+                'employee_id': employee_id,
+                'training_date': random_date(rng, start_date, self.as_of),
+                'course': course,
+                'score': round(rng.uniform(4.0, 7.0), 1),
+                'institution': institution,
+                'comments': None,
+            })
+
+        rows[Remuneration].append(self.remuneration(employee_id, salary, afp_id, health_plan_id))
+        return rows
+
+    def remuneration(self, employee_id, salary, afp_id, health_plan_id):
+        bonus = (salary * Decimal(self.rng.choice([0, 0, 5, 10])) / 100).quantize(CENT, ROUND_HALF_UP)
+        tax = Decimal(self.rng.choice(['0.00', '4.00', '8.00', '13.50']))
+        deductions = (salary * (self.afp_commission[afp_id] + self.health_discount[health_plan_id]) / 100).quantize(CENT, ROUND_HALF_UP)
+        welfare_contribution = (salary * Decimal('0.01')).quantize(CENT, ROUND_HALF_UP)
+        taxed = (salary * tax / 100).quantize(CENT, ROUND_HALF_UP)
+        return {
+            'id': self.new_id(Remuneration),
+            'employee_id': employee_id,
+            'afp_id': afp_id,
+            'health_plan_id': health_plan_id,
+            'gross_amount': salary + bonus,
+            'tax': tax,
+            'deductions': deductions,
+            'bonus': bonus,
+            'welfare_contribution': welfare_contribution,
+            'net_amount': salary + bonus - deductions - welfare_contribution - taxed,
+        }
+
+
+def write_reference_data(directory):
+    """The reference tables are the demo data of load_db.py."""
+    for model, rows in load_db.SEED_DATA:
+        if model in GENERATED:
+            continue
+        table = model.__table__
+        load_db.write_table_csv(os.path.join(directory, f'{table.name}.csv'), table, rows)
+
+
+def generate(directory, employees, seed=1, as_of=AS_OF):
+    """Write one CSV file per table for the given number of employees. Returns the row counts."""
+    os.makedirs(directory, exist_ok=True)
+    write_reference_data(directory)
+    generator = Generator(seed, as_of)
+    files = {}
+    writers = {}
+    columns = {model: [column.name for column in model.__table__.columns] for model in GENERATED}
+    counts = {model.__tablename__: 0 for model in GENERATED}
+    try:
+        for model in GENERATED:
+            files[model] = open(os.path.join(directory, f'{model.__tablename__}.csv'), 'w', newline='', encoding='utf-8')
+            writers[model] = csv.writer(files[model], lineterminator='\n')
+            writers[model].writerow(columns[model])
+        for index in range(employees):
+            for model, rows in generator.employee(index).items():
+                writers[model].writerows([csv_value(row.get(column)) for column in columns[model]] for row in rows)
+                counts[model.__tablename__] += len(rows)
+    finally:
+        for f in files.values():
+            f.close()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a deterministic synthetic HR dataset as CSV files.')
+    parser.add_argument('--employees', type=parse_size, default='10k', help='10k, 100k, 1m or a number')
+    parser.add_argument('--output', required=True, help='Directory for the CSV files')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--as-of', type=date.fromisoformat, default=AS_OF, help='Date the data is built around (YYYY-MM-DD)')
+    parser.add_argument('--load', action='store_true', help='Load the files with load_db.py --csv --replace afterwards')
+    args = parser.parse_args()
+
+    counts = generate(args.output, args.employees, args.seed, args.as_of)
+    for table, count in counts.items():
+        print(f"{table:18} {count:>10,} rows")
+    if args.load:
+        load_db.load(args.output, replace=True)
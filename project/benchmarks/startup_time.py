@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Cold-start benchmark: time from a fresh Python process to the first served request.
+# Usage (from the repository root):
+#   python project/benchmarks/startup_time.py --runs 10 --output startup.json
+# The first request goes to /add_evaluation, a page that only renders templates,
+# so the numbers don't depend on the database.
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+# Runs inside the fresh process; prints the timings of each startup step as JSON
+WORKER = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+response = flask_app.test_client().get('/add_evaluation')
+served = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+}))
+'''
+
+
+def run_once():
+    """Start a new interpreter and measure it until the first response."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', WORKER], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    total = (time.perf_counter() - start) * 1000
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['total_ms'] = total
+    return timings
+
+
+def summarize(runs):
+    """Min, median and max of every measured step."""
+    summary = {}
+    for key in ['import_ms', 'create_app_ms', 'first_request_ms', 'total_ms']:
+        values = sorted(run[key] for run in runs)
+        summary[key] = {
+            'min': round(values[0], 2),
+            'median': round(values[len(values) // 2], 2),
+            'max': round(values[-1], 2),
+        }
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure cold-start time to the first served request.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    if any(run['status'] != 200 for run in runs):
+        print(f"First request failed: {[run['status'] for run in runs]}")
+        sys.exit(1)
+
+    results = {'benchmark': 'startup_time', 'runs': args.runs, 'summary': summarize(runs)}
+    for key, values in results['summary'].items():
+        print(f"{key:18} min {values['min']:8.2f}  median {values['median']:8.2f}  max {values['max']:8.2f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -1,19 +1,44 @@
+// Names already looked up, by RUT (null when the RUT doesn't exist)
+const employeeNames = new Map();
+// Wait this long after the last keystroke before looking the RUT up
+const NAME_LOOKUP_DELAY_MS = 300;
+let nameLookupTimer = null;
+
+// Resolves many RUTs with a single request to /get_employee_names; returns {rut: name or null}
+function fetchEmployeeNames(ruts) {
+  const missing = ruts.filter((rut) => !employeeNames.has(rut));
+  const request = missing.length
+    ? fetch("/get_employee_names?" + new URLSearchParams(missing.map((rut) => ["rut", rut])))
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error("Lookup failed");
+          }
+          return response.json();
+        })
+        .then((names) => {
+          missing.forEach((rut) => employeeNames.set(rut, names[rut] ?? null));
+        })
+    : Promise.resolve();
+  return request.then(() => Object.fromEntries(ruts.map((rut) => [rut, employeeNames.get(rut)])));
+}
+
 function fetchEmployeeName() {
+  clearTimeout(nameLookupTimer);
+  nameLookupTimer = setTimeout(showEmployeeName, NAME_LOOKUP_DELAY_MS);
+}
+
+function showEmployeeName() {
   var employeeRut = document.getElementById("employee_rut").value; // Cambiado de employee_id a employee_rut
   var employeeNameSpan = document.getElementById("employee_name");
 
   if (employeeRut) {
-    fetch(`/get_employee_name/${employeeRut}`) // Modificado para usar el RUT
-      .then((response) => {
-        if (response.ok) {
-          return response.text();
-        } else {
-          return "Does not exist";
+    fetchEmployeeNames([employeeRut])
+      .then((names) => {
+        // Ignore answers for a RUT that was changed while waiting
+        if (document.getElementById("employee_rut").value === employeeRut) {
+          employeeNameSpan.innerText = "Employee name: " + (names[employeeRut] || "Does not exist");
         }
       })
-      .then((data) => {
-        employeeNameSpan.innerText = "Employee name: " + data;
-      })
       .catch((error) => {
         employeeNameSpan.innerText = "Error fetching employee name.";
       });
@@ -22,25 +47,17 @@ function fetchEmployeeName() {
   }
 }
 
-// Function to update the rating based on evaluation factor (grade)
+// Function to update the rating based on evaluation factor (grade),
+// on the scale the server sends in data-rating-scale (RATING_SCALE in evaluation_analytics.py)
 function updateRating() {
-  const evaluationFactor = parseFloat(
-    document.getElementById("evaluation_factor").value
-  );
+  const input = document.getElementById("evaluation_factor");
+  const evaluationFactor = parseFloat(input.value);
+  const { scale, below } = JSON.parse(input.dataset.ratingScale);
   let rating = "";
 
-  if (evaluationFactor === 7) {
-    rating = "Excellent";
-  } else if (evaluationFactor >= 6.5 && evaluationFactor < 7) {
-    rating = "Very Good";
-  } else if (evaluationFactor >= 6 && evaluationFactor < 6.5) {
-    rating = "Good";
-  } else if (evaluationFactor >= 5 && evaluationFactor < 6) {
-    rating = "Satisfactory";
-  } else if (evaluationFactor >= 4 && evaluationFactor < 5) {
-    rating = "Fair";
-  } else if (evaluationFactor < 4) {
-    rating = "Deficient";
+  if (!isNaN(evaluationFactor)) {
+    const step = scale.find(([lowest]) => evaluationFactor >= lowest);
+    rating = step ? step[1] : below;
   }
 
   // Set the calculated rating in the input field
@@ -61,10 +78,27 @@ function updateDaysTaken() {
   }
 }
 
-//Updates the "Accumulated Days" field based on the checkbox status.
- 
-function updateAccumulatedDays() {
-  const checkbox = document.getElementById("long_service_employee");
+//Shows the vacation balance of the employee in the "Accumulated Days" field.
+let balanceLookupTimer = null;
+
+function fetchVacationBalance() {
+  clearTimeout(balanceLookupTimer);
+  balanceLookupTimer = setTimeout(showVacationBalance, NAME_LOOKUP_DELAY_MS);
+}
+
+function showVacationBalance() {
+  const employeeRut = document.getElementById("employee_rut").value;
   const accumulatedDaysField = document.getElementById("accumulated_days");
-  accumulatedDaysField.value = checkbox.checked ? 20 : 15;
+  accumulatedDaysField.value = "";
+  if (!employeeRut) {
+    return;
+  }
+  fetch("/vacation_balance/" + encodeURIComponent(employeeRut))
+    .then((response) => (response.ok ? response.json() : null))
+    .then((balance) => {
+      // Ignore answers for a RUT that was changed while waiting
+      if (balance && document.getElementById("employee_rut").value === employeeRut) {
+        accumulatedDaysField.value = balance.balance;
+      }
+    });
 }
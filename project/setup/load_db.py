@@ -1,197 +1,32 @@
 import os
-from sqlalchemy import create_engine, text, Column, Integer, String, ForeignKey, DECIMAL, Date, Text, Boolean
-from sqlalchemy.orm import sessionmaker, relationship, declarative_base
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import date
-
-# Load the MySQL root password from environment variables
-mysql_root_password = os.getenv('MYSQL_ROOT_PASSWORD', 'default_root_pass')  # Fallback in case the env variable isn't set
-
-config = {
-    'host': 'localhost',
-    'database_name': 'hr',
-    'user': 'root',
-    'password': mysql_root_password
-}
-
-# Connect to MySQL without specifying a database
-engine = create_engine(f'mysql+pymysql://{config["user"]}:{config["password"]}@{config["host"]}', echo=True)
-
-# Create the database if it doesn't exist
-with engine.connect() as connection:
-    connection.execute(text(f"CREATE DATABASE IF NOT EXISTS {config['database_name']}"))
-
-# Reconnect to MySQL with the newly created database
-engine = create_engine(f'mysql+pymysql://{config["user"]}:{config["password"]}@{config["host"]}/{config["database_name"]}', echo=True)
-
-Base = declarative_base()
-
-
-# Company model
-class Company(Base):
-    __tablename__ = 'Company'
-    id = Column(Integer, primary_key=True)
-    rut = Column(String(20))  # Equivalent to 'rut'
-    name = Column(String(100))
-    address = Column(String(255))
-    phone = Column(String(20))
-    industry = Column(String(100))  # Equivalent to 'giro'
-
-# Employee model
-class Employee(Base):
-    __tablename__ = 'Employee'
-    id = Column(Integer, primary_key=True)
-    rut = Column(String(20))  # Equivalent to 'rut'
-    first_name = Column(String(50))
-    last_name = Column(String(50))
-    birth_date = Column(Date)
-    start_date = Column(Date)
-    email = Column(String(320))
-    phone = Column(String(20))
-    salary = Column(DECIMAL(10, 2))
-    nationality = Column(String(50))
-    active_employee = Column(Boolean, default=True)
-    afp_id = Column(Integer, ForeignKey('AFP.id'))
-    health_plan_id = Column(Integer, ForeignKey('HealthPlan.id'))
-    afp = relationship('AFP', back_populates='employees')  # Relationship to AFP
-    health_plan = relationship('HealthPlan', back_populates='employees')  # Relationship to HealthPlan
-    contracts = relationship('Contract', back_populates='employees')
-    vacations = relationship('Vacation', back_populates='employees')
-    evaluations = relationship('Evaluation', back_populates='employees')
-    trainings = relationship('Training', back_populates='employees')
-    remunerations = relationship('Remuneration', back_populates='employees')
-    job_positions = relationship('JobPosition', secondary='EmployeePosition', back_populates='employees')  # Many-to-Many with JobPosition
-
-# Department model
-class Department(Base):
-    __tablename__ = 'Department'
-    id = Column(Integer, primary_key=True)
-    name = Column(String(100))
-    description = Column(Text)
-    job_positions = relationship('JobPosition', back_populates='departments')  # Relationship to JobPosition
-
-# Position model
-class JobPosition(Base):
-    __tablename__ = 'JobPosition'
-    id = Column(Integer, primary_key=True)
-    name = Column(String(100))
-    description = Column(Text)
-    department_id = Column(Integer, ForeignKey('Department.id'))  # Foreign key to Department
-    departments = relationship('Department', back_populates='job_positions')  # Relationship to Department
-    employees = relationship('Employee', secondary='EmployeePosition', back_populates='job_positions')  # Relationship to Employee
-
-# EmployeePosition association table (Many-to-Many relationship between Employee and JobPosition)
-class EmployeePosition(Base):
-    __tablename__ = 'EmployeePosition'
-    employee_id = Column(Integer, ForeignKey('Employee.id'), primary_key=True)
-    position_id = Column(Integer, ForeignKey('JobPosition.id'), primary_key=True)
-
-# Pension Fund model (AFP)
-class AFP(Base):
-    __tablename__ = 'AFP'
-    id = Column(Integer, primary_key=True)
-    name = Column(String(100))
-    commission_percentage = Column(DECIMAL(5, 2))
-    employees = relationship('Employee', back_populates='afp')
-    remunerations = relationship('Remuneration', back_populates='afps')
-
-# Vacation model
-class Vacation(Base):
-    __tablename__ = 'Vacation'
-    id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey('Employee.id'))
-    start_date = Column(Date)
-    end_date = Column(Date)
-    days_taken = Column(Integer)
-    accumulated_days = Column(Integer)
-    long_service_employee = Column(Boolean) 
-    employees = relationship('Employee', back_populates='vacations')
-
-# Evaluation model
-class Evaluation(Base):
-    __tablename__ = 'Evaluation'
-    id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey('Employee.id'))
-    evaluation_date = Column(Date)
-    evaluator = Column(String(100))
-    evaluation_factor = Column(DECIMAL(5, 2))
-    rating = Column(String(50))  # Good, average, bad/deficient
-    comments = Column(Text)
-    employees = relationship('Employee', back_populates='evaluations')
-
-# Training model
-class Training(Base):
-    __tablename__ = 'Training'
-    id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey('Employee.id'))
-    training_date = Column(Date)
-    course = Column(String(100))
-    score = Column(DECIMAL(5, 2))
-    institution = Column(String(100))
-    comments = Column(Text)
-    employees = relationship('Employee', back_populates='trainings')
-
-# Remuneration model
-class Remuneration(Base):
-    __tablename__ = 'Remuneration'
-    id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey('Employee.id'))
-    afp_id = Column(Integer, ForeignKey('AFP.id'))
-    health_plan_id = Column(Integer, ForeignKey('HealthPlan.id'))
-    gross_amount = Column(DECIMAL(10, 2))
-    tax = Column(DECIMAL(5, 2))
-    deductions = Column(DECIMAL(10, 2))
-    bonus = Column(DECIMAL(10, 2))
-    welfare_contribution = Column(DECIMAL(10, 2))
-    net_amount = Column(DECIMAL(10, 2))
-    employees = relationship('Employee', back_populates='remunerations')
-    afps = relationship('AFP', back_populates='remunerations')
-    health_plans = relationship('HealthPlan', back_populates='remunerations')
-
-# HealthPlan model
-class HealthPlan(Base):
-    __tablename__ = 'HealthPlan'
-    id = Column(Integer, primary_key=True)
-    name = Column(String(100))
-    type = Column(String(50))
-    employees = relationship('Employee', back_populates='health_plan')
-    fonasa = relationship('Fonasa', back_populates='health_plans')
-    isapre = relationship('Isapre', back_populates='health_plans')
-    remunerations = relationship('Remuneration', back_populates='health_plans')
-
-# Public Health model (Fonasa)
-class Fonasa(Base):
-    __tablename__ = 'Fonasa'
-    id = Column(Integer, primary_key=True)
-    health_plan_id = Column(Integer, ForeignKey('HealthPlan.id'))
-    discount = Column(DECIMAL(10, 2))  # Equivalent to 'descuento'
-    health_plans = relationship('HealthPlan', back_populates='fonasa')
-
-# PrivateHealth model (Isapre)
-class Isapre(Base):
-    __tablename__ = 'Isapre'
-    id = Column(Integer, primary_key=True)
-    health_plan_id = Column(Integer, ForeignKey('HealthPlan.id'))
-    discount = Column(DECIMAL(10, 2)) 
-    health_plans = relationship('HealthPlan', back_populates='isapre')
-
-# Contract model
-class Contract(Base):
-    __tablename__ = 'Contract'
-    id = Column(Integer, primary_key=True)
-    employee_id = Column(Integer, ForeignKey('Employee.id'))
-    contract_type = Column(String(50))  # Fixed, temporary, replacement, permanent (contrata, suplencia, reemplazo, planta)
-    start_date = Column(Date)
-    end_date = Column(Date)
-    classification = Column(String(50))  # Auxiliary, administrative, technical, professional, executive (escalafon)
-    registration_date = Column(Date)
-    employees = relationship('Employee', back_populates='contracts')  # Relationship to Employee
-# Create the tables in the database
-Base.metadata.create_all(engine)
-
-# Create a session to interact with the database
-Session = sessionmaker(bind=engine)
-session = Session()
+import sys
+import csv
+import argparse
+from decimal import Decimal
+from datetime import date, datetime
+from sqlalchemy import insert
+
+# Seed data loader. The schema comes from backend/tables.py (created by schema.py bootstrap).
+# Usage (from project/setup/):
+#   python load_db.py                      -> load the demo data below
+#   python load_db.py --csv DIR            -> load DIR/<Table>.csv for every table that has a file (e.g. DIR/Employee.csv)
+#   python load_db.py --write-csv DIR      -> write the demo data as CSV files, a template of the format --csv reads
+# Add --replace to empty the tables first, and --batch-size N to change the rows per INSERT.
+# Rows go in as multi-row INSERT statements, one transaction per table. On MySQL, --csv uses
+# LOAD DATA LOCAL INFILE (needs local_infile=ON on the server) and foreign key and unique checks
+# are turned off while loading. The employee search index and the rollups are rebuilt at the end.
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from database import database_url, build_engine, Session
+from tables import *
+from schema import bootstrap
+from search import rebuild_search_index
+from vacation_ledger import accrue_balances
+from current_contracts import reconcile
+from rollups import rebuild
+from table_versions import bump
+
+BATCH_SIZE = 2000
 
 # Insert data into Company table
 company_data = [
@@ -217,10 +52,6 @@ company_data = [
     {'id': 17, 'rut': '95.901.234-5', 'name': 'Blizzard Entertainment', 'address': '1 Blizzard Way, Irvine', 'phone': '555-1900', 'industry': 'Gaming'}
 ]
 
-for data in company_data:
-    company = Company(**data)
-    session.add(company)
-session.commit()
 
 # Insert data into AFP table
 afp_data = [
@@ -233,10 +64,6 @@ afp_data = [
     {'id': 7, 'name': 'AFP Uno', 'commission_percentage': 0.49}
 ]
 
-for data in afp_data:
-    afp = AFP(**data)
-    session.add(afp)
-session.commit()
 
 # Insert data into HealthPlan, Fonasa, and Isapre tables
 health_plan_data = [
@@ -256,10 +83,6 @@ health_plan_data = [
     {'id': 14, 'name': 'Esencial S.A.', 'type': 'Isapre'}
 ]
 
-for data in health_plan_data:
-    health_plan = HealthPlan(**data)
-    session.add(health_plan)
-session.commit()
 
 # Insert data into Fonasa table
 fonasa_data = [
@@ -269,10 +92,6 @@ fonasa_data = [
     {'id': 4, 'health_plan_id': 4, 'discount': 7.00},
 ]
 
-for data in fonasa_data:
-    fonasa = Fonasa(**data)
-    session.add(fonasa)
-session.commit()
 
 # Insert data into Isapre table
 isapre_data = [
@@ -288,10 +107,6 @@ isapre_data = [
     {'id': 10, 'health_plan_id': 14, 'discount': 16.00}
 ]
 
-for data in isapre_data:
-    isapre = Isapre(**data)
-    session.add(isapre)
-session.commit()
 
 # Insert data into Employee table
 employee_data = [
@@ -314,11 +129,6 @@ employee_data = [
  ]
 
 
-for data in employee_data:
-    employee = Employee(**data)
-    session.add(employee)
-session.commit()
-
 # Insert data into Department table
 department_data = [
     {'id': 1, 'name': 'Development', 'description': 'Responsible for all technical aspects of game creation, including programming and software development.'},
@@ -329,10 +139,6 @@ department_data = [
     {'id': 6, 'name': 'Operations', 'description': 'Manages game servers, backend infrastructure, and the deployment of online multiplayer features.'}
 ]
 
-for data in department_data:
-    department = Department(**data)
-    session.add(department)
-session.commit()
 
 # Insert data into JobPosition table
 job_position_data = [
@@ -361,11 +167,6 @@ job_position_data = [
 ]
 
 
-for data in job_position_data:
-    job_position = JobPosition(**data)
-    session.add(job_position)
-session.commit()
-
 employee_position_data = [
     {'employee_id': 1, 'position_id': 7},  # John -> Game Developer
     {'employee_id': 2, 'position_id': 6},  # Mary -> Talent Acquisition Manager
@@ -385,15 +186,6 @@ employee_position_data = [
     {'employee_id': 16, 'position_id': 15},  # Maya -> Community Manager
 ]
 
-for data in employee_position_data:
-    emp_pos = EmployeePosition(**data)
-    session.add(emp_pos)
-session.commit()
-
-
-
-
-
 
 # Insert data into Contract table
 contract_data = [
@@ -415,11 +207,6 @@ contract_data = [
     {'id': 16, 'employee_id': 16, 'contract_type': 'Fixed', 'start_date': date(2023, 3, 5), 'end_date': date(2026, 3, 5), 'classification': 'Technical', 'registration_date': date(2023, 3, 5)}
 ]
 
-for data in contract_data:
-    contract = Contract(**data)
-    session.add(contract)
-session.commit()
-
 
 # Insert data into Vacation table
 vacation_data = [
@@ -430,10 +217,6 @@ vacation_data = [
     {'id': 5, 'employee_id': 5, 'start_date': date(2023, 2, 10), 'end_date': date(2023, 2, 25), 'days_taken': 15, 'accumulated_days': 8, 'long_service_employee': False}
 ]
 
-for data in vacation_data:
-    vacation = Vacation(**data)
-    session.add(vacation)
-session.commit()
 
 # Insert data into Evaluation table
 evaluation_data = [
@@ -444,10 +227,6 @@ evaluation_data = [
     {'id': 5, 'employee_id': 5, 'evaluation_date': date(2023, 1, 20), 'evaluator': 'Supervisor B', 'evaluation_factor': 4.9, 'rating': 'Fair', 'comments': 'Could improve punctuality.'}
 ]
 
-for data in evaluation_data:
-    evaluation = Evaluation(**data)
-    session.add(evaluation)
-session.commit()
 
 # Insert data into Training table
 training_data = [
@@ -458,10 +237,6 @@ training_data = [
     {'id': 5, 'employee_id': 5, 'training_date': date(2023, 1, 10), 'course': 'Scrum Master', 'score': 4.9, 'institution': 'Scrum Training', 'comments': 'Needs to improve leadership.'}
 ]
 
-for data in training_data:
-    training = Training(**data)
-    session.add(training)
-session.commit()
 
 # Insert data into Remuneration table
 remuneration_data = [
@@ -483,10 +258,210 @@ remuneration_data = [
     {'id': 16, 'employee_id': 16, 'afp_id': 4, 'health_plan_id': 13, 'gross_amount': 3400.00, 'tax': 13.0, 'deductions': 220.00, 'bonus': 310.00, 'welfare_contribution': 75.00, 'net_amount': 3180.00}
 ]
 
-for data in remuneration_data:
-    remuneration = Remuneration(**data)
-    session.add(remuneration)
-session.commit()
 
-# Close the session
-session.close()
+# Tables of the demo data, in foreign key order
+SEED_DATA = [
+    (Company, company_data),
+    (AFP, afp_data),
+    (HealthPlan, health_plan_data),
+    (Fonasa, fonasa_data),
+    (Isapre, isapre_data),
+    (Employee, employee_data),
+    (Department, department_data),
+    (JobPosition, job_position_data),
+    (EmployeePosition, employee_position_data),
+    (Contract, contract_data),
+    (Vacation, vacation_data),
+    (Evaluation, evaluation_data),
+    (Training, training_data),
+    (Remuneration, remuneration_data),
+]
+
+# Tables filled from other tables, never loaded directly
+DERIVED_TABLES = {'EmployeeSearchToken', 'SchemaVersion'}
+
+
+def loadable_tables():
+    """Every table of tables.py that holds data, parents before children."""
+    return [table for table in Base.metadata.sorted_tables if table.name not in DERIVED_TABLES]
+
+
+def complete_rows(table, rows):
+    """Give every row the same columns (a batched INSERT needs them), using the column defaults."""
+    columns = [column for column in table.columns if any(column.name in row for row in rows)]
+    completed = []
+    for row in rows:
+        full = dict(row)
+        for column in columns:
+            if column.name not in full:
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                full[column.name] = default
+        completed.append(full)
+    return completed
+
+
+def insert_batches(connection, table, rows, batch_size):
+    """
+    Insert rows in batches of batch_size, each sent as one executemany (PyMySQL turns it into a
+    multi-row INSERT ... VALUES; a compiled multi-row statement costs more to build than to run).
+    Returns the number of rows.
+    """
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            connection.execute(insert(table), complete_rows(table, batch))
+            count += len(batch)
+            batch = []
+    if batch:
+        connection.execute(insert(table), complete_rows(table, batch))
+        count += len(batch)
+    return count
+
+
+def csv_value(value):
+    """How a value is written to the CSV files: NULL as an empty field, booleans as 1/0."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def typed_value(column, value):
+    """Read a CSV field back into the column's Python type (an empty field is NULL)."""
+    if value == '':
+        return None
+    python_type = column.type.python_type
+    if python_type is bool:
+        return value not in ('0', 'false', 'False')
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is Decimal:
+        return Decimal(value)
+    return python_type(value)
+
+
+def read_csv(table, path):
+    """Yield the rows of a CSV file (with a header of column names) as typed dicts."""
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield {name: typed_value(table.columns[name], value) for name, value in row.items()}
+
+
+def load_data_infile(connection, table, path):
+    """Load a CSV file with MySQL's LOAD DATA LOCAL INFILE. Returns the number of rows."""
+    with open(path, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f))
+    # Every field goes through a variable so empty fields become NULL
+    variables = ', '.join(f'@v{i}' for i in range(len(header)))
+    assignments = ', '.join(f"`{name}` = NULLIF(@v{i}, '')" for i, name in enumerate(header))
+    result = connection.exec_driver_sql(
+        f"LOAD DATA LOCAL INFILE %s INTO TABLE `{table.name}` CHARACTER SET utf8mb4 "
+        f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' LINES TERMINATED BY '\\n' "
+        f"IGNORE 1 LINES ({variables}) SET {assignments}",
+        (os.path.abspath(path),),
+    )
+    return result.rowcount
+
+
+def set_constraint_checks(connection, enabled):
+    """Turn MySQL's foreign key and unique checks on or off for this connection (they last until it closes)."""
+    if connection.dialect.name == 'mysql':
+        value = 1 if enabled else 0
+        connection.exec_driver_sql(f"SET FOREIGN_KEY_CHECKS = {value}, UNIQUE_CHECKS = {value}")
+        # The SET autobegins a transaction: end it, so the loads can begin their own
+        connection.commit()
+
+
+def empty_tables(connection, tables):
+    """Delete every row of the tables, children first."""
+    for table in reversed(tables):
+        with connection.begin():
+            if connection.dialect.name == 'mysql':
+                connection.exec_driver_sql(f"TRUNCATE TABLE `{table.name}`")
+            else:
+                connection.execute(table.delete())
+    print(f"Emptied {len(tables)} tables")
+
+
+def write_table_csv(path, table, rows):
+    """Write the rows of a table as a CSV file in the format load() reads."""
+    rows = complete_rows(table, rows)
+    columns = [column.name for column in table.columns if column.name in rows[0]]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(columns)
+        writer.writerows([csv_value(row[column]) for column in columns] for row in rows)
+
+
+def write_csv(directory):
+    """Write the demo data as one CSV file per table."""
+    os.makedirs(directory, exist_ok=True)
+    for model, rows in SEED_DATA:
+        path = os.path.join(directory, f'{model.__tablename__}.csv')
+        write_table_csv(path, model.__table__, rows)
+        print(f"Wrote {len(rows)} rows to {path}")
+
+
+def load(csv_directory=None, replace=False, batch_size=BATCH_SIZE):
+    """Load the demo data (or the CSV files of csv_directory), then rebuild the tables derived from it."""
+    bootstrap()
+    engine = build_engine(database_url, connect_args={'local_infile': True} if database_url.startswith('mysql') else None)
+    tables = loadable_tables()
+    with engine.connect() as connection:
+        set_constraint_checks(connection, False)
+        try:
+            if replace:
+                empty_tables(connection, tables)
+            if csv_directory:
+                sources = [
+                    (table, os.path.join(csv_directory, f'{table.name}.csv')) for table in tables
+                    if os.path.exists(os.path.join(csv_directory, f'{table.name}.csv'))
+                ]
+            else:
+                sources = [(model.__table__, rows) for model, rows in SEED_DATA]
+            for table, source in sources:
+                # One transaction per table keeps the transaction size bounded on big loads
+                with connection.begin():
+                    if not csv_directory:
+                        count = insert_batches(connection, table, source, batch_size)
+                    elif connection.dialect.name == 'mysql':
+                        count = load_data_infile(connection, table, source)
+                    else:
+                        count = insert_batches(connection, table, read_csv(table, source), batch_size)
+                print(f"Loaded {count} rows into {table.name}")
+        finally:
+            if connection.in_transaction():  # Left open by a failure outside the begin() blocks
+                connection.rollback()
+            set_constraint_checks(connection, True)
+    engine.dispose()
+
+    with Session() as session:
+        print(f"Indexed {rebuild_search_index(session)} employees for search")
+        print(f"Opened {accrue_balances(session)['opened']} vacation balances")
+        print(f"Pointed {reconcile(session)['added']} employees at their current contract")
+        rebuild(session)
+        print("Computed the department and position rollups")
+        # Pages cached by the browsers (ETags) must be served again
+        bump(session, *[table.name for table in loadable_tables()])
+        session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load seed data into the HR database.')
+    parser.add_argument('--csv', metavar='DIR', help='Load DIR/<Table>.csv files instead of the demo data')
+    parser.add_argument('--write-csv', metavar='DIR', help='Write the demo data as CSV files and exit')
+    parser.add_argument('--replace', action='store_true', help='Empty the tables before loading')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per INSERT statement')
+    args = parser.parse_args()
+
+    if args.write_csv:
+        write_csv(args.write_csv)
+    else:
+        load(args.csv, args.replace, args.batch_size)